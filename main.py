@@ -1,14 +1,14 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from dotenv import load_dotenv
+from utils.env_utils import load_env
 from notion_client import Client
 import logging
 from routers import vector_router, waha_router, chatery_router
 from security import Secured
 
 # Load environment variables
-load_dotenv()
+load_env()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -2,29 +2,41 @@
 Chatery webhook router for handling incoming WhatsApp messages.
 """
 from fastapi import APIRouter, Request, HTTPException
-from dotenv import load_dotenv
+from utils.env_utils import load_env
 from security import Secured
-from services.rag_service import RAGService
-from services.chatery_service import ChateryService
-from services.vector_service import VectorService
+from services.rag_service import get_rag_service
+from services.chatery_service import get_chatery_service
+from services.vector_service import get_vector_service
+from contextlib import asynccontextmanager
 import logging
 import os
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
-# Router without global security dependency - security is applied per-endpoint
-router = APIRouter(prefix="/chatery", tags=["Chatery"])
-
 # Whitelist of allowed phone numbers (in international format without '+')
-WHITELISTED_NUMBERS = set(os.getenv("WHITELISTED_NUMBERS", "").split(","))
+# Blank entries are dropped so an unset variable doesn't whitelist an empty sender
+WHITELISTED_NUMBERS = frozenset(
+    number.strip() for number in os.getenv("WHITELISTED_NUMBERS", "").split(",") if number.strip()
+)
 
 # Chatery configuration
 CHATERY_WEBHOOK_SECRET = os.getenv("CHATERY_WEBHOOK_SECRET", "")
 
-rag_service = RAGService()
-chatery_service = ChateryService()
-vectorService = VectorService()
+rag_service = get_rag_service()
+chatery_service = get_chatery_service()
+vectorService = get_vector_service()
+
+@asynccontextmanager
+async def lifespan(app):
+    """Handle startup and shutdown events"""
+    yield  # This is where FastAPI serves requests
+
+    # Shutdown: Release pooled Chatery connections
+    await chatery_service.aclose()
+
+# Router without global security dependency - security is applied per-endpoint
+router = APIRouter(prefix="/chatery", tags=["Chatery"], lifespan=lifespan)
 
 
 @router.get("/webhook")
@@ -75,6 +87,10 @@ async def receive_whatsapp_message(request: Request):
                     logger.warning("Invalid webhook signature")
                     raise HTTPException(status_code=401, detail="Invalid signature")
 
+        # Nobody can be answered without a whitelist, so skip parsing entirely
+        if not WHITELISTED_NUMBERS:
+            return {"status": "ok"}
+
         # Extract message data from Chatery payload
         # Chatery/Meta format: entry[0].changes[0].value.messages[0]
         entry = payload.get("entry", [])
@@ -2,34 +2,40 @@
 Vector database and RAG endpoints
 """
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from pydantic import BaseModel
 import logging
 import os
 import asyncio
-from vector_db import VectorDB
-from services.rag_service import RAGService
-from services.vector_service import VectorService
-from dotenv import load_dotenv
+from vector_db import VectorDB, get_vector_db
+from services.rag_service import RAGService, get_rag_service
+from services.vector_service import VectorService, get_vector_service
+from utils.env_utils import load_env
 from contextlib import asynccontextmanager
 from security import Secured
 from notion_client import AsyncClient
-from utils.notion_utils import NotionUtils
+from utils.notion_utils import NotionUtils, call_with_retry, create_notion_client
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
+def parse_db_ids(raw: Optional[str]) -> list:
+    """Split a comma-separated NOTION_DATABASE_IDS value into a list of IDs"""
+    return raw.split(",") if raw else []
+
 # Initialize services
-vector_db = VectorDB()
-rag_service = RAGService()
-vector_service = VectorService()
+vector_db = get_vector_db()
+rag_service = get_rag_service()
+vector_service = get_vector_service()
 
 # Initialize Notion client and utils for direct access (used by tests)
 notion_api_key = os.getenv("NOTION_API_KEY")
-notion_database_ids = os.getenv("NOTION_DATABASE_IDS", "").split(",") if os.getenv("NOTION_DATABASE_IDS") else []
+notion_database_ids = parse_db_ids(os.getenv("NOTION_DATABASE_IDS"))
+notion_concurrency = int(os.getenv("NOTION_CONCURRENCY", "5"))
 
 if notion_api_key:
-    notion = AsyncClient(auth=notion_api_key)
+    notion = create_notion_client(notion_api_key)
     notion_utils = NotionUtils(notion)
 else:
     notion = None
@@ -52,17 +58,37 @@ router = APIRouter(prefix="/vector", tags=["vector"], lifespan=lifespan)
 class SyncRequest(BaseModel):
     force_update: bool = True
     page_limit: Optional[int] = 100
+    # Databases to sync in this request; defaults to NOTION_DATABASE_IDS
+    database_ids: Optional[List[str]] = None
 
-def get_vector_db():
-    return vector_db
+# Response models let FastAPI serialize straight to JSON bytes through Pydantic.
+# Routes set response_model_exclude_unset so keys the handler omits stay omitted.
+class StatsResponse(BaseModel):
+    total_chunks: Optional[int] = None
+    unique_pages: Optional[int] = None
+    unique_databases: Optional[int] = None
+    storage_size_bytes: Optional[int] = None
+    embedding_model: Optional[str] = None
+    embedding_dimension: Optional[int] = None
 
-def get_rag_service():
-    return rag_service
+class HealthResponse(BaseModel):
+    status: str
+    vector_db: str
+    embedding_model: Optional[str] = None
+    embedding_dimension: int
+    google_ai_model: Optional[str] = None
+    total_chunks: int
+    unique_pages: int
 
-def get_vector_service():
-    return vector_service
+class ChatResponse(BaseModel):
+    question: str
+    answer: str
+    context_used: bool
+    sources_count: int
+    model: Optional[str] = None
+    source_urls: Optional[List[str]] = None
 
-@router.get("/stats", dependencies=[Secured])
+@router.get("/stats", dependencies=[Secured], response_model=StatsResponse, response_model_exclude_unset=True)
 async def get_vector_db_stats(db: VectorDB = Depends(get_vector_db)):
     """Get vector database statistics"""
     try:
@@ -79,9 +105,15 @@ async def sync_database(
     vector: VectorService = Depends(get_vector_service)
 ):
     """Sync entire Notion database to vector database"""
+    # Only databases configured in NOTION_DATABASE_IDS may be synced
+    unknown_ids = [database_id for database_id in request.database_ids or [] if database_id not in notion_database_ids]
+    if unknown_ids:
+        raise HTTPException(status_code=400, detail=f"Unknown database IDs: {', '.join(unknown_ids)}")
+    
     try:
-        # Add background tasks for each database
-        for database_id in notion_database_ids:
+        # Add background tasks for each requested database (all configured ones by default)
+        database_ids = request.database_ids or notion_database_ids
+        for database_id in database_ids:
             background_tasks.add_task(
                 _sync_database_background,
                 database_id=database_id,
@@ -129,7 +161,7 @@ async def _sync_database_background(
             if next_cursor:
                 query_params["start_cursor"] = next_cursor
             
-            response = await client.databases.query(**query_params)
+            response = await call_with_retry(client.databases.query, **query_params)
             pages = response.get("results", [])
             all_pages.extend(pages)
             
@@ -151,48 +183,69 @@ async def _sync_database_background(
             "total_chunks": 0
         }
         
-        for page in all_pages:
-            try:
-                # Fetch page blocks
-                blocks_response = await client.blocks.children.list(
-                    block_id=page["id"],
-                    page_size=100
-                )
-                blocks = blocks_response.get("results", [])
-                
-                # Extract content from blocks
-                page_content = []
-                for block in blocks:
-                    extracted = notion_utils_instance.extract_block_content(block)
-                    page_content.append(extracted)
-                
-                # Build page data
-                page_data = {
-                    "id": page["id"],
-                    "properties": page.get("properties", {}),
-                    "blocks": page_content,
-                    "url": page.get("url", "")
-                }
-                
-                # Add database_id to page_data for storage
-                page_data["database_id"] = database_id
-                
-                result = await db.store_notion_page(
-                    page_id=page["id"],
-                    page_data=page_data,
-                    database_id=database_id,
-                    force_update=force_update
-                )
-                
-                if result["status"] == "success":
-                    sync_results["success"] += 1
-                    sync_results["total_chunks"] += result["chunks_stored"]
-                elif result["status"] == "skipped":
-                    sync_results["skipped"] += 1
+        # Skip pages whose last_edited_time matches what is already stored,
+        # without fetching their blocks from Notion
+        if not force_update and all_pages:
+            stored_edit_times = await db.get_last_edited_times([page["id"] for page in all_pages])
+            changed_pages = [
+                page for page in all_pages
+                if page["id"] not in stored_edit_times
+                or stored_edit_times[page["id"]] != page.get("last_edited_time")
+            ]
+            sync_results["skipped"] += len(all_pages) - len(changed_pages)
+            all_pages = changed_pages
+        
+        semaphore = asyncio.Semaphore(notion_concurrency)
+        
+        async def _sync_page(page):
+            async with semaphore:
+                try:
+                    # Fetch page blocks
+                    blocks_response = await call_with_retry(
+                        client.blocks.children.list,
+                        block_id=page["id"],
+                        page_size=100
+                    )
+                    blocks = blocks_response.get("results", [])
+                    
+                    # Extract content from blocks
+                    page_content = []
+                    for block in blocks:
+                        extracted = notion_utils_instance.extract_block_content(block)
+                        page_content.append(extracted)
                     
-            except Exception as e:
-                logger.error(f"Error syncing page {page['id']}: {str(e)}")
-                sync_results["errors"] += 1
+                    # Build page data
+                    page_data = {
+                        "id": page["id"],
+                        "properties": page.get("properties", {}),
+                        "blocks": page_content,
+                        "url": page.get("url", ""),
+                        "created_time": page.get("created_time"),
+                        "last_edited_time": page.get("last_edited_time")
+                    }
+                    
+                    # Add database_id to page_data for storage
+                    page_data["database_id"] = database_id
+                    
+                    result = await db.store_notion_page(
+                        page_id=page["id"],
+                        page_data=page_data,
+                        database_id=database_id,
+                        force_update=force_update
+                    )
+                    
+                    if result["status"] == "success":
+                        sync_results["success"] += 1
+                        sync_results["total_chunks"] += result["chunks_stored"]
+                    elif result["status"] == "skipped":
+                        sync_results["skipped"] += 1
+                        
+                except Exception as e:
+                    logger.error(f"Error syncing page {page['id']}: {str(e)}")
+                    sync_results["errors"] += 1
+        
+        # Fetch and store pages concurrently, bounded to stay within Notion rate limits
+        await asyncio.gather(*[_sync_page(page) for page in all_pages])
         
         logger.info(f"Database sync completed: {sync_results}")
         
@@ -200,7 +253,7 @@ async def _sync_database_background(
         logger.error(f"Error in background database sync: {str(e)}")
 
 
-@router.get("/health", dependencies=[Secured])
+@router.get("/health", dependencies=[Secured], response_model=HealthResponse)
 async def vector_health_check(
     db: VectorDB = Depends(get_vector_db),
     rag: RAGService = Depends(get_rag_service)
@@ -210,8 +263,8 @@ async def vector_health_check(
         # Test vector database connection
         stats = await db.get_stats()
         
-        # Test embedding generation
-        test_embedding = db.generate_embedding("test")
+        # Test embedding generation (cached after the first successful probe)
+        test_embedding = await db.probe_embedding()
         
         return {
             "status": "healthy",
@@ -228,12 +281,16 @@ async def vector_health_check(
         raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
 
 # Chat-like interface
-@router.post("/chat", dependencies=[Secured])
+@router.post("/chat", dependencies=[Secured], response_model=ChatResponse, response_model_exclude_unset=True)
 async def chat_with_knowledge_base(
     question: str = Query(..., description="Your question"),
+    stream: bool = Query(False, description="Stream the answer text as it is generated"),
     rag: RAGService = Depends(get_rag_service)
 ):
     """Simple chat interface for asking questions"""
+    if stream:
+        return StreamingResponse(rag.stream_answer(question), media_type="text/plain")
+    
     try:
         answer = await rag.answer_question(
             question=question
@@ -2,29 +2,52 @@
 WAHA webhook router for handling incoming WhatsApp messages.
 """
 from fastapi import APIRouter
-from dotenv import load_dotenv
+from pydantic import BaseModel
+from utils.env_utils import load_env
 from security import Secured
-from services.rag_service import RAGService
-from services.waha_service import WahaService
-from services.vector_service import VectorService
-import logging, os
+from services.rag_service import get_rag_service
+from services.waha_service import get_waha_service
+from services.vector_service import get_vector_service
+from contextlib import asynccontextmanager
+import asyncio, logging, os
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/waha", tags=["WAHA"], dependencies=[Secured])
-
 # Whitelist of allowed phone numbers (in international format without '+')
-WHITELISTED_NUMBERS = set(os.getenv("WHITELISTED_NUMBERS", "").split(","))
+# Blank entries are dropped so an unset variable doesn't whitelist an empty sender
+WHITELISTED_NUMBERS = frozenset(
+    number.strip() for number in os.getenv("WHITELISTED_NUMBERS", "").split(",") if number.strip()
+)
 
 WAHA_API_URL = os.getenv("WAHA_API_URL", "")
 SESSION_NAME = os.getenv("WAHA_SESSION_NAME", "")
 
-rag_service = RAGService()
-waha_service = WahaService()
-vectorService = VectorService()
+# Bound concurrent message processing so a burst doesn't exhaust the Gemini quota
+REPLY_CONCURRENCY = int(os.getenv("WAHA_REPLY_CONCURRENCY", "32"))
+reply_semaphore = asyncio.Semaphore(REPLY_CONCURRENCY)
+
+# Keep references to in-flight reply tasks so they aren't garbage collected
+background_tasks = set()
+
+rag_service = get_rag_service()
+waha_service = get_waha_service()
+vectorService = get_vector_service()
+
+@asynccontextmanager
+async def lifespan(app):
+    """Handle startup and shutdown events"""
+    yield  # This is where FastAPI serves requests
+    
+    # Shutdown: Release pooled WAHA connections
+    await waha_service.aclose()
 
-@router.post("/webhook")
+router = APIRouter(prefix="/waha", tags=["WAHA"], dependencies=[Secured], lifespan=lifespan)
+
+class WebhookAck(BaseModel):
+    status: str
+
+@router.post("/webhook", response_model=WebhookAck)
 async def receive_whatsapp_message(payload: dict):
     """
     Receives incoming WhatsApp messages from WAHA.
@@ -33,37 +56,52 @@ async def receive_whatsapp_message(payload: dict):
         # Extract the relevant information from the WAHA payload
         # The exact structure may vary based on your WAHA version and configuration
         event_type = payload.get("event")
-        if event_type == "message":
-            message_payload = payload.get("payload", {})
-            sender_number_full = message_payload.get("from")
-            message_body = message_payload.get("body")
-
-            if sender_number_full and message_body:
-                # Extract the phone number without the '@c.us' suffix
-                sender_number = sender_number_full.split('@')[0]
-
-                # Check if the sender is in the whitelist
-                if sender_number in WHITELISTED_NUMBERS:
-                    # Process the message
-                    type_identification = await rag_service.identify_message(message_body)
-
-                    logger.info(f"Message from {sender_number_full}: {message_body}")
-                    logger.info(f"Identified message type: {type_identification}")
-
-                    if type_identification == "SYNC":
-                        await waha_service.send_whatsapp_reply(sender_number_full, "Sync command received. Starting synchronization...")
-                        vectorService.start_sync_databases(force_update=True, page_limit=100)
-                        await waha_service.send_whatsapp_reply(sender_number_full, "Synchronization started in the background.")
-                    elif type_identification == "QUERY":
-                        answer = await rag_service.answer_question(message_body)
-                        response_text = answer.get("answer", "I couldn't find relevant information to answer your question.")
-                        await waha_service.send_whatsapp_reply(sender_number_full, response_text)
-                    else:
-                        await waha_service.send_whatsapp_reply(sender_number_full, "I'm sorry, I couldn't identify the intention of your message.")
-                else:
-                    logger.warning(f"Unauthorized access attempt from {sender_number_full}")
+        if event_type != "message" or not WHITELISTED_NUMBERS:
+            return {"status": "ok"}
+        
+        message_payload = payload.get("payload", {})
+        sender_number_full = message_payload.get("from")
+        message_body = message_payload.get("body")
+
+        if sender_number_full and message_body:
+            # Extract the phone number without the '@c.us' suffix
+            sender_number = sender_number_full.partition('@')[0]
+
+            # Check if the sender is in the whitelist
+            if sender_number in WHITELISTED_NUMBERS:
+                # Reply in the background so the webhook returns immediately
+                task = asyncio.create_task(_process_and_reply(sender_number_full, message_body))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+            else:
+                logger.warning(f"Unauthorized access attempt from {sender_number_full}")
 
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
 
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+async def _process_and_reply(sender_number_full: str, message_body: str):
+    """
+    Identifies the message intention and sends the reply through WAHA.
+    """
+    async with reply_semaphore:
+        try:
+            type_identification = await rag_service.identify_message(message_body)
+
+            logger.info(f"Message from {sender_number_full}: {message_body}")
+            logger.info(f"Identified message type: {type_identification}")
+
+            if type_identification == "SYNC":
+                await waha_service.send_whatsapp_reply(sender_number_full, "Sync command received. Starting synchronization...")
+                vectorService.start_sync_databases(force_update=True, page_limit=100)
+                await waha_service.send_whatsapp_reply(sender_number_full, "Synchronization started in the background.")
+            elif type_identification == "QUERY":
+                answer = await rag_service.answer_question(message_body)
+                response_text = answer.get("answer", "I couldn't find relevant information to answer your question.")
+                await waha_service.send_whatsapp_reply(sender_number_full, response_text)
+            else:
+                await waha_service.send_whatsapp_reply(sender_number_full, "I'm sorry, I couldn't identify the intention of your message.")
+        except Exception as e:
+            logger.error(f"Error replying to {sender_number_full}: {str(e)}")
@@ -1,10 +1,10 @@
 from fastapi import Security, HTTPException, status, Depends
 from fastapi.security import APIKeyHeader
 import os
-from dotenv import load_dotenv
+from utils.env_utils import load_env
 
 # Load environment variables
-load_dotenv()
+load_env()
 
 API_SECRET_KEY = os.getenv("API_SECRET_KEY")
 if not API_SECRET_KEY:
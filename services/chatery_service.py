@@ -3,10 +3,11 @@ Chatery service for handling WhatsApp messages and interactions with Chatery Clo
 """
 import logging
 import os
-import requests
-from dotenv import load_dotenv
+import httpx
+from functools import lru_cache
+from utils.env_utils import load_env
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
 
@@ -25,6 +26,16 @@ class ChateryService:
                 "CHATERY_API_URL, CHATERY_API_KEY, and CHATERY_PHONE_NUMBER_ID environment variables are required"
             )
 
+        # Pooled client so replies reuse keep-alive connections and don't block the event loop
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            timeout=httpx.Timeout(10.0, connect=2.0),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+
         logger.info(
             f"ChateryService initialized with API URL: {self.api_url} and phone number ID: {self.phone_number_id}"
         )
@@ -75,18 +86,24 @@ class ChateryService:
                 "body": message
             }
         }
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
 
         try:
-            response = requests.post(send_url, json=payload, headers=headers)
+            response = await self._client.post(send_url, json=payload)
             response.raise_for_status()
             logger.info(f"Successfully sent reply to {recipient}")
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             logger.error(f"Error sending message to {recipient}: {e.response.text}")
-        except requests.exceptions.RequestException as e:
+        except httpx.RequestError as e:
             logger.error(f"An error occurred while requesting {e.request.url!r}: {e}")
         except Exception as e:
             logger.error(f"Unexpected error while sending message to {recipient}: {str(e)}")
+
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self._client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_chatery_service() -> ChateryService:
+    """Return the shared Chatery service instance"""
+    return ChateryService()
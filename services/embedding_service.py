@@ -0,0 +1,46 @@
+"""
+Client for a remote embedding server (Infinity, TEI or any OpenAI-compatible /embeddings API)
+"""
+import logging
+import httpx
+import numpy as np
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+class AsyncEmbeddingClient:
+    """Async client for an OpenAI-compatible embeddings endpoint"""
+    
+    def __init__(self, base_url: str, model: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        # Pooled client so concurrent requests share keep-alive connections
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=2.0)
+        )
+        
+        logger.info(f"AsyncEmbeddingClient initialized with URL: {self.base_url} and model: {self.model}")
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts remotely and return L2-normalized vectors in input order"""
+        if not texts:
+            return []
+        
+        response = await self._client.post(
+            "/embeddings",
+            json={"input": texts, "model": self.model}
+        )
+        response.raise_for_status()
+        
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        embeddings = np.asarray([item["embedding"] for item in data], dtype=np.float32)
+        
+        # Normalize like the local model does with normalize_embeddings=True
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (embeddings / norms).tolist()
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self._client.aclose()
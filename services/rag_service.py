@@ -2,16 +2,29 @@
 RAG (Retrieval-Augmented Generation) service using Google AI Studio
 """
 import os
+import re
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Any
+from functools import lru_cache, partial
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+import numpy as np
 import google.generativeai as genai
-from dotenv import load_dotenv
-from vector_db import VectorDB
+from utils.env_utils import load_env
+from vector_db import get_vector_db
 from utils.prompt_utils import PromptUtils
+from utils.cache_utils import SemanticAnswerCache
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
+# Messages that are unambiguously a sync command and don't need the model to classify
+SYNC_COMMAND_PATTERN = re.compile(r"^\s*(sync|synchron\w+|resync|update\s+kb)\s*[.!]?\s*$", re.IGNORECASE)
+
+# Number of classified messages remembered by identify_message
+INTENT_CACHE_SIZE = 4096
+
 class RAGService:
     """RAG service for question answering using vector search and Google AI"""
     
@@ -28,11 +41,50 @@ class RAGService:
         self.model = genai.GenerativeModel(self.model_name)
         
         # Initialize vector database
-        self.vector_db = VectorDB()
+        self.vector_db = get_vector_db()
         
         # Configuration
         self.max_context_chunks = int(os.getenv("MAX_CONTEXT_CHUNKS", "5"))
         self.min_similarity_score = float(os.getenv("MIN_SIMILARITY_SCORE", "0.7"))
+        # Bound prompt and answer size, which drive Gemini latency and cost
+        self.max_context_chars = int(os.getenv("MAX_CONTEXT_CHARS", "6000"))
+        # Gemini 2.5 counts thinking tokens against this budget, so it must leave room for both
+        self.answer_max_tokens = int(os.getenv("ANSWER_MAX_TOKENS", "2048"))
+        
+        # Generation configs are built once instead of on every request
+        self._answer_config = genai.types.GenerationConfig(
+            temperature=0.2,
+            max_output_tokens=self.answer_max_tokens,
+            top_p=0.8,
+            top_k=40
+        )
+        self._classify_config = genai.types.GenerationConfig(
+            temperature=0.0,
+            max_output_tokens=1000
+        )
+        
+        # Cache answers for repeated or near-duplicate questions
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512")),
+            ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+        )
+        # Knowledge base version the cached answers were built from; a sync bumps it
+        self._cache_version = self.vector_db.content_version
+        
+        # Recently classified messages, in least-recently-used order
+        self._intent_cache: "OrderedDict[str, str]" = OrderedDict()
+        
+        # Questions currently being answered, so identical concurrent questions share one answer
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+        # Near-duplicate questions arriving while a search runs can share one vector search.
+        # Off by default; an idle service always searches at once.
+        self.query_group_window = float(os.getenv("QUERY_GROUP_WINDOW_MS", "0")) / 1000
+        self.query_group_threshold = float(os.getenv("QUERY_GROUP_THRESHOLD", "0.98"))
+        self._pending_searches: Optional[List[Tuple[str, List[float], asyncio.Future]]] = None
+        self._flush_tasks: set = set()
+        self._searches_running = 0
         
         logger.info(f"RAG service initialized with model: {self.model_name}")
 
@@ -41,112 +93,365 @@ class RAGService:
         message: str,
     ) -> str:
         """Identify the type of message"""
+        normalized = " ".join(message.lower().split())
+        
+        cached_intent = self._intent_cache.get(normalized)
+        if cached_intent is not None:
+            self._intent_cache.move_to_end(normalized)
+            return cached_intent
+        
+        if SYNC_COMMAND_PATTERN.match(normalized):
+            return "SYNC"
+        
         prompt = PromptUtils.build_identify_prompt(message)
 
         response = await self.model.generate_content_async(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=1000,
-                    top_p=0.8,
-                    top_k=40
-                )
+                generation_config=self._classify_config
             )
-            
-        return response.text.strip()
+        
+        intent = response.text.strip()
+        self._intent_cache[normalized] = intent
+        if len(self._intent_cache) > INTENT_CACHE_SIZE:
+            self._intent_cache.popitem(last=False)
+        
+        return intent
     
     async def answer_question(
         self,
         question: str,
+    ) -> Dict[str, Any]:
+        """Answer a question using RAG, coalescing identical in-flight questions"""
+        key = hashlib.sha256(question.strip().lower().encode()).hexdigest()
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            logger.info("Waiting for identical in-flight question")
+            # Shield so a cancelled follower doesn't cancel the shared answer
+            return dict(await asyncio.shield(inflight))
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._answer_question(question)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no follower is waiting
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+    
+    async def _answer_question(
+        self,
+        question: str,
     ) -> Dict[str, Any]:
         """Answer a question using RAG"""
         try:
-            # Retrieve relevant context from vector database
-            search_results = await self.vector_db.vector_search(
-                query=question,
-                limit=self.max_context_chunks,
-                min_score=self.min_similarity_score
-            )
+            # Serve repeated or near-duplicate questions from the cache
+            question_embedding = await self._embed_question(question)
+            cache_version = self.vector_db.content_version
+            cached_answer = self._cached_answer(question_embedding, cache_version)
+            if cached_answer is not None:
+                logger.info("Answer served from semantic cache")
+                return cached_answer
             
-            if not search_results:
-                return {
-                    "answer": "I couldn't find relevant information in your knowledge base to answer this question.",
-                    "sources": [],
-                    "context_used": False,
-                    "search_results_count": 0
-                }
+            search_results, context, sources = await self._retrieve_context(question, question_embedding)
             
-            print(f"Found {len(search_results)} relevant chunks for the question.")
-            print("Search results:", search_results)
+            if not search_results:
+                return self._no_context_result()
             
-            # Build context from search results
-            context_parts = []
-            sources = []
+            # Generate answer using Google AI
+            try:
+                answer = await self._generate_answer(question, context)
+                generated = True
+            except Exception as e:
+                logger.error(f"Error generating answer: {str(e)}")
+                answer = f"I encountered an error while generating the answer: {str(e)}"
+                generated = False
             
-            for i, result in enumerate(search_results):
-                context_parts.append(f"Context {i+1}:\n{result['chunk_text']}")
-                
-                source = {
-                    "chunk_id": result["chunk_id"],
-                    "notion_page_id": result["notion_page_id"],
-                    "page_url": result.get("page_url"),
-                    "similarity_score": result["similarity_score"],
-                    "chunk_text": result["chunk_text"][:200] + "..." if len(result["chunk_text"]) > 200 else result["chunk_text"]
-                }
-                
-                page_props = result.get("page_properties", {})
-                for prop_name, prop_data in page_props.items():
-                    if prop_data.get("type") == "title":
-                        title_text = self._extract_rich_text(prop_data.get("title", []))
-                        if title_text:
-                            source["page_title"] = title_text
-                            break
-                
-                sources.append(source)
+            result = self._build_result(answer, sources, search_results)
             
-            context = "\n\n".join(context_parts)
+            # Only cache answers that were actually generated
+            if generated:
+                self._cache_answer(question_embedding, cache_version, result)
             
-            # Generate answer using Google AI
-            answer = await self._generate_answer(question, context)
-            
-            return {
-                "answer": answer,
-                "sources": sources,
-                "context_used": True,
-                "search_results_count": len(search_results),
-                "model_used": self.model_name
-            }
+            return result
             
         except Exception as e:
             logger.error(f"Error answering question: {str(e)}")
             raise
     
-    async def _generate_answer(self, question: str, context: str) -> str:
-        """Generate answer using Google AI with context"""
+    async def stream_answer(self, question: str) -> AsyncIterator[str]:
+        """Answer a question using RAG, yielding the answer text as it is generated"""
+        question_embedding = await self._embed_question(question)
+        cache_version = self.vector_db.content_version
+        cached_answer = self._cached_answer(question_embedding, cache_version)
+        if cached_answer is not None:
+            logger.info("Answer served from semantic cache")
+            yield cached_answer["answer"]
+            return
+        
+        search_results, context, sources = await self._retrieve_context(question, question_embedding)
+        
+        if not search_results:
+            yield self._no_context_result()["answer"]
+            return
+        
+        prompt = PromptUtils.build_question_prompt(question, context)
+        parts = []
         try:
-            prompt = PromptUtils.build_question_prompt(question, context)
-            
             response = await self.model.generate_content_async(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=1000,
-                    top_p=0.8,
-                    top_k=40
-                )
+                generation_config=self._answer_config,
+                stream=True
             )
             
-            return response.text.strip()
+            chunk = None
+            async for chunk in response:
+                text = self._response_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
             
+            if not "".join(parts).strip():
+                raise self._empty_answer_error(chunk)
         except Exception as e:
+            # Same message as answer_question; a failed or empty stream is never cached
             logger.error(f"Error generating answer: {str(e)}")
-            return f"I encountered an error while generating the answer: {str(e)}"
+            yield f"I encountered an error while generating the answer: {str(e)}"
+            return
+        
+        # Cache the complete answer so the next similar question skips generation
+        self._cache_answer(
+            question_embedding, cache_version, self._build_result("".join(parts).strip(), sources, search_results)
+        )
+    
+    async def _embed_question(self, question: str) -> Optional[List[float]]:
+        """Embed a question for the cache and search, or None if embedding fails"""
+        try:
+            return await self.vector_db.embed_query(question)
+        except Exception as e:
+            # Without an embedding the cache is skipped and vector_search falls back to text search
+            logger.warning(f"Error embedding question, skipping semantic cache: {str(e)}")
+            return None
+    
+    def _cached_answer(self, question_embedding: Optional[List[float]], version: int) -> Optional[Dict[str, Any]]:
+        """Look up a cached answer, dropping the cache if the knowledge base changed"""
+        if question_embedding is None:
+            return None
+        if version != self._cache_version:
+            logger.info("Knowledge base changed, clearing semantic cache")
+            self.answer_cache.clear()
+            self._cache_version = version
+        return self.answer_cache.get(question_embedding)
+    
+    def _cache_answer(self, question_embedding: Optional[List[float]], version: int, result: Dict[str, Any]):
+        """Cache an answer unless the knowledge base changed while it was generated"""
+        if question_embedding is None or version != self.vector_db.content_version:
+            return
+        self.answer_cache.put(question_embedding, result)
+    
+    async def _retrieve_context(
+        self,
+        question: str,
+        question_embedding: List[float]
+    ) -> Tuple[List[Dict[str, Any]], str, List[Dict[str, Any]]]:
+        """Search the vector database and build the prompt context and sources"""
+        # Retrieve relevant context from vector database
+        search_results = await self._search(question, question_embedding)
+        
+        if not search_results:
+            return [], "", []
+        
+        print(f"Found {len(search_results)} relevant chunks for the question.")
+        print("Search results:", search_results)
+        
+        # Build context from search results
+        context_parts = []
+        sources = []
+        
+        remaining_chars = self.max_context_chars
+        
+        for i, result in enumerate(search_results):
+            # Give each remaining chunk an equal share of the leftover budget
+            chunk_budget = remaining_chars // (len(search_results) - i)
+            chunk_text = result["chunk_text"][:chunk_budget]
+            remaining_chars -= len(chunk_text)
+            context_parts.append(f"Context {i+1}:\n{chunk_text}")
+            
+            source = {
+                "chunk_id": result["chunk_id"],
+                "notion_page_id": result["notion_page_id"],
+                "page_url": result.get("page_url"),
+                "similarity_score": result["similarity_score"],
+                "chunk_text": result["chunk_text"][:200] + "..." if len(result["chunk_text"]) > 200 else result["chunk_text"]
+            }
+            
+            # A Notion page has exactly one title property
+            title_prop = next(
+                (prop for prop in result.get("page_properties", {}).values() if prop.get("type") == "title"),
+                None
+            )
+            if title_prop:
+                title_text = self._extract_rich_text(title_prop.get("title", []))
+                if title_text:
+                    source["page_title"] = title_text
+            
+            sources.append(source)
+        
+        return search_results, "\n\n".join(context_parts), sources
+    
+    async def _search(self, question: str, question_embedding: List[float]) -> List[Dict[str, Any]]:
+        """Run a vector search, grouped with similar questions arriving in the same window"""
+        if self.query_group_window <= 0 or question_embedding is None:
+            return await self._vector_search(question, question_embedding)
+        
+        future = asyncio.get_running_loop().create_future()
+        if self._pending_searches is None:
+            self._pending_searches = []
+            task = asyncio.create_task(self._flush_searches(self._pending_searches))
+            self._flush_tasks.add(task)
+            task.add_done_callback(partial(self._release_searches, self._pending_searches))
+        self._pending_searches.append((question, question_embedding, future))
+        return await future
+    
+    async def _flush_searches(self, pending: List[Tuple[str, List[float], asyncio.Future]]):
+        """Run the queued searches, waiting for the window only while another search is running"""
+        # Yield once so questions asked in the same tick are grouped
+        await asyncio.sleep(self.query_group_window if self._searches_running else 0)
+        self._pending_searches = None
+        self._searches_running += 1
+        try:
+            await self._search_groups(pending)
+        finally:
+            self._searches_running -= 1
+    
+    def _release_searches(self, pending: List[Tuple[str, List[float], asyncio.Future]], task: asyncio.Task):
+        """Flush done callback: cancel any search it left unresolved, even if cancelled before it started"""
+        self._flush_tasks.discard(task)
+        if self._pending_searches is pending:
+            self._pending_searches = None
+        for _, _, future in pending:
+            if not future.done():
+                future.cancel()
+    
+    async def _search_groups(self, pending: List[Tuple[str, List[float], asyncio.Future]]):
+        """Cluster near-duplicate questions by embedding and run one search per cluster"""
+        vectors = np.asarray([embedding for _, embedding, _ in pending], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1)
+        
+        # All pairwise similarities in one matmul, then greedily assign each
+        # question to the most similar cluster leader above the threshold
+        similarities = vectors @ vectors.T
+        leaders: List[int] = []
+        clusters: List[List[int]] = []
+        for i in range(len(pending)):
+            if leaders:
+                leader_scores = similarities[i, leaders]
+                best = int(np.argmax(leader_scores))
+                if leader_scores[best] >= self.query_group_threshold:
+                    clusters[best].append(i)
+                    continue
+            leaders.append(i)
+            clusters.append([i])
+        
+        if len(clusters) < len(pending):
+            logger.info(f"Grouped {len(pending)} questions into {len(clusters)} vector searches")
+        
+        async def search_cluster(cluster: List[int]):
+            # Search with the leader's own question and embedding; the others are near-duplicates
+            question, query_embedding, _ = pending[cluster[0]]
+            try:
+                results = await self._vector_search(question, query_embedding)
+                for i in cluster:
+                    if not pending[i][2].done():
+                        pending[i][2].set_result(list(results))
+            except Exception as e:
+                for i in cluster:
+                    if not pending[i][2].done():
+                        pending[i][2].set_exception(e)
+        
+        await asyncio.gather(*(search_cluster(cluster) for cluster in clusters))
+    
+    async def _vector_search(self, question: str, question_embedding: List[float]) -> List[Dict[str, Any]]:
+        """Search the vector database for chunks relevant to the question"""
+        return await self.vector_db.vector_search(
+            query=question,
+            limit=self.max_context_chunks,
+            min_score=self.min_similarity_score,
+            query_embedding=question_embedding
+        )
+    
+    def _no_context_result(self) -> Dict[str, Any]:
+        """Result returned when no relevant chunks were found"""
+        return {
+            "answer": "I couldn't find relevant information in your knowledge base to answer this question.",
+            "sources": [],
+            "context_used": False,
+            "search_results_count": 0
+        }
+    
+    def _build_result(
+        self,
+        answer: str,
+        sources: List[Dict[str, Any]],
+        search_results: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Assemble the answer payload returned to callers"""
+        return {
+            "answer": answer,
+            "sources": sources,
+            "context_used": True,
+            "search_results_count": len(search_results),
+            "model_used": self.model_name
+        }
+    
+    async def _generate_answer(self, question: str, context: str) -> str:
+        """Generate answer using Google AI with context"""
+        prompt = PromptUtils.build_question_prompt(question, context)
+        
+        response = await self.model.generate_content_async(
+            prompt,
+            generation_config=self._answer_config
+        )
+        
+        answer = self._response_text(response).strip()
+        if not answer:
+            raise self._empty_answer_error(response)
+        return answer
+    
+    @staticmethod
+    def _empty_answer_error(response) -> ValueError:
+        """Error for a response that produced no answer text, naming why the candidate stopped"""
+        candidates = getattr(response, "candidates", None)
+        finish_reason = candidates[0].finish_reason if candidates else None
+        return ValueError(f"Model returned no answer text (finish reason: {finish_reason})")
+    
+    @staticmethod
+    def _response_text(response) -> str:
+        """Text of a Gemini response, or an empty string when the candidate has no text parts"""
+        try:
+            return response.text
+        except ValueError:
+            # .text raises for blocked candidates and ones cut off before any text, e.g. when
+            # thinking used up max_output_tokens
+            return ""
     
     def _extract_rich_text(self, rich_text_array: List[Dict[str, Any]]) -> str:
         """Extract plain text from rich text array"""
         if not rich_text_array:
             return ""
         
+        # Most titles are a single unformatted run
+        if len(rich_text_array) == 1:
+            return rich_text_array[0].get("plain_text", "")
+        
         return "".join([
             text_obj.get("plain_text", "")
             for text_obj in rich_text_array
@@ -158,4 +463,10 @@ class RAGService:
     
     async def close(self):
         """Close connections"""
-        await self.vector_db.close()
\ No newline at end of file
+        await self.vector_db.close()
+
+
+@lru_cache(maxsize=None)
+def get_rag_service() -> RAGService:
+    """Return the shared RAG service so every router reuses one model and vector DB"""
+    return RAGService()
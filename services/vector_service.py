@@ -5,26 +5,35 @@
 import logging
 import os
 import asyncio
+from functools import lru_cache
 
-from vector_db import VectorDB
+from vector_db import get_vector_db
 from typing import Optional
-from notion_client import AsyncClient
-from utils.notion_utils import NotionUtils
-from dotenv import load_dotenv
+from utils.notion_utils import NotionUtils, call_with_retry, create_notion_client
+from utils.env_utils import load_env
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
+# Keep references to running sync tasks so they aren't garbage collected mid-sync
+_sync_tasks: set = set()
+
 class VectorService:
     """Vector service for handling data vector operations."""
     
     def __init__(self):
-        self.db = VectorDB()
+        self.db = get_vector_db()
         self.notion_api_key = os.getenv("NOTION_API_KEY")
         self.notion_database_ids = os.getenv("NOTION_DATABASE_IDS", "").split(",") if os.getenv("NOTION_DATABASE_IDS") else []
+        # Maximum number of pages fetched from Notion at the same time
+        self.notion_concurrency = int(os.getenv("NOTION_CONCURRENCY", "5"))
+        # Maximum number of databases synced at the same time
+        self._sync_semaphore = asyncio.Semaphore(int(os.getenv("SYNC_DB_CONCURRENCY", "3")))
+        # Maximum number of pages written to MongoDB at the same time
+        self.store_concurrency = int(os.getenv("STORE_CONCURRENCY", "16"))
 
         if self.notion_api_key:
-            self.notion = AsyncClient(auth=self.notion_api_key)
+            self.notion = create_notion_client(self.notion_api_key)
             self.notion_utils = NotionUtils(self.notion)
 
         logger.info("Vector service initialized")
@@ -32,9 +41,11 @@ class VectorService:
     def start_sync_databases(self, force_update: bool = True, page_limit: Optional[int] = 100):
         """Start syncing Notion databases in the background"""
         for database_id in self.notion_database_ids:
-            asyncio.create_task(
+            task = asyncio.create_task(
                 self._sync_database_background(database_id, force_update, page_limit)
             )
+            _sync_tasks.add(task)
+            task.add_done_callback(_sync_tasks.discard)
 
     
     async def _sync_database_background(
@@ -44,6 +55,16 @@ class VectorService:
         page_limit: Optional[int]
     ):
         """Background task to sync database with enhanced content extraction"""
+        async with self._sync_semaphore:
+            await self._sync_database(database_id, force_update, page_limit)
+    
+    async def _sync_database(
+        self,
+        database_id: str,
+        force_update: bool,
+        page_limit: Optional[int]
+    ):
+        """Sync every page of a Notion database into the vector database"""
         try:
             logger.info(f"Starting background sync for database {database_id}")
             
@@ -61,7 +82,7 @@ class VectorService:
                 if next_cursor:
                     query_params["start_cursor"] = next_cursor
                 
-                response = await self.notion.databases.query(**query_params)
+                response = await call_with_retry(self.notion.databases.query, **query_params)
                 pages = response.get("results", [])
                 all_pages.extend(pages)
                 
@@ -83,10 +104,28 @@ class VectorService:
                 "total_chunks": 0
             }
             
-            for page in all_pages:
-                try:
+            # Skip pages whose last_edited_time matches what is already stored,
+            # without fetching their blocks from Notion
+            if not force_update and all_pages:
+                stored_edit_times = await self.db.get_last_edited_times([page["id"] for page in all_pages])
+                changed_pages = [
+                    page for page in all_pages
+                    if page["id"] not in stored_edit_times
+                    or stored_edit_times[page["id"]] != page.get("last_edited_time")
+                ]
+                sync_results["skipped"] += len(all_pages) - len(changed_pages)
+                all_pages = changed_pages
+            
+            # Extract and chunk every page first so embeddings can be batched
+            semaphore = asyncio.Semaphore(self.notion_concurrency)
+            
+            async def _prepare_page(page):
+                async with semaphore:
+                    # NotionUtils tracks per-extraction state, so each page gets its own instance
+                    notion_utils = NotionUtils(self.notion)
+                    
                     # Use enhanced extraction with recursive block fetching
-                    page_data = await self.notion_utils.extract_complete_page_data(
+                    page_data = await notion_utils.extract_complete_page_data(
                         page_id=page["id"],
                         include_child_pages=True,
                         resolve_links=True,
@@ -96,24 +135,82 @@ class VectorService:
                     # Add database_id to page_data for storage
                     page_data["database_id"] = database_id
                     
-                    result = await self.db.store_notion_page(
+                    prepared = await self.db.prepare_notion_page(
                         page_id=page["id"],
                         page_data=page_data,
-                        database_id=database_id,
                         force_update=force_update
                     )
-                    
-                    if result["status"] == "success":
-                        sync_results["success"] += 1
-                        sync_results["total_chunks"] += result["chunks_stored"]
-                    elif result["status"] == "skipped":
-                        sync_results["skipped"] += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error syncing page {page['id']}: {str(e)}")
+                    return page_data, prepared
+            
+            prepared_pages = await asyncio.gather(
+                *[_prepare_page(page) for page in all_pages],
+                return_exceptions=True
+            )
+            
+            pending_pages = []
+            all_chunks = []
+            for page, outcome in zip(all_pages, prepared_pages):
+                if isinstance(outcome, Exception):
+                    logger.error(f"Error syncing page {page['id']}: {str(outcome)}")
                     sync_results["errors"] += 1
+                    continue
+                
+                page_data, prepared = outcome
+                if prepared["status"] == "skipped":
+                    sync_results["skipped"] += 1
+                    continue
+                
+                # Remember where this page's chunks start in the combined list
+                chunks = prepared["chunks"]
+                pending_pages.append((
+                    page["id"], page_data, prepared.get("content_hash"), prepared.get("chunk_tokens"),
+                    len(all_chunks), len(chunks)
+                ))
+                all_chunks.extend(chunks)
+            
+            # Embed all chunks across pages in batched forward passes
+            all_embeddings = []
+            try:
+                if all_chunks:
+                    all_embeddings = await self.db.generate_embeddings_batch_async(all_chunks)
+            except Exception as e:
+                logger.error(f"Error generating embeddings for database {database_id}: {str(e)}")
+                sync_results["errors"] += len(pending_pages)
+                pending_pages = []
+            
+            # Write pages concurrently so their MongoDB round trips overlap
+            store_semaphore = asyncio.Semaphore(self.store_concurrency)
+            
+            async def _store_page(page_id, page_data, content_hash, chunk_tokens, start, count):
+                async with store_semaphore:
+                    try:
+                        result = await self.db.store_notion_page_with_embeddings(
+                            page_id=page_id,
+                            page_data=page_data,
+                            database_id=database_id,
+                            chunks=all_chunks[start:start + count],
+                            embeddings=all_embeddings[start:start + count],
+                            content_hash=content_hash,
+                            chunk_tokens=chunk_tokens
+                        )
+                        
+                        if result["status"] == "success":
+                            sync_results["success"] += 1
+                            sync_results["total_chunks"] += result["chunks_stored"]
+                            
+                    except Exception as e:
+                        logger.error(f"Error syncing page {page_id}: {str(e)}")
+                        sync_results["errors"] += 1
+            
+            await asyncio.gather(*[_store_page(*pending) for pending in pending_pages])
             
             logger.info(f"Database sync completed: {sync_results}")
             
         except Exception as e:
-            logger.error(f"Error in background database sync: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error in background database sync: {str(e)}")
+
+
+@lru_cache(maxsize=None)
+def get_vector_service() -> VectorService:
+    """Return the shared vector service instance"""
+    return VectorService()
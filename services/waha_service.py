@@ -1,10 +1,11 @@
 """
 WAHA service for handling WhatsApp messages and interactions with WAHA API.
 """
-import logging, os, requests
-from dotenv import load_dotenv
+import logging, os, httpx
+from functools import lru_cache
+from utils.env_utils import load_env
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
 class WahaService:
@@ -19,6 +20,15 @@ class WahaService:
         if not self.api_url or not self.session_name or not self.api_key:
             raise ValueError("WAHA_API_URL, WAHA_API_KEY, and WAHA_SESSION_NAME environment variables are required")
         
+        # Pooled client so replies reuse keep-alive connections instead of a new handshake each time;
+        # over HTTPS, HTTP/2 multiplexes concurrent replies on one connection
+        self._client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            timeout=httpx.Timeout(10.0, connect=2.0),
+            headers={"X-Api-Key": self.api_key}
+        )
+        
         logger.info(f"WahaService initialized with API URL: {self.api_url} and session name: {self.session_name}")
     
     async def send_whatsapp_reply(self, recipient: str, message: str):
@@ -31,16 +41,23 @@ class WahaService:
             "text": message,
             "session": self.session_name,
         }
-        headers = {
-            "X-Api-Key": self.api_key,
-        }
         try:
-            response = requests.post(send_url, json=payload, headers=headers)
+            response = await self._client.post(send_url, json=payload)
             response.raise_for_status()
             logger.info(f"Successfully sent reply to {recipient}")
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             logger.error(f"Error sending message to {recipient}: {e.response.text}")
-        except requests.exceptions.RequestException as e:
+        except httpx.RequestError as e:
             logger.error(f"An error occurred while requesting {e.request.url!r}: {e}")
         except Exception as e:
-            logger.error(f"Unexpected error while sending message to {recipient}: {str(e)}")
\ No newline at end of file
+            logger.error(f"Unexpected error while sending message to {recipient}: {str(e)}")
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self._client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_waha_service() -> WahaService:
+    """Return the shared WAHA service instance"""
+    return WahaService()
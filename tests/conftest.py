@@ -0,0 +1,78 @@
+import sys
+import pathlib
+from contextlib import ExitStack
+from functools import lru_cache
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+# Make the application packages importable regardless of pytest's import mode
+ROOT = str(pathlib.Path(__file__).resolve().parent.parent)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Environment the application needs at import time
+TEST_ENV = {
+    "NOTION_API_KEY": "test_notion_api_key",
+    "NOTION_DATABASE_IDS": "db1,db2",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "MONGODB_DATABASE": "test_db",
+    "MONGODB_COLLECTION": "test_collection",
+    "GOOGLE_API_KEY": "test_google_api_key",
+    "GOOGLE_MODEL": "test_google_model",
+    "EMBEDDING_MODEL": "test_embedding_model",
+    "MAX_CHUNK_TOKENS": "500",
+    "CHUNK_OVERLAP_TOKENS": "50",
+    "MAX_CONTEXT_CHUNKS": "5",
+    "MIN_SIMILARITY_SCORE": "0.7",
+    "CORS_ALLOW_ORIGINS": "*",
+    "API_SECRET_KEY": "test_api_secret_key",
+    "WHITELISTED_NUMBERS": "1234567890,9876543210",
+    "WAHA_API_URL": "http://test.waha.api",
+    "WAHA_SESSION_NAME": "test-session",
+    "CHATERY_API_URL": "https://test.chatery.api",
+    "CHATERY_API_KEY": "test-chatery-key",
+    "CHATERY_PHONE_NUMBER_ID": "test-phone-id",
+    "CHATERY_WEBHOOK_SECRET": "test-webhook-secret"
+}
+
+# Classes swapped for mocks only while main is imported, so the routers' module-level
+# singletons never open real MongoDB, model or HTTP clients. The patches are stopped
+# right after the import, so unit tests of these classes still get the real ones.
+STUBBED_SERVICES = (
+    "vector_db.VectorDB",
+    "services.rag_service.RAGService",
+    "services.waha_service.WahaService",
+    "services.chatery_service.ChateryService",
+)
+
+@lru_cache(maxsize=1)
+def _get_app():
+    """Import the app once per process; callers must set TEST_ENV first"""
+    with ExitStack() as stack:
+        for target in STUBBED_SERVICES:
+            stack.enter_context(patch(target, return_value=AsyncMock()))
+        import main
+    return main.app
+
+@pytest.fixture(scope="session")
+def monkeypatch_session():
+    """Session-scoped MonkeyPatch that undoes only the changes made through it"""
+    with pytest.MonkeyPatch.context() as mp:
+        yield mp
+
+@pytest.fixture(scope="session")
+def app(monkeypatch_session):
+    """The FastAPI app, imported once per session with TEST_ENV applied"""
+    # setenv records just the keys it touches, so teardown restores only TEST_ENV
+    for key, value in TEST_ENV.items():
+        monkeypatch_session.setenv(key, value)
+    return _get_app()
+
+@pytest.fixture(scope="session")
+def test_client(app):
+    # Enter the client once so startup and shutdown run once per session.
+    # There is no MongoDB in tests, so skip the vector index check at startup.
+    with patch("routers.vector_router.vector_db.ensure_vector_index", new_callable=AsyncMock), \
+         TestClient(app) as client:
+        yield client
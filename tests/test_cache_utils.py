@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import patch
+import numpy as np
+from utils.cache_utils import SemanticAnswerCache
+
+@pytest.fixture
+def cache():
+    return SemanticAnswerCache(threshold=0.95, max_entries=3, ttl_seconds=60)
+
+def _vector(*values):
+    return list(values)
+
+def test_get_empty_cache(cache):
+    assert cache.get(_vector(1.0, 0.0, 0.0)) is None
+
+def test_put_and_get_exact_match(cache):
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    assert cache.get(_vector(1.0, 0.0, 0.0)) == {"answer": "A"}
+    assert len(cache) == 1
+
+def test_get_near_duplicate(cache):
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    assert cache.get(_vector(0.99, 0.02, 0.0)) == {"answer": "A"}
+
+def test_get_below_threshold(cache):
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    assert cache.get(_vector(0.0, 1.0, 0.0)) is None
+
+def test_returned_answer_is_a_copy(cache):
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    cache.get(_vector(1.0, 0.0, 0.0))["answer"] = "changed"
+    assert cache.get(_vector(1.0, 0.0, 0.0)) == {"answer": "A"}
+
+def test_lru_eviction(cache):
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    cache.put(_vector(0.0, 1.0, 0.0), {"answer": "B"})
+    cache.put(_vector(0.0, 0.0, 1.0), {"answer": "C"})
+    # Touch A so that B becomes the least recently used entry
+    cache.get(_vector(1.0, 0.0, 0.0))
+    cache.put(_vector(1.0, 1.0, 0.0), {"answer": "D"})
+    assert len(cache) == 3
+    assert cache.get(_vector(0.0, 1.0, 0.0)) is None
+    assert cache.get(_vector(1.0, 0.0, 0.0)) == {"answer": "A"}
+
+def test_ttl_expiry(cache):
+    with patch("utils.cache_utils.time.monotonic", return_value=0.0):
+        cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    with patch("utils.cache_utils.time.monotonic", return_value=120.0):
+        assert cache.get(_vector(1.0, 0.0, 0.0)) is None
+    assert len(cache) == 0
+
+@pytest.mark.parametrize("max_entries", [0, -1])
+def test_disabled_cache(max_entries):
+    cache = SemanticAnswerCache(max_entries=max_entries)
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    assert cache.get(_vector(1.0, 0.0, 0.0)) is None
+    assert len(cache) == 0
+
+def test_clear(cache):
+    cache.put(_vector(1.0, 0.0, 0.0), {"answer": "A"})
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get(_vector(1.0, 0.0, 0.0)) is None
+
+def test_many_entries_recall():
+    cache = SemanticAnswerCache(threshold=0.95, max_entries=200)
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((200, 384))
+    for i, vector in enumerate(vectors):
+        cache.put(vector.tolist(), {"answer": str(i)})
+    hits = sum(
+        cache.get(vector.tolist()) == {"answer": str(i)}
+        for i, vector in enumerate(vectors)
+    )
+    assert hits == 200
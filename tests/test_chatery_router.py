@@ -1,12 +1,11 @@
 import pytest
-import os
 from unittest.mock import patch, AsyncMock, MagicMock
-from fastapi.testclient import TestClient
+import httpx
 
 
-# --- Global Mocks and Patches ---
-# We patch the service instances in the router module directly.
-# The router creates service instances at module level, so we need to patch them there.
+# --- Global Mocks ---
+# The router creates its service instances at module level, so the test_client
+# fixture swaps these mocks in on the router module for the duration of this file.
 
 # Mock for RAGService
 mock_rag_service_instance = AsyncMock()
@@ -18,43 +17,28 @@ mock_rag_service_instance.identify_message.return_value = "QUERY"  # Default to
 # Mock for ChateryService
 mock_chatery_service_instance = AsyncMock()
 
-# Patch the service classes before the router module is imported
-patch('services.rag_service.RAGService', return_value=mock_rag_service_instance).start()
-patch('services.chatery_service.ChateryService', return_value=mock_chatery_service_instance).start()
-
 
 # --- Pytest Fixtures ---
 
 @pytest.fixture(scope="module")
-def test_client():
+async def test_client(app):
     """
-    Creates a TestClient for the FastAPI app.
-    This fixture has 'module' scope, so the app and environment variables
-    are set up only once per test file run, improving performance.
+    Creates an httpx.AsyncClient bound to the FastAPI app over ASGITransport.
+    The app itself comes from the session-scoped conftest fixture, so main is
+    imported once per pytest run.
     """
     # Patch the module-level constant in the security module directly.
     # This is crucial because security.py reads the environment variable at import time.
-    # We also patch os.environ for completeness.
+    # The shared session app fixture supplies the router environment.
+    # MonkeyPatch.context undoes the swaps at module teardown so later test files see the real services.
     with patch('security.API_SECRET_KEY', 'test-secret-key', create=True), \
-         patch.dict(os.environ, {
-            "API_SECRET_KEY": "test-secret-key",
-            "WHITELISTED_NUMBERS": "1234567890,9876543210",  # Default whitelist for tests
-            "CHATERY_API_URL": "https://test.chatery.api",
-            "CHATERY_API_KEY": "test-chatery-key",
-            "CHATERY_PHONE_NUMBER_ID": "test-phone-id",
-            "CHATERY_WEBHOOK_SECRET": "test-webhook-secret"
-        }):
-        # Import the app inside the fixture to ensure patches are active
-        from main import app
-        
-        # Now patch the router module's service instances with our mocks
-        import routers.chatery_router
-        routers.chatery_router.rag_service = mock_rag_service_instance
-        routers.chatery_router.chatery_service = mock_chatery_service_instance
-        routers.chatery_router.vectorService = MagicMock()
-        
-        client = TestClient(app)
-        yield client
+         pytest.MonkeyPatch.context() as mp:
+        mp.setattr('routers.chatery_router.rag_service', mock_rag_service_instance)
+        mp.setattr('routers.chatery_router.chatery_service', mock_chatery_service_instance)
+        mp.setattr('routers.chatery_router.vectorService', MagicMock())
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
 
 
 @pytest.fixture(autouse=True)
@@ -72,7 +56,6 @@ def reset_mocks():
 
 # --- Test Cases ---
 
-@pytest.mark.asyncio
 async def test_verify_webhook_success(test_client):
     """
     Test successful webhook verification with correct parameters.
@@ -85,14 +68,13 @@ async def test_verify_webhook_success(test_client):
     }
 
     # Act
-    response = test_client.get("/chatery/webhook", params=params)
+    response = await test_client.get("/chatery/webhook", params=params)
 
     # Assert
     assert response.status_code == 200
     assert response.text == "12345"
 
 
-@pytest.mark.asyncio
 async def test_verify_webhook_wrong_mode(test_client):
     """
     Test webhook verification fails with wrong mode.
@@ -105,14 +87,13 @@ async def test_verify_webhook_wrong_mode(test_client):
     }
 
     # Act
-    response = test_client.get("/chatery/webhook", params=params)
+    response = await test_client.get("/chatery/webhook", params=params)
 
     # Assert
     assert response.status_code == 403
     assert response.json()["detail"] == "Verification failed"
 
 
-@pytest.mark.asyncio
 async def test_verify_webhook_wrong_token(test_client):
     """
     Test webhook verification fails with wrong verify token.
@@ -125,14 +106,13 @@ async def test_verify_webhook_wrong_token(test_client):
     }
 
     # Act
-    response = test_client.get("/chatery/webhook", params=params)
+    response = await test_client.get("/chatery/webhook", params=params)
 
     # Assert
     assert response.status_code == 403
     assert response.json()["detail"] == "Verification failed"
 
 
-@pytest.mark.asyncio
 async def test_verify_webhook_missing_params(test_client):
     """
     Test webhook verification fails with missing parameters.
@@ -144,14 +124,13 @@ async def test_verify_webhook_missing_params(test_client):
     }
 
     # Act
-    response = test_client.get("/chatery/webhook", params=params)
+    response = await test_client.get("/chatery/webhook", params=params)
 
     # Assert
     assert response.status_code == 403
     assert response.json()["detail"] == "Verification failed"
 
 
-@pytest.mark.asyncio
 async def test_receive_whitelisted_message(test_client):
     """
     Test receiving a valid message from a whitelisted number.
@@ -177,7 +156,7 @@ async def test_receive_whitelisted_message(test_client):
     mock_rag_service_instance.answer_question.return_value = {"answer": "Test answer from RAG."}
 
     # Act: Send the request to the webhook
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert: Check the outcome
     assert response.status_code == 200
@@ -185,7 +164,6 @@ async def test_receive_whitelisted_message(test_client):
     mock_chatery_service_instance.send_whatsapp_reply.assert_called()
 
 
-@pytest.mark.asyncio
 async def test_receive_non_whitelisted_message(test_client):
     """
     Test receiving a message from a non-whitelisted number.
@@ -210,7 +188,7 @@ async def test_receive_non_whitelisted_message(test_client):
     headers = {"X-API-KEY": "test-secret-key"}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
@@ -218,7 +196,6 @@ async def test_receive_non_whitelisted_message(test_client):
     mock_chatery_service_instance.send_whatsapp_reply.assert_not_called()
 
 
-@pytest.mark.asyncio
 async def test_receive_message_invalid_api_key(test_client):
     """
     Test that a request with an invalid API key is rejected.
@@ -228,7 +205,7 @@ async def test_receive_message_invalid_api_key(test_client):
     headers = {"X-API-KEY": "wrong-secret-key"}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 403
@@ -236,7 +213,6 @@ async def test_receive_message_invalid_api_key(test_client):
     mock_rag_service_instance.answer_question.assert_not_called()
 
 
-@pytest.mark.asyncio
 async def test_receive_message_no_api_key(test_client):
     """
     Test that a request with no API key is rejected.
@@ -245,14 +221,13 @@ async def test_receive_message_no_api_key(test_client):
     payload = {"entry": []}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload)
+    response = await test_client.post("/chatery/webhook", json=payload)
 
     # Assert
     assert response.status_code == 401
     mock_rag_service_instance.answer_question.assert_not_called()
 
 
-@pytest.mark.asyncio
 async def test_receive_empty_entry(test_client):
     """
     Test that empty entry payload is handled gracefully.
@@ -262,14 +237,13 @@ async def test_receive_empty_entry(test_client):
     headers = {"X-API-KEY": "test-secret-key"}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
 
-@pytest.mark.asyncio
 async def test_receive_non_text_message(test_client):
     """
     Test that non-text messages are ignored.
@@ -291,7 +265,7 @@ async def test_receive_non_text_message(test_client):
     headers = {"X-API-KEY": "test-secret-key"}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
@@ -299,7 +273,6 @@ async def test_receive_non_text_message(test_client):
     mock_chatery_service_instance.send_whatsapp_reply.assert_not_called()
 
 
-@pytest.mark.asyncio
 async def test_receive_status_update(test_client):
     """
     Test that status updates are handled gracefully.
@@ -320,14 +293,13 @@ async def test_receive_status_update(test_client):
     headers = {"X-API-KEY": "test-secret-key"}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
 
-@pytest.mark.asyncio
 async def test_rag_service_exception_handling(test_client):
     """
     Test that if the RAG service fails, the error is handled gracefully.
@@ -350,14 +322,13 @@ async def test_rag_service_exception_handling(test_client):
     mock_rag_service_instance.answer_question.side_effect = Exception("RAG service exploded")
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
 
-@pytest.mark.asyncio
 async def test_sync_command(test_client):
     """
     Test that SYNC command triggers database synchronization.
@@ -380,7 +351,7 @@ async def test_sync_command(test_client):
     mock_rag_service_instance.identify_message.return_value = "SYNC"
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
@@ -388,7 +359,6 @@ async def test_sync_command(test_client):
     mock_rag_service_instance.identify_message.assert_called_once()
 
 
-@pytest.mark.asyncio
 async def test_query_command(test_client):
     """
     Test that QUERY command triggers question answering.
@@ -412,7 +382,7 @@ async def test_query_command(test_client):
     mock_rag_service_instance.answer_question.return_value = {"answer": "It's sunny today."}
 
     # Act
-    response = test_client.post("/chatery/webhook", json=payload, headers=headers)
+    response = await test_client.post("/chatery/webhook", json=payload, headers=headers)
 
     # Assert
     assert response.status_code == 200
@@ -1,7 +1,7 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 from services.chatery_service import ChateryService
-import requests
+import httpx
 import os
 import asyncio
 
@@ -15,39 +15,35 @@ def set_env_vars(monkeypatch):
     monkeypatch.setenv("CHATERY_WEBHOOK_SECRET", "fake_webhook_secret")
 
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_success(mocker, set_env_vars):
+def _response(status_code, text=""):
+    """Build an httpx response bound to a request so raise_for_status works."""
+    request = httpx.Request("POST", "https://fake.chatery.api/messages")
+    return httpx.Response(status_code, text=text, request=request)
+
+
+async def test_send_whatsapp_reply_success(set_env_vars):
     """Test successful message sending via Chatery API."""
     # Arrange
     service = ChateryService()
-    mock_post = mocker.patch("services.chatery_service.requests.post")
-    mock_response = MagicMock()
-    mock_response.raise_for_status.return_value = None
-    mock_post.return_value = mock_response
+    service._client.post = AsyncMock(return_value=_response(200))
 
     # Act
     await service.send_whatsapp_reply("1234567890", "Hello, world!")
 
     # Assert
-    mock_post.assert_called_once()
-    call_args = mock_post.call_args
+    service._client.post.assert_awaited_once()
+    call_args = service._client.post.call_args
     assert call_args[0][0] == "https://fake.chatery.api/messages"
     assert call_args[1]["json"]["to"] == "1234567890"
     assert call_args[1]["json"]["text"]["body"] == "Hello, world!"
-    assert call_args[1]["headers"]["Authorization"] == "Bearer fake_chatery_key"
+    assert service._client.headers["Authorization"] == "Bearer fake_chatery_key"
 
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_http_error(mocker, set_env_vars, caplog):
+async def test_send_whatsapp_reply_http_error(set_env_vars, caplog):
     """Test handling HTTP errors during message sending."""
     # Arrange
     service = ChateryService()
-    mock_post = mocker.patch("services.chatery_service.requests.post")
-    mock_response = MagicMock()
-    mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
-        response=MagicMock(text="HTTP Error")
-    )
-    mock_post.return_value = mock_response
+    service._client.post = AsyncMock(return_value=_response(500, text="HTTP Error"))
 
     # Act
     with caplog.at_level("ERROR"):
@@ -57,18 +53,12 @@ async def test_send_whatsapp_reply_http_error(mocker, set_env_vars, caplog):
     assert "Error sending message" in caplog.text
 
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_request_error(mocker, set_env_vars, caplog):
-    """Test handling RequestException during message sending."""
+async def test_send_whatsapp_reply_request_error(set_env_vars, caplog):
+    """Test handling RequestError during message sending."""
     # Arrange
     service = ChateryService()
-    mock_request = MagicMock()
-    mock_request.url = "https://fake.chatery.api/messages"
-
-    mock_post = mocker.patch(
-        "services.chatery_service.requests.post",
-        side_effect=requests.exceptions.RequestException("Request Error", request=mock_request)
-    )
+    request = httpx.Request("POST", "https://fake.chatery.api/messages")
+    service._client.post = AsyncMock(side_effect=httpx.ConnectError("Request Error", request=request))
 
     # Act
     with caplog.at_level("ERROR"):
@@ -78,15 +68,11 @@ async def test_send_whatsapp_reply_request_error(mocker, set_env_vars, caplog):
     assert "An error occurred while requesting" in caplog.text
 
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_unexpected_error(mocker, set_env_vars, caplog):
+async def test_send_whatsapp_reply_unexpected_error(set_env_vars, caplog):
     """Test handling unexpected errors during message sending."""
     # Arrange
     service = ChateryService()
-    mock_post = mocker.patch(
-        "services.chatery_service.requests.post",
-        side_effect=Exception("Unexpected error")
-    )
+    service._client.post = AsyncMock(side_effect=Exception("Unexpected error"))
 
     # Act
     with caplog.at_level("ERROR"):
@@ -96,6 +82,13 @@ async def test_send_whatsapp_reply_unexpected_error(mocker, set_env_vars, caplog
     assert "Unexpected error" in caplog.text
 
 
+async def test_aclose_closes_client(set_env_vars):
+    """Test that aclose releases the pooled client."""
+    service = ChateryService()
+    await service.aclose()
+    assert service._client.is_closed
+
+
 def test_verify_webhook_signature_valid(mocker, set_env_vars):
     """Test verifying a valid webhook signature."""
     # Arrange
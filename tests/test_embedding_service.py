@@ -0,0 +1,46 @@
+import pytest
+from unittest.mock import AsyncMock
+import httpx
+from services.embedding_service import AsyncEmbeddingClient
+
+
+@pytest.fixture
+def client():
+    return AsyncEmbeddingClient("http://infinity:7997/", "all-MiniLM-L6-v2")
+
+
+def _response(json_data, status_code=200):
+    request = httpx.Request("POST", "http://infinity:7997/embeddings")
+    return httpx.Response(status_code, json=json_data, request=request)
+
+
+async def test_embed_orders_and_normalizes(client):
+    """Test embeddings are returned in input order and L2-normalized."""
+    client._client.post = AsyncMock(return_value=_response({
+        "data": [
+            {"index": 1, "embedding": [0.0, 2.0]},
+            {"index": 0, "embedding": [3.0, 4.0]}
+        ]
+    }))
+
+    embeddings = await client.embed(["first", "second"])
+
+    client._client.post.assert_awaited_once_with(
+        "/embeddings",
+        json={"input": ["first", "second"], "model": "all-MiniLM-L6-v2"}
+    )
+    assert embeddings == [pytest.approx([0.6, 0.8]), pytest.approx([0.0, 1.0])]
+
+
+async def test_embed_empty(client):
+    """Test no request is made for an empty input."""
+    client._client.post = AsyncMock()
+    assert await client.embed([]) == []
+    client._client.post.assert_not_called()
+
+
+async def test_embed_http_error(client):
+    """Test server errors are raised so callers can fall back."""
+    client._client.post = AsyncMock(return_value=_response({"error": "boom"}, status_code=500))
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.embed(["text"])
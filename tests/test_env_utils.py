@@ -0,0 +1,11 @@
+from unittest.mock import patch
+from utils.env_utils import load_env
+
+
+def test_load_env_parses_once():
+    load_env.cache_clear()
+    with patch("utils.env_utils.load_dotenv", return_value=True) as mock_load_dotenv:
+        assert load_env() is True
+        assert load_env() is True
+    mock_load_dotenv.assert_called_once()
+    load_env.cache_clear()
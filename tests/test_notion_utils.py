@@ -1,17 +1,28 @@
 import pytest
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 import asyncio
-from utils.notion_utils import NotionUtils
-
-@pytest.fixture
+import httpx
+from notion_client.errors import HTTPResponseError
+from utils.notion_utils import (
+    NotionUtils, AsyncRateLimiter, FastJSONAsyncClient, call_with_retry, create_notion_client
+)
+
+@pytest.fixture(autouse=True)
+def no_rate_limit():
+    # Keep the shared Notion rate limiter from sleeping between test calls
+    with patch("utils.notion_utils.notion_rate_limiter", AsyncRateLimiter(0)):
+        yield
+
+@pytest.fixture(scope="module")
 def mock_client():
+    # The sync tests only exercise pure extraction helpers, so one client serves the module
     return MagicMock()
 
 @pytest.fixture
 def mock_async_client():
     return AsyncMock()
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def notion_utils(mock_client):
     return NotionUtils(mock_client)
 
@@ -21,49 +32,55 @@ def notion_utils_async(mock_async_client):
 
 # ==================== Page Property Extraction Tests ====================
 
-def test_extract_page_properties_title_and_rich_text(notion_utils):
-    page = {
-        "properties": {
-            "Title": {"type": "title", "title": [{"plain_text": "Hello"}]},
-            "Description": {"type": "rich_text", "rich_text": [{"plain_text": "World"}]},
-            "Number": {"type": "number", "number": 42},
-            "Select": {"type": "select", "select": {"name": "Option1"}},
-            "MultiSelect": {"type": "multi_select", "multi_select": [{"name": "A"}, {"name": "B"}]},
-            "Date": {"type": "date", "date": {"start": "2024-01-01", "end": "2024-01-02"}},
-            "Checkbox": {"type": "checkbox", "checkbox": True},
-            "Url": {"type": "url", "url": "https://example.com"},
-            "Email": {"type": "email", "email": "test@example.com"},
-            "Phone": {"type": "phone_number", "phone_number": "123456"},
-            "Relation": {"type": "relation", "relation": [{"id": "abc"}]},
-            "People": {"type": "people", "people": [{"id": "user1", "name": "John"}]},
-            "Files": {"type": "files", "files": [{"type": "file", "name": "file1", "file": {"url": "url1"}}]},
-            "CreatedTime": {"type": "created_time", "created_time": "2024-01-01T00:00:00Z"},
-            "LastEditedTime": {"type": "last_edited_time", "last_edited_time": "2024-01-02T00:00:00Z"},
-            "CreatedBy": {"type": "created_by", "created_by": {"id": "creator", "name": "Creator"}},
-            "LastEditedBy": {"type": "last_edited_by", "last_edited_by": {"id": "editor", "name": "Editor"}},
-            "Unknown": {"type": "unknown", "foo": "bar"}
-        }
-    }
-    props = notion_utils.extract_page_properties(page)
-    assert props["Title"] == "Hello"
-    assert props["Description"] == "World"
-    assert props["Number"] == 42
-    assert props["Select"] == "Option1"
-    assert props["MultiSelect"] == ["A", "B"]
-    assert props["Date"] == {"start": "2024-01-01", "end": "2024-01-02"}
-    assert props["Checkbox"] is True
-    assert props["Url"] == "https://example.com"
-    assert props["Email"] == "test@example.com"
-    assert props["Phone"] == "123456"
-    assert props["Relation"] == ["abc"]
-    assert props["People"] == ["John"]
-    assert props["Files"][0]["name"] == "file1"
-    assert props["Files"][0]["url"] == "url1"
-    assert props["CreatedTime"] == "2024-01-01T00:00:00Z"
-    assert props["LastEditedTime"] == "2024-01-02T00:00:00Z"
-    assert props["CreatedBy"] == "Creator"
-    assert props["LastEditedBy"] == "Editor"
-    assert props["Unknown"]["foo"] == "bar"
+@pytest.mark.parametrize("prop, expected", [
+    ({"type": "title", "title": [{"plain_text": "Hello"}]}, "Hello"),
+    ({"type": "rich_text", "rich_text": [{"plain_text": "World"}]}, "World"),
+    ({"type": "number", "number": 42}, 42),
+    ({"type": "select", "select": {"name": "Option1"}}, "Option1"),
+    ({"type": "multi_select", "multi_select": [{"name": "A"}, {"name": "B"}]}, ["A", "B"]),
+    ({"type": "date", "date": {"start": "2024-01-01", "end": "2024-01-02"}}, {"start": "2024-01-01", "end": "2024-01-02"}),
+    ({"type": "checkbox", "checkbox": True}, True),
+    ({"type": "url", "url": "https://example.com"}, "https://example.com"),
+    ({"type": "email", "email": "test@example.com"}, "test@example.com"),
+    ({"type": "phone_number", "phone_number": "123456"}, "123456"),
+    ({"type": "relation", "relation": [{"id": "abc"}]}, ["abc"]),
+    ({"type": "people", "people": [{"id": "user1", "name": "John"}]}, ["John"]),
+    ({"type": "files", "files": [{"type": "file", "name": "file1", "file": {"url": "url1"}}]}, {"names": ["file1"], "urls": ["url1"]}),
+    ({"type": "created_time", "created_time": "2024-01-01T00:00:00Z"}, "2024-01-01T00:00:00Z"),
+    ({"type": "last_edited_time", "last_edited_time": "2024-01-02T00:00:00Z"}, "2024-01-02T00:00:00Z"),
+    ({"type": "created_by", "created_by": {"id": "creator", "name": "Creator"}}, "Creator"),
+    ({"type": "last_edited_by", "last_edited_by": {"id": "editor", "name": "Editor"}}, "Editor"),
+    ({"type": "unknown", "foo": "bar"}, {"type": "unknown", "foo": "bar"}),
+], ids=lambda value: value["type"] if isinstance(value, dict) and "type" in value else None)
+def test_extract_page_properties_by_type(notion_utils, prop, expected):
+    props = notion_utils.extract_page_properties({"properties": {"Prop": prop}})
+    assert props["Prop"] == expected
+
+@pytest.mark.parametrize("prop, expected", [
+    ({"type": "select", "select": None}, None),
+    ({"type": "date", "date": None}, None),
+    ({"type": "multi_select", "multi_select": None}, []),
+    ({"type": "files", "files": None}, {"names": [], "urls": []}),
+    ({"type": "created_by", "created_by": None}, None),
+    ({"type": "last_edited_by"}, None),
+    ({"type": "formula", "formula": None}, None),
+    ({"type": "rollup", "rollup": None}, None),
+], ids=lambda value: value["type"] if isinstance(value, dict) and "type" in value else None)
+def test_extract_page_properties_null_values(notion_utils, prop, expected):
+    props = notion_utils.extract_page_properties({"properties": {"Prop": prop}})
+    assert props["Prop"] == expected
+
+def test_extract_files_property_layout(notion_utils):
+    prop = {"type": "files", "files": [
+        {"type": "file", "name": "a.pdf", "file": {"url": "https://files/a.pdf"}},
+        {"type": "external", "name": "b.png", "external": {"url": "https://example.com/b.png"}},
+    ]}
+    files = notion_utils.extract_page_properties({"properties": {"Files": prop}})["Files"]
+    assert files == {"names": ["a.pdf", "b.png"], "urls": ["https://files/a.pdf", "https://example.com/b.png"]}
+    assert NotionUtils.files_as_aos(files) == [
+        {"name": "a.pdf", "url": "https://files/a.pdf"},
+        {"name": "b.png", "url": "https://example.com/b.png"},
+    ]
 
 def test_extract_page_properties_formula_and_rollup(notion_utils):
     page = {
@@ -83,6 +100,11 @@ def test_extract_rich_text(notion_utils):
     assert notion_utils._extract_rich_text(rich_text) == "Hello, world!"
     assert notion_utils._extract_rich_text([]) == ""
 
+def test_extract_rich_text_missing_keys(notion_utils):
+    # Fragments without a type or plain_text take the general path and default sensibly
+    rich_text = [{"plain_text": "Hello"}, {"type": "text"}, {"type": "text", "plain_text": "!"}]
+    assert notion_utils._extract_rich_text(rich_text) == "Hello!"
+
 def test_extract_rich_text_with_mentions(notion_utils):
     rich_text = [
         {"type": "text", "plain_text": "Hello "},
@@ -163,6 +185,17 @@ def test_extract_block_content_code(notion_utils):
     assert content["language"] == "python"
     assert content["is_code"] is True
 
+@pytest.mark.parametrize("data, expected", [
+    ({"type": "file", "file": {"url": "https://files/a.png"}}, "https://files/a.png"),
+    ({"type": "external", "external": {"url": "https://example.com/b.png"}}, "https://example.com/b.png"),
+    ({"file": None}, None),
+])
+def test_extract_block_content_media_url(notion_utils, data, expected):
+    block = {"id": "img1", "type": "image", "image": {**data, "caption": []}}
+    content = notion_utils.extract_block_content(block)
+    assert content["url"] == expected
+    assert content["type_detail"] == "image"
+
 def test_extract_block_content_toggle(notion_utils):
     block = {
         "id": "toggle_block",
@@ -199,6 +232,8 @@ def test_extract_block_content_equation(notion_utils):
     assert content["is_equation"] is True
 
 def test_extract_block_content_synced_block_dedup(notion_utils):
+    # The instance is shared across the module, so start from a clean dedup set
+    notion_utils._synced_block_ids = set()
     # First synced block with an ID
     block1 = {
         "id": "sync1",
@@ -299,6 +334,20 @@ def test_extract_text_for_embedding(notion_utils):
     assert "Content" in text
     assert "main content" in text
 
+def test_extract_text_for_embedding_files_property(notion_utils):
+    files = notion_utils._extract_files_property({"files": [
+        {"name": "spec.pdf", "type": "file", "file": {"url": "https://files.example/spec.pdf"}},
+        {"name": "diagram.png", "type": "external", "external": {"url": "https://example.com/diagram.png"}}
+    ]})
+    page_data = {"properties": {"title": "Doc", "Attachments": files}, "markdown_content": ""}
+
+    text = notion_utils.extract_text_for_embedding(page_data)
+    assert "Attachments: spec.pdf, diagram.png" in text
+    assert "names" not in text
+
+    markdown = notion_utils.blocks_to_markdown([], page_metadata={"properties": {"Attachments": files}})
+    assert "- **Attachments**: spec.pdf, diagram.png" in markdown
+
 def test_clean_markdown_for_embedding(notion_utils):
     markdown = """# Header
 ## Subheader
@@ -320,7 +369,6 @@ code block
 
 # ==================== Database Schema Tests ====================
 
-@pytest.mark.asyncio
 async def test_get_database_schema(notion_utils_async, mock_async_client):
     mock_async_client.databases.retrieve = AsyncMock(return_value={
         "title": [{"plain_text": "Test DB"}],
@@ -360,9 +408,37 @@ async def test_get_database_schema(notion_utils_async, mock_async_client):
     assert schema["last_edited_time"] == "2024-01-02T00:00:00Z"
     assert schema["url"] == "https://notion.so/db"
 
-def test_build_filter(notion_utils):
-    f = notion_utils.build_filter("Status", "equals", "Done")
-    assert f == {"property": "Status", "equals": {"equals": "Done"}}
+async def test_get_database_schema_cached(notion_utils_async, mock_async_client):
+    mock_async_client.databases.retrieve = AsyncMock(return_value={"title": [], "properties": {}})
+
+    with patch("utils.notion_utils.time.monotonic", return_value=1000.0):
+        first = await notion_utils_async.get_database_schema("dbid")
+        second = await notion_utils_async.get_database_schema("dbid")
+    assert second is first
+    assert mock_async_client.databases.retrieve.await_count == 1
+
+    # Expired entries and explicit invalidation both refetch
+    with patch("utils.notion_utils.time.monotonic", return_value=1000.0 + notion_utils_async.schema_cache_ttl):
+        await notion_utils_async.get_database_schema("dbid")
+    assert mock_async_client.databases.retrieve.await_count == 2
+
+    notion_utils_async.invalidate_schema("dbid")
+    await notion_utils_async.get_database_schema("dbid")
+    assert mock_async_client.databases.retrieve.await_count == 3
+
+@pytest.mark.parametrize("filter_type, value, expected", [
+    ("equals", "Done", {"rich_text": {"equals": "Done"}}),
+    ("does_not_equal", "Done", {"rich_text": {"does_not_equal": "Done"}}),
+    ("is_empty", "ignored", {"rich_text": {"is_empty": True}}),
+    ("greater_than", 5, {"number": {"greater_than": 5}}),
+    ("on_or_after", "2024-01-01", {"date": {"on_or_after": "2024-01-01"}}),
+    ("checkbox_equals", True, {"checkbox": {"equals": True}}),
+])
+def test_build_filter(notion_utils, filter_type, value, expected):
+    f = notion_utils.build_filter("Status", filter_type, value)
+    assert f == {"property": "Status", **expected}
+
+def test_build_filter_unsupported(notion_utils):
     with pytest.raises(ValueError):
         notion_utils.build_filter("Status", "unsupported", "Done")
 
@@ -376,7 +452,6 @@ def test_build_sort(notion_utils):
 
 # ==================== Async Tests ====================
 
-@pytest.mark.asyncio
 async def test_fetch_all_blocks_recursive(notion_utils_async):
     # Mock the blocks.children.list response
     mock_response = {
@@ -399,7 +474,72 @@ async def test_fetch_all_blocks_recursive(notion_utils_async):
     assert blocks[0]["id"] == "block1"
     assert blocks[0]["text"] == "Test"
 
-@pytest.mark.asyncio
+async def test_fetch_all_blocks_recursive_fetches_children_concurrently(notion_utils_async):
+    # Two top-level toggles with children; their child fetches should overlap
+    top_level = {
+        "results": [
+            {"id": "toggle1", "type": "toggle", "has_children": True, "toggle": {"rich_text": []}},
+            {"id": "toggle2", "type": "toggle", "has_children": True, "toggle": {"rich_text": []}}
+        ],
+        "has_more": False,
+        "next_cursor": None
+    }
+    in_flight = 0
+    max_in_flight = 0
+
+    async def list_children(block_id, page_size, **kwargs):
+        nonlocal in_flight, max_in_flight
+        if block_id == "page123":
+            return top_level
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        child = {"id": f"{block_id}-child", "type": "paragraph", "has_children": False,
+                 "paragraph": {"rich_text": [{"plain_text": block_id}]}}
+        return {"results": [child], "has_more": False, "next_cursor": None}
+
+    notion_utils_async.client.blocks.children.list = list_children
+
+    blocks = await notion_utils_async.fetch_all_blocks_recursive("page123")
+
+    assert max_in_flight == 2
+    assert [b["id"] for b in blocks] == ["toggle1", "toggle2"]
+    assert [b["children"][0]["text"] for b in blocks] == ["toggle1", "toggle2"]
+
+async def test_fetch_all_blocks_recursive_bounds_child_fetches(mock_async_client, monkeypatch):
+    monkeypatch.setenv("NOTION_CONCURRENCY", "2")
+    notion_utils_async = NotionUtils(mock_async_client)
+    # Six toggles nested two levels deep; at most two child fetches may run at once
+    in_flight = 0
+    max_in_flight = 0
+
+    async def list_children(block_id, page_size, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        has_children = block_id.count("-") < 2
+        children = [{"id": f"{block_id}-{i}", "type": "toggle", "has_children": has_children,
+                     "toggle": {"rich_text": []}} for i in range(6)]
+        return {"results": children, "has_more": False, "next_cursor": None}
+
+    notion_utils_async.client.blocks.children.list = list_children
+
+    blocks = await notion_utils_async.fetch_all_blocks_recursive("page")
+
+    assert max_in_flight == 2
+    assert len(blocks) == 6
+    assert all(len(block["children"]) == 6 for block in blocks)
+
+def test_iter_blocks_depth_first(notion_utils):
+    blocks = [
+        {"id": "a", "children": [{"id": "a1", "children": [{"id": "a1x"}]}, {"id": "a2"}]},
+        {"id": "b", "children": []},
+    ]
+    assert [b["id"] for b in notion_utils.iter_blocks(blocks)] == ["a", "a1", "a1x", "a2", "b"]
+
 async def test_fetch_child_page_content(notion_utils_async):
     # Mock page retrieve
     mock_page = {
@@ -426,7 +566,6 @@ async def test_fetch_child_page_content(notion_utils_async):
     # Check cache was populated
     assert "child123" in notion_utils_async._page_cache
 
-@pytest.mark.asyncio
 async def test_extract_complete_page_data(notion_utils_async):
     # Mock page retrieve
     mock_page = {
@@ -459,3 +598,82 @@ async def test_extract_complete_page_data(notion_utils_async):
     assert page_data["properties"]["title"] == "Test Page"
     assert len(page_data["blocks"]) == 1
     assert "markdown_content" in page_data
+
+
+# ==================== Request Retry Tests ====================
+
+def _http_error(status):
+    # Constructor arguments differ between notion-client versions, so only set the status
+    error = HTTPResponseError.__new__(HTTPResponseError)
+    error.status = status
+    return error
+
+async def test_call_with_retry_retries_rate_limit():
+    func = AsyncMock(side_effect=[_http_error(429), {"results": []}])
+    with patch("utils.notion_utils.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        result = await call_with_retry(func, block_id="abc")
+    assert result == {"results": []}
+    assert func.call_count == 2
+    mock_sleep.assert_awaited_once_with(1.0)
+
+async def test_call_with_retry_gives_up():
+    func = AsyncMock(side_effect=_http_error(502))
+    with patch("utils.notion_utils.asyncio.sleep", new_callable=AsyncMock):
+        with pytest.raises(HTTPResponseError):
+            await call_with_retry(func, max_retries=2)
+    assert func.call_count == 3
+
+async def test_call_with_retry_does_not_retry_client_errors():
+    func = AsyncMock(side_effect=_http_error(404))
+    with pytest.raises(HTTPResponseError):
+        await call_with_retry(func)
+    assert func.call_count == 1
+
+
+# ==================== Rate Limiter Tests ====================
+
+async def test_rate_limiter_allows_burst_then_spaces_calls():
+    limiter = AsyncRateLimiter(rate=2, burst=2)
+    with patch("utils.notion_utils.time.monotonic", return_value=100.0), \
+         patch("utils.notion_utils.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        await limiter.acquire()
+        await limiter.acquire()
+        mock_sleep.assert_not_awaited()
+        await limiter.acquire()
+        await limiter.acquire()
+    assert [call.args[0] for call in mock_sleep.await_args_list] == [0.5, 1.0]
+
+async def test_rate_limiter_disabled():
+    limiter = AsyncRateLimiter(rate=0)
+    with patch("utils.notion_utils.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        for _ in range(10):
+            await limiter.acquire()
+    mock_sleep.assert_not_awaited()
+
+
+# ==================== Client Tests ====================
+
+def _mock_http_client(status, body):
+    return httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(status, content=body, headers={"content-type": "application/json"})
+    ))
+
+async def test_fast_json_client_parses_success():
+    pytest.importorskip("orjson")
+    client = FastJSONAsyncClient(auth="key", client=_mock_http_client(200, b'{"object": "user", "id": "u1"}'))
+    assert await client.users.me() == {"object": "user", "id": "u1"}
+
+async def test_fast_json_client_raises_sdk_errors():
+    pytest.importorskip("orjson")
+    body = b'{"object": "error", "status": 404, "code": "object_not_found", "message": "Missing"}'
+    client = FastJSONAsyncClient(auth="key", client=_mock_http_client(404, body))
+    with pytest.raises(HTTPResponseError):
+        await client.users.me()
+
+def test_create_notion_client_uses_fast_json_client():
+    pytest.importorskip("orjson")
+    assert isinstance(create_notion_client("key"), FastJSONAsyncClient)
+
+def test_create_notion_client_disables_sdk_retries():
+    # call_with_retry retries under the shared rate limit; SDK retries would stack on top
+    assert create_notion_client("key")._max_retries == 0
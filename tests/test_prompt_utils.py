@@ -139,3 +139,10 @@ class TestPromptUtilsIntegration:
         
         assert isinstance(identify_prompt, str)
         assert isinstance(question_prompt, str)
+    
+    def test_identify_prompt_is_cached(self):
+        """Test that repeated messages reuse the cached identify prompt."""
+        first = PromptUtils.build_identify_prompt("Cached message")
+        second = PromptUtils.build_identify_prompt("Cached message")
+        
+        assert first is second
@@ -1,13 +1,23 @@
+import os
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
-import os
-import sys
+import asyncio
+import copy
+from collections import OrderedDict
+
+from services.rag_service import RAGService, get_rag_service
+from utils.cache_utils import SemanticAnswerCache
 
-# Ensure the services directory is in sys.path for import
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../services")))
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+class _AsyncReturn:
+    """Async stand-in returning a fixed value and counting its calls"""
 
-from services.rag_service import RAGService
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.value
 
 @pytest.fixture
 def mock_env(monkeypatch):
@@ -16,22 +26,44 @@ def mock_env(monkeypatch):
     monkeypatch.setenv("MAX_CONTEXT_CHUNKS", "2")
     monkeypatch.setenv("MIN_SIMILARITY_SCORE", "0.5")
 
-@pytest.fixture
-def rag_service(mock_env):
-    with patch("services.rag_service.VectorDB") as MockVectorDB, \
+@pytest.fixture(scope="module")
+def _rag_service_template():
+    # Build the patched RAGService once per module; tests get cheap copies of it
+    with patch.dict(os.environ, {
+            "GOOGLE_API_KEY": "test_google_api_key",
+            "GOOGLE_MODEL": "test_google_model",
+            "MAX_CONTEXT_CHUNKS": "2",
+            "MIN_SIMILARITY_SCORE": "0.5"
+         }), \
+         patch("services.rag_service.get_vector_db"), \
          patch("services.rag_service.genai") as mock_genai:
-        # Mock the vector DB
-        mock_vector_db = MockVectorDB.return_value
-        # Mock the generative model
-        mock_model = MagicMock()
-        mock_genai.GenerativeModel.return_value = mock_model
         mock_genai.configure.return_value = None
-        return RAGService()
+        service = RAGService()
+    return service
 
-@pytest.mark.asyncio
-async def test_answer_question_with_results(rag_service):
-    # Patch vector_search to return mock results
-    mock_results = [
+@pytest.fixture
+def rag_service(_rag_service_template):
+    service = copy.copy(_rag_service_template)
+    # Mock the vector DB
+    service.vector_db = MagicMock()
+    service.vector_db.embed_query = _AsyncReturn([0.1, 0.2, 0.3])
+    service.vector_db.content_version = 0
+    # Mock the generative model
+    service.model = MagicMock()
+    # Fresh caches so answers don't leak between tests
+    service.answer_cache = SemanticAnswerCache()
+    service._cache_version = 0
+    service._intent_cache = OrderedDict()
+    service._inflight = {}
+    service._pending_searches = None
+    service._flush_tasks = set()
+    service._searches_running = 0
+    return service
+
+@pytest.fixture(scope="module")
+def sample_search_results():
+    # Shared, read-only search results; tests must not mutate them
+    return [
         {
             "chunk_id": "1",
             "notion_page_id": "page1",
@@ -46,8 +78,11 @@ async def test_answer_question_with_results(rag_service):
             "last_edited_time": "2024-01-01T00:00:00Z"
         }
     ]
-    rag_service.vector_db.vector_search = AsyncMock(return_value=mock_results)
-    rag_service.model.generate_content_async = AsyncMock(return_value=MagicMock(text="The answer is 42."))
+
+async def test_answer_question_with_results(rag_service, sample_search_results):
+    # Patch vector_search to return mock results
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+    rag_service.model.generate_content_async = _AsyncReturn(MagicMock(text="The answer is 42."))
 
     result = await rag_service.answer_question("What is the answer?")
     assert result["answer"] == "The answer is 42."
@@ -57,33 +92,110 @@ async def test_answer_question_with_results(rag_service):
     assert result["search_results_count"] == 1
     assert result["model_used"] == rag_service.model_name
 
-@pytest.mark.asyncio
+async def test_answer_question_served_from_cache(rag_service, sample_search_results):
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+    rag_service.model.generate_content_async = _AsyncReturn(MagicMock(text="The answer is 42."))
+
+    first = await rag_service.answer_question("What is the answer?")
+    second = await rag_service.answer_question("What is the answer?")
+    assert second == first
+    assert rag_service.vector_db.vector_search.calls == 1
+    assert rag_service.model.generate_content_async.calls == 1
+
+async def test_answer_cache_cleared_after_sync(rag_service, sample_search_results):
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+    rag_service.model.generate_content_async = _AsyncReturn(MagicMock(text="The answer is 42."))
+
+    await rag_service.answer_question("What is the answer?")
+    # A sync writing new content bumps the knowledge base version
+    rag_service.vector_db.content_version += 1
+    await rag_service.answer_question("What is the answer?")
+    assert rag_service.vector_db.vector_search.calls == 2
+    assert rag_service.model.generate_content_async.calls == 2
+
+async def test_answer_question_when_embedding_fails(rag_service, sample_search_results):
+    rag_service.vector_db.embed_query = AsyncMock(side_effect=Exception("model unavailable"))
+    rag_service.vector_db.vector_search = AsyncMock(return_value=sample_search_results)
+    rag_service.model.generate_content_async = _AsyncReturn(MagicMock(text="The answer is 42."))
+
+    result = await rag_service.answer_question("What is the answer?")
+    assert result["answer"] == "The answer is 42."
+    # vector_search gets no embedding, so it embeds or falls back to text search itself
+    assert rag_service.vector_db.vector_search.call_args.kwargs["query_embedding"] is None
+    assert len(rag_service.answer_cache) == 0
+
+async def test_answer_question_coalesces_inflight(rag_service):
+    release = asyncio.Event()
+
+    async def slow_search(**kwargs):
+        await release.wait()
+        return []
+
+    rag_service.vector_db.vector_search = AsyncMock(side_effect=slow_search)
+
+    first = asyncio.create_task(rag_service.answer_question("What is the answer?"))
+    second = asyncio.create_task(rag_service.answer_question("  what is the answer?"))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(first, second)
+
+    assert results[0] == results[1]
+    rag_service.vector_db.vector_search.assert_called_once()
+    assert rag_service._inflight == {}
+
+async def test_answer_question_inflight_error_shared(rag_service):
+    release = asyncio.Event()
+
+    async def failing_search(**kwargs):
+        await release.wait()
+        raise Exception("Search failed")
+
+    rag_service.vector_db.vector_search = AsyncMock(side_effect=failing_search)
+
+    first = asyncio.create_task(rag_service.answer_question("What is the answer?"))
+    second = asyncio.create_task(rag_service.answer_question("What is the answer?"))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(first, second, return_exceptions=True)
+
+    assert all(isinstance(result, Exception) for result in results)
+    rag_service.vector_db.vector_search.assert_called_once()
+
 async def test_answer_question_no_results(rag_service):
-    rag_service.vector_db.vector_search = AsyncMock(return_value=[])
+    rag_service.vector_db.vector_search = _AsyncReturn([])
     result = await rag_service.answer_question("Unknown question?")
     assert "couldn't find relevant information" in result["answer"]
     assert result["sources"] == []
     assert result["context_used"] is False
     assert result["search_results_count"] == 0
 
-@pytest.mark.asyncio
-async def test_generate_answer_error(rag_service):
-    rag_service.vector_db.vector_search = AsyncMock(return_value=[
-        {
-            "chunk_id": "1",
-            "notion_page_id": "page1",
-            "notion_database_id": "db1",
-            "chunk_text": "This is a relevant chunk.",
-            "similarity_score": 0.9,
-            "page_url": "http://example.com/page1",
-            "page_properties": {},
-            "chunk_index": 0,
-            "last_edited_time": "2024-01-01T00:00:00Z"
-        }
-    ])
-    rag_service.model.generate_content_async = AsyncMock(side_effect=Exception("Generation error"))
+async def test_generate_answer_error(rag_service, sample_search_results):
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+    async def failing_generate(*args, **kwargs):
+        raise Exception("Generation error")
+
+    rag_service.model.generate_content_async = failing_generate
     result = await rag_service.answer_question("What is the answer?")
     assert "error while generating the answer" in result["answer"]
+    # Failed generations must not be cached
+    assert len(rag_service.answer_cache) == 0
+
+class _EmptyResponse:
+    """Gemini response whose candidate was cut off before any text, as when thinking uses the budget"""
+    candidates = [MagicMock(finish_reason="MAX_TOKENS")]
+
+    @property
+    def text(self):
+        raise ValueError("The candidate has no parts")
+
+async def test_generate_answer_empty_candidate(rag_service, sample_search_results):
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+    rag_service.model.generate_content_async = _AsyncReturn(_EmptyResponse())
+
+    result = await rag_service.answer_question("What is the answer?")
+    assert "error while generating the answer" in result["answer"]
+    assert "MAX_TOKENS" in result["answer"]
+    assert len(rag_service.answer_cache) == 0
 
 def test_extract_rich_text(rag_service):
     rich_text = [
@@ -98,4 +210,156 @@ def test_build_prompt(rag_service):
     context = "Context 1: AI is artificial intelligence."
     prompt = rag_service._build_prompt(question, context)
     assert "What is AI?" in prompt
-    assert "AI is artificial intelligence." in prompt
\ No newline at end of file
+    assert "AI is artificial intelligence." in prompt
+async def test_identify_message_sync_fast_path(rag_service):
+    rag_service.model.generate_content_async = AsyncMock()
+    assert await rag_service.identify_message("  Sync ") == "SYNC"
+    assert await rag_service.identify_message("synchronize!") == "SYNC"
+    rag_service.model.generate_content_async.assert_not_called()
+
+async def test_identify_message_cached(rag_service):
+    rag_service.model.generate_content_async = AsyncMock(return_value=MagicMock(text=" QUERY \n"))
+    assert await rag_service.identify_message("What is   AI?") == "QUERY"
+    assert await rag_service.identify_message("what is ai?") == "QUERY"
+    rag_service.model.generate_content_async.assert_called_once()
+
+async def test_stream_answer_yields_chunks_and_caches(rag_service):
+    rag_service.vector_db.vector_search = AsyncMock(return_value=[
+        {"chunk_id": "1", "notion_page_id": "page1", "chunk_text": "Relevant chunk.", "similarity_score": 0.9}
+    ])
+
+    async def fake_stream():
+        for text in ["The answer ", "is 42."]:
+            yield MagicMock(text=text)
+
+    rag_service.model.generate_content_async = AsyncMock(return_value=fake_stream())
+
+    chunks = [chunk async for chunk in rag_service.stream_answer("What is the answer?")]
+    assert chunks == ["The answer ", "is 42."]
+    assert rag_service.model.generate_content_async.call_args.kwargs["stream"] is True
+
+    # A repeated question is answered from the cache without calling the model
+    rag_service.model.generate_content_async.reset_mock()
+    chunks = [chunk async for chunk in rag_service.stream_answer("What is the answer?")]
+    assert chunks == ["The answer is 42."]
+    rag_service.model.generate_content_async.assert_not_called()
+
+async def test_stream_answer_empty_candidate_not_cached(rag_service, sample_search_results):
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+
+    async def empty_stream():
+        yield _EmptyResponse()
+
+    rag_service.model.generate_content_async = AsyncMock(return_value=empty_stream())
+
+    chunks = [chunk async for chunk in rag_service.stream_answer("What is the answer?")]
+    assert len(chunks) == 1
+    assert "error while generating the answer" in chunks[0]
+    assert "MAX_TOKENS" in chunks[0]
+    assert len(rag_service.answer_cache) == 0
+
+async def test_stream_answer_error_mid_stream(rag_service, sample_search_results):
+    rag_service.vector_db.vector_search = _AsyncReturn(sample_search_results)
+
+    async def failing_stream():
+        yield MagicMock(text="The answer ")
+        raise Exception("connection reset")
+
+    rag_service.model.generate_content_async = AsyncMock(return_value=failing_stream())
+
+    chunks = [chunk async for chunk in rag_service.stream_answer("What is the answer?")]
+    assert chunks[0] == "The answer "
+    assert "error while generating the answer: connection reset" in chunks[-1]
+    assert len(rag_service.answer_cache) == 0
+
+async def test_stream_answer_no_results(rag_service):
+    rag_service.vector_db.vector_search = _AsyncReturn([])
+    chunks = [chunk async for chunk in rag_service.stream_answer("Unknown?")]
+    assert chunks == ["I couldn't find relevant information in your knowledge base to answer this question."]
+
+def test_get_rag_service_returns_shared_instance(mock_env):
+    get_rag_service.cache_clear()
+    with patch("services.rag_service.RAGService") as MockRAGService:
+        assert get_rag_service() is get_rag_service()
+        MockRAGService.assert_called_once()
+    get_rag_service.cache_clear()
+
+async def test_answer_question_bounds_context(rag_service):
+    rag_service.max_context_chars = 100
+    rag_service.vector_db.vector_search = AsyncMock(return_value=[
+        {"chunk_id": "1", "notion_page_id": "page1", "chunk_text": "a" * 20, "similarity_score": 0.9},
+        {"chunk_id": "2", "notion_page_id": "page2", "chunk_text": "b" * 500, "similarity_score": 0.8}
+    ])
+    rag_service.model.generate_content_async = AsyncMock(return_value=MagicMock(text="Answer"))
+
+    await rag_service.answer_question("Long context?")
+
+    prompt = rag_service.model.generate_content_async.call_args.args[0]
+    # The short chunk's unused share rolls over to the long one
+    assert "a" * 20 in prompt
+    assert "b" * 80 in prompt
+    assert "b" * 81 not in prompt
+    config = rag_service.model.generate_content_async.call_args.kwargs["generation_config"]
+    assert config is rag_service._answer_config
+
+def test_generation_configs_built_once(mock_env, monkeypatch):
+    monkeypatch.setenv("ANSWER_MAX_TOKENS", "256")
+    with patch("services.rag_service.get_vector_db"):
+        service = RAGService()
+    assert service._answer_config.max_output_tokens == 256
+    assert service._answer_config.temperature == 0.2
+    assert service._classify_config.temperature == 0.0
+
+async def test_similar_questions_share_vector_search(rag_service):
+    rag_service.query_group_window = 0.05
+    rag_service.vector_db.vector_search = _AsyncReturn([
+        {"chunk_id": "1", "notion_page_id": "page1", "chunk_text": "Shared chunk.", "similarity_score": 0.9}
+    ])
+    rag_service.model.generate_content_async = _AsyncReturn(MagicMock(text="Answer"))
+
+    results = await asyncio.gather(
+        rag_service.answer_question("How do I reset my password?"),
+        rag_service.answer_question("How can I reset my password?")
+    )
+
+    assert rag_service.vector_db.vector_search.calls == 1
+    assert all(result["sources"][0]["chunk_id"] == "1" for result in results)
+    assert rag_service.model.generate_content_async.calls == 2
+
+async def test_dissimilar_questions_search_separately(rag_service):
+    rag_service.query_group_window = 0.05
+    rag_service.vector_db.embed_query = AsyncMock(side_effect=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    rag_service.vector_db.vector_search = _AsyncReturn([])
+
+    await asyncio.gather(
+        rag_service.answer_question("How do I reset my password?"),
+        rag_service.answer_question("What is the refund policy?")
+    )
+
+    assert rag_service.vector_db.vector_search.calls == 2
+
+async def test_grouped_search_uses_question_embedding(rag_service):
+    rag_service.query_group_window = 0.05
+    rag_service.vector_db.vector_search = AsyncMock(return_value=[])
+
+    await asyncio.gather(
+        rag_service._search("first", [1.0, 0.0, 0.0]),
+        rag_service._search("second", [0.99, 0.01, 0.0])
+    )
+
+    # The group searches with a real question's embedding, not an averaged one
+    rag_service.vector_db.vector_search.assert_awaited_once()
+    assert rag_service.vector_db.vector_search.call_args.kwargs["query_embedding"] == [1.0, 0.0, 0.0]
+
+async def test_cancelled_search_flush_cancels_waiters(rag_service):
+    rag_service.query_group_window = 0.05
+    # Another search is running, so the flush waits out the window
+    rag_service._searches_running = 1
+    search = asyncio.create_task(rag_service._search("Q?", [0.1, 0.2, 0.3]))
+    await asyncio.sleep(0)
+    for task in list(rag_service._flush_tasks):
+        task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(search, timeout=1)
+    assert rag_service._pending_searches is None
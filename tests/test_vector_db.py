@@ -1,88 +1,229 @@
+import copy
+from collections import OrderedDict
+import os
 import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
-from vector_db import VectorDB
+import numpy as np
+from datetime import datetime
+from bson.binary import VECTOR_SUBTYPE, BinaryVectorDtype
+from pymongo import DeleteMany
+from vector_db import VectorDB, get_vector_db
 
-@pytest.fixture
-def vector_db(monkeypatch):
+def _encode(texts, **kwargs):
+    # Return one embedding per input text, like SentenceTransformer.encode
+    if isinstance(texts, list):
+        return np.array([[0.1, 0.2, 0.3]] * len(texts))
+    return np.array([0.1, 0.2, 0.3])
+
+class _FakeTokenizer:
+    """One token per word, decoded back to the token indices"""
+
+    def encode(self, text):
+        return list(range(len(text.split())))
+
+    def decode(self, tokens):
+        return " ".join(str(t) for t in tokens)
+
+class _FakeDB(dict):
+    """Database stand-in; collections are looked up with a plain dict access"""
+
+    async def command(self, *args, **kwargs):
+        return {"storageSize": 12345}
+
+class _FakeMotorClient(dict):
+    """Motor client stand-in mapping database names to _FakeDB instances"""
+
+    def close(self):
+        pass
+
+class _FakeCursor:
+    """Minimal Motor cursor returning fixed documents"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, *args, **kwargs):
+        return self._data
+
+@pytest.fixture(scope="module")
+def _vector_db_template():
+    # Build the patched VectorDB once per module; tests get cheap copies of it
     # Patch MongoDB client and SentenceTransformer
-    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
-    monkeypatch.setenv("MONGODB_DATABASE", "test_db")
-    monkeypatch.setenv("MONGODB_COLLECTION", "test_collection")
-    monkeypatch.setenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-    monkeypatch.setenv("MAX_CHUNK_TOKENS", "10")
-    monkeypatch.setenv("CHUNK_OVERLAP_TOKENS", "2")
-    with patch("vector_db.AsyncIOMotorClient") as mock_motor, \
+    with patch.dict(os.environ, {
+            "MONGODB_URI": "mongodb://localhost:27017",
+            "MONGODB_DATABASE": "test_db",
+            "MONGODB_COLLECTION": "test_collection",
+            "EMBEDDING_MODEL": "all-MiniLM-L6-v2",
+            "MAX_CHUNK_TOKENS": "10",
+            "CHUNK_OVERLAP_TOKENS": "2"
+         }), \
+         patch("vector_db.AsyncIOMotorClient") as mock_motor, \
          patch("vector_db.SentenceTransformer") as mock_st, \
          patch("vector_db.tiktoken.get_encoding") as mock_encoding:
         # Mock embedding model
         mock_model = MagicMock()
         mock_model.get_sentence_embedding_dimension.return_value = 3
-        # Return a mock with .tolist()
-        mock_embedding = MagicMock()
-        mock_embedding.tolist.return_value = [0.1, 0.2, 0.3]
-        mock_model.encode.return_value = mock_embedding
         mock_st.return_value = mock_model
-        # Mock tokenizer
-        mock_tokenizer = MagicMock()
-        mock_tokenizer.encode.side_effect = lambda text: list(range(len(text.split())))
-        mock_tokenizer.decode.side_effect = lambda tokens: " ".join(str(t) for t in tokens)
+        # Plain tokenizer stub; chunking calls it in a loop and needs no call history
+        mock_tokenizer = _FakeTokenizer()
         mock_encoding.return_value = mock_tokenizer
-        # Mock MongoDB collection
-        mock_collection = MagicMock()
-        mock_db = MagicMock()
-        mock_motor.return_value.__getitem__.return_value = mock_db
-        mock_db.__getitem__.return_value = mock_collection
+        # Motor client and database stand-ins; each test swaps in its own collection mock
+        mock_motor.return_value = _FakeMotorClient({"test_db": _FakeDB({"test_collection": MagicMock()})})
         db = VectorDB()
-        db.collection = mock_collection
         db.embedding_model = mock_model
         db.tokenizer = mock_tokenizer
-        return db
+    return db
 
-def test_chunk_text_short(vector_db):
-    text = "short text"
-    chunks = vector_db.chunk_text(text)
-    assert chunks == ["short text"]
-
-def test_chunk_text_long(vector_db):
-    text = "a b c d e f g h i j k l"
-    # max_chunk_tokens=10, overlap=2, so expect 2 chunks
-    chunks = vector_db.chunk_text(text)
-    assert len(chunks) == 2
-
-def test_generate_embedding(vector_db):
-    emb = vector_db.generate_embedding("hello world")
-    assert emb == [0.1, 0.2, 0.3]
+@pytest.fixture
+def vector_db(_vector_db_template):
+    db = copy.copy(_vector_db_template)
+    # Give each test its own collection, embedding state and call history
+    db.collection = MagicMock()
+    db.embedding_model.reset_mock()
+    db.embedding_model.encode.side_effect = _encode
+    db._pending_encodes = None
+    db._flush_tasks = set()
+    db._encodes_running = 0
+    db._probe_embedding = None
+    db._query_embeddings = OrderedDict()
+    return db
 
-@pytest.mark.asyncio
-async def test_store_notion_page(vector_db):
-    page_data = {
+@pytest.fixture(scope="module")
+def sample_page_data():
+    # Shared, read-only page data; tests must not mutate it
+    return {
         "properties": {
             "Title": {"type": "title", "title": [{"plain_text": "Test"}]},
-            "Description": {"type": "rich_text", "rich_text": [{"plain_text": "Desc"}]}
+            "Description": {"type": "rich_text", "rich_text": [{"plain_text": "Desc"}]},
+            "Select": {"type": "select", "select": {"name": "Option"}},
+            "Multi": {"type": "multi_select", "multi_select": [{"name": "A"}, {"name": "B"}]}
         },
+        "content": [{"text": "Block1"}, {"text": "Block2"}],
         "url": "http://notion.so/page",
         "created_time": "2024-01-01T00:00:00Z",
         "last_edited_time": "2024-01-01T00:00:00Z"
     }
+
+@pytest.mark.parametrize("text, expected_chunks", [
+    ("short text", ["short text"]),
+    # max_chunk_tokens=10, overlap=2, so expect 2 chunks (the stub tokenizer decodes to token indices)
+    ("a b c d e f g h i j k l", ["0 1 2 3 4 5 6 7 8 9", "8 9 10 11"]),
+], ids=["short", "long"])
+def test_chunk_text(vector_db, text, expected_chunks):
+    assert vector_db.chunk_text(text) == expected_chunks
+
+def test_generate_embedding(vector_db):
+    emb = vector_db.generate_embedding("hello world")
+    assert emb == [0.1, 0.2, 0.3]
+
+def test_generate_embeddings_batch(vector_db):
+    embs = vector_db.generate_embeddings_batch(["hello", "world"], batch_size=2)
+    assert embs == [[0.1, 0.2, 0.3], [0.1, 0.2, 0.3]]
+    assert vector_db.generate_embeddings_batch([]) == []
+
+def test_generate_embeddings_batch_default_size(vector_db):
+    vector_db.embedding_batch_size = 8
+    vector_db.generate_embeddings_batch(["hello", "world"])
+    kwargs = vector_db.embedding_model.encode.call_args.kwargs
+    assert kwargs["batch_size"] == 8
+    assert kwargs["show_progress_bar"] is False
+
+async def test_generate_embeddings_batch_async_local(vector_db):
+    assert vector_db.embed_client is None
+    embs = await vector_db.generate_embeddings_batch_async(["hello", "world"])
+    assert embs == [[0.1, 0.2, 0.3], [0.1, 0.2, 0.3]]
+    assert await vector_db.generate_embedding_async("hello") == [0.1, 0.2, 0.3]
+
+async def test_generate_embeddings_batch_async_remote(vector_db):
+    vector_db.embed_client = MagicMock()
+    vector_db.embed_client.embed = AsyncMock(side_effect=lambda batch: [[1.0, 0.0, 0.0]] * len(batch))
+    embs = await vector_db.generate_embeddings_batch_async(["a", "b", "c"], batch_size=2)
+    assert embs == [[1.0, 0.0, 0.0]] * 3
+    assert vector_db.embed_client.embed.await_count == 2
+    vector_db.embedding_model.encode.assert_not_called()
+
+async def test_generate_embeddings_batch_async_remote_fallback(vector_db):
+    vector_db.embed_client = MagicMock()
+    vector_db.embed_client.embed = AsyncMock(side_effect=Exception("server down"))
+    embs = await vector_db.generate_embeddings_batch_async(["a"])
+    assert embs == [[0.1, 0.2, 0.3]]
+
+async def test_prepare_notion_page_up_to_date(vector_db):
+    vector_db.collection.find_one = AsyncMock(return_value={"last_edited_time": "2024-01-01T00:00:00Z"})
+    result = await vector_db.prepare_notion_page(
+        "pageid", {"last_edited_time": "2024-01-01T00:00:00Z", "markdown_content": "text"}
+    )
+    assert result == {"status": "skipped", "reason": "up_to_date"}
+
+async def test_prepare_notion_page_unchanged_content(vector_db):
+    import hashlib
+    content_hash = hashlib.sha256("same text".encode()).hexdigest()
+    vector_db.collection.find_one = AsyncMock(return_value={
+        "last_edited_time": "2024-01-01T00:00:00Z",
+        "content_hash": content_hash,
+        "embedding_model": vector_db.embedding_model_name
+    })
+    vector_db.collection.update_many = AsyncMock()
+    result = await vector_db.prepare_notion_page(
+        "pageid", {"last_edited_time": "2024-02-01T00:00:00Z", "markdown_content": "same text"}
+    )
+    assert result == {"status": "skipped", "reason": "unchanged_content"}
+    vector_db.collection.update_many.assert_awaited_once_with(
+        {"notion_page_id": "pageid"},
+        {"$set": {"last_edited_time": "2024-02-01T00:00:00Z"}}
+    )
+
+async def test_get_last_edited_times(vector_db):
+    vector_db.collection.aggregate = MagicMock(return_value=_FakeCursor([
+        {"_id": "p1", "last_edited_time": "2024-01-01"},
+        {"_id": "p2", "last_edited_time": "2024-01-02"}
+    ]))
+    result = await vector_db.get_last_edited_times(["p1", "p2"])
+    assert result == {"p1": "2024-01-01", "p2": "2024-01-02"}
+    assert await vector_db.get_last_edited_times([]) == {}
+
+async def test_store_notion_page(vector_db, sample_page_data):
     # Mock collection methods
     vector_db.collection.find_one = AsyncMock(return_value=None)
-    vector_db.collection.delete_many = AsyncMock()
-    vector_db.collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id="abc123"))
-    result = await vector_db.store_notion_page("pageid", page_data, "dbid")
+    vector_db.collection.bulk_write = AsyncMock()
+    version = vector_db.content_version
+    result = await vector_db.store_notion_page("pageid", sample_page_data, "dbid")
     assert result["status"] == "success"
     assert result["chunks_stored"] > 0
+    # Writes bump the version so the RAG answer cache drops stale answers
+    assert vector_db.content_version == version + 1
+    
+    # One round trip upserts every chunk and removes the page's stale chunks
+    vector_db.collection.bulk_write.assert_awaited_once()
+    operations = vector_db.collection.bulk_write.call_args[0][0]
+    chunk_ids = [f"pageid:{i}" for i in range(result["chunks_stored"])]
+    assert [chunk["chunk_id"] for chunk in result["chunks"]] == chunk_ids
+    assert operations[-1] == DeleteMany({"notion_page_id": "pageid", "_id": {"$nin": chunk_ids}})
+    assert operations[0]._filter == {"_id": "pageid:0"}
+    stored_doc = operations[0]._doc["$set"]
+    assert stored_doc["embedding"].subtype == VECTOR_SUBTYPE
+    assert stored_doc["embedding"].as_vector().data == pytest.approx([0.1, 0.2, 0.3])
+    assert len(stored_doc["content_hash"]) == 64
+    assert isinstance(stored_doc["stored_at"], datetime)
 
-def test_extract_text_from_page(vector_db):
-    page_data = {
-        "properties": {
-            "Title": {"type": "title", "title": [{"plain_text": "Test"}]},
-            "Description": {"type": "rich_text", "rich_text": [{"plain_text": "Desc"}]},
-            "Select": {"type": "select", "select": {"name": "Option"}},
-            "Multi": {"type": "multi_select", "multi_select": [{"name": "A"}, {"name": "B"}]}
-        },
-        "content": [{"text": "Block1"}, {"text": "Block2"}]
-    }
-    text = vector_db._extract_text_from_page(page_data)
+async def test_store_notion_page_reuses_chunk_token_counts(vector_db, sample_page_data):
+    vector_db.collection.find_one = AsyncMock(return_value=None)
+    vector_db.collection.bulk_write = AsyncMock()
+    text = vector_db._extract_text_from_page(sample_page_data)
+    with patch.object(vector_db.tokenizer, "encode", wraps=vector_db.tokenizer.encode) as encode:
+        result = await vector_db.store_notion_page("pageid", sample_page_data, "dbid")
+    # Only the chunking pass tokenizes; stored counts come from it
+    encode.assert_called_once_with(text)
+    assert [chunk["chunk_tokens"] for chunk in result["chunks"]] == vector_db._chunk_text_with_token_counts(text)[1]
+
+def test_extract_text_from_page(vector_db, sample_page_data):
+    text = vector_db._extract_text_from_page(sample_page_data)
     assert "Title: Test" in text
     assert "Description: Desc" in text
     assert "Select: Option" in text
@@ -95,11 +236,10 @@ def test_extract_rich_text(vector_db):
     assert vector_db._extract_rich_text(arr) == "AB"
     assert vector_db._extract_rich_text([]) == ""
 
-@pytest.mark.asyncio
 async def test_vector_search(vector_db):
     # Return a non-empty list with expected structure
     mock_result = [{
-        "_id": "id1",
+        "chunk_id": "id1",
         "notion_page_id": "pid",
         "notion_database_id": "dbid",
         "chunk_text": "chunk",
@@ -109,50 +249,206 @@ async def test_vector_search(vector_db):
         "chunk_index": 0,
         "last_edited_time": "2024-01-01"
     }]
-    mock_cursor = AsyncMock()
-    mock_cursor.to_list = AsyncMock(return_value=mock_result)
-    vector_db.collection.aggregate = MagicMock(return_value=mock_cursor)
+    vector_db.collection.aggregate = MagicMock(return_value=_FakeCursor(mock_result))
     result = await vector_db.vector_search("query")
-    assert isinstance(result, list)
-    assert result[0]["chunk_id"] == "id1"
+    assert result == mock_result
+    # Results are shaped by the server; _id is converted there and not returned
+    projection = vector_db.collection.aggregate.call_args.args[0][1]["$project"]
+    assert projection["_id"] == 0
+    assert projection["chunk_id"] == {"$toString": "$_id"}
+
+async def test_vector_search_num_candidates(vector_db):
+    vector_db.collection.aggregate = MagicMock(return_value=_FakeCursor([]))
+    vector_db.num_candidates_factor = 20
+    await vector_db.vector_search("query", limit=5, query_embedding=[0.1])
+    assert vector_db.collection.aggregate.call_args.args[0][0]["$vectorSearch"]["numCandidates"] == 100
+    projection = vector_db.collection.aggregate.call_args.args[0][1]["$project"]
+    assert "embedding" not in projection
+    assert projection["similarity_score"] == {"$meta": "vectorSearchScore"}
+    query_vector = vector_db.collection.aggregate.call_args.args[0][0]["$vectorSearch"]["queryVector"]
+    assert query_vector.as_vector().data == pytest.approx([0.1])
+
+    await vector_db.vector_search("query", limit=1000, query_embedding=[0.1])
+    assert vector_db.collection.aggregate.call_args.args[0][0]["$vectorSearch"]["numCandidates"] == 10000
 
-@pytest.mark.asyncio
 async def test_fallback_text_search(vector_db):
-    vector_db.collection.find = MagicMock(return_value=MagicMock(
-        sort=MagicMock(return_value=MagicMock(
-            limit=MagicMock(return_value=AsyncMock(to_list=AsyncMock(return_value=[
-                {
-                    "_id": "id2",
-                    "notion_page_id": "pid2",
-                    "notion_database_id": "dbid2",
-                    "chunk_text": "chunk2",
-                    "score": 0.8,
-                    "page_url": "url2",
-                    "page_properties": {},
-                    "chunk_index": 1,
-                    "last_edited_time": "2024-01-02"
-                }
-            ])))
-        ))
-    ))
+    vector_db.collection.aggregate = MagicMock(return_value=_FakeCursor([
+        {
+            "chunk_id": "id2",
+            "notion_page_id": "pid2",
+            "notion_database_id": "dbid2",
+            "chunk_text": "chunk2",
+            "similarity_score": 0.8,
+            "page_url": "url2",
+            "page_properties": {},
+            "chunk_index": 1,
+            "last_edited_time": "2024-01-02"
+        }
+    ]))
     result = await vector_db._fallback_text_search("query", 1)
     assert isinstance(result, list)
     assert result[0]["chunk_id"] == "id2"
+    pipeline = vector_db.collection.aggregate.call_args.args[0]
+    assert pipeline[0]["$search"] == {"index": "default", "text": {"query": "query", "path": "chunk_text"}}
+    assert pipeline[1] == {"$limit": 1}
+    assert pipeline[2]["$project"]["similarity_score"] == {"$meta": "searchScore"}
+
+async def test_fallback_text_search_uses_text_index_without_atlas_search(vector_db):
+    vector_db.collection.aggregate = MagicMock(side_effect=Exception("index not found"))
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value = _FakeCursor([{"chunk_id": "id3", "similarity_score": 1.5}])
+    vector_db.collection.find = MagicMock(return_value=cursor)
+
+    result = await vector_db._fallback_text_search("query", 2)
+
+    assert [r["chunk_id"] for r in result] == ["id3"]
+    query_filter, projection = vector_db.collection.find.call_args.args
+    assert query_filter == {"$text": {"$search": "query"}}
+    assert projection["similarity_score"] == {"$meta": "textScore"}
+    cursor.sort.return_value.limit.assert_called_once_with(2)
 
-@pytest.mark.asyncio
 async def test_get_stats(vector_db):
-    vector_db.collection.count_documents = AsyncMock(return_value=5)
-    vector_db.collection.distinct = AsyncMock(side_effect=[["p1", "p2"], ["d1"]])
-    vector_db.db.command = AsyncMock(return_value={"storageSize": 12345})
+    vector_db.collection.aggregate = MagicMock(return_value=_FakeCursor([
+        {"total_chunks": [{"n": 5}], "unique_pages": [{"n": 2}], "unique_databases": [{"n": 1}]}
+    ]))
     stats = await vector_db.get_stats()
     assert stats["total_chunks"] == 5
     assert stats["unique_pages"] == 2
     assert stats["unique_databases"] == 1
     assert stats["storage_size_bytes"] == 12345
+    vector_db.collection.aggregate.assert_called_once()
+
+async def test_get_stats_empty_collection(vector_db):
+    vector_db.collection.aggregate = MagicMock(return_value=_FakeCursor([
+        {"total_chunks": [], "unique_pages": [], "unique_databases": []}
+    ]))
+    stats = await vector_db.get_stats()
+    assert (stats["total_chunks"], stats["unique_pages"], stats["unique_databases"]) == (0, 0, 0)
 
-@pytest.mark.asyncio
 async def test_delete_page(vector_db):
     vector_db.collection.delete_many = AsyncMock(return_value=MagicMock(deleted_count=3))
     result = await vector_db.delete_page("pid")
     assert result["status"] == "success"
-    assert result["deleted_chunks"] == 3
\ No newline at end of file
+    assert result["deleted_chunks"] == 3
+async def test_local_encodes_are_coalesced(vector_db):
+    import asyncio
+    results = await asyncio.gather(
+        vector_db.generate_embedding_async("first"),
+        vector_db.generate_embeddings_batch_async(["second", "third"]),
+    )
+    assert results[0] == [0.1, 0.2, 0.3]
+    assert results[1] == [[0.1, 0.2, 0.3], [0.1, 0.2, 0.3]]
+    vector_db.embedding_model.encode.assert_called_once()
+    assert vector_db.embedding_model.encode.call_args[0][0] == ["first", "second", "third"]
+
+async def test_local_encodes_run_one_batch_per_job(vector_db):
+    import asyncio
+    page, query = await asyncio.gather(
+        vector_db.generate_embeddings_batch_async([f"chunk {i}" for i in range(5)], batch_size=2),
+        vector_db.generate_embedding_async("query"),
+    )
+    assert len(page) == 5
+    assert query == [0.1, 0.2, 0.3]
+    # The query is encoded in the first job, ahead of the page's chunks
+    batches = [call.args[0] for call in vector_db.embedding_model.encode.call_args_list]
+    assert batches == [["query", "chunk 0"], ["chunk 1", "chunk 2"], ["chunk 3", "chunk 4"]]
+
+async def test_local_encode_error_propagates(vector_db):
+    vector_db.embedding_model.encode.side_effect = Exception("encode failed")
+    with pytest.raises(Exception, match="encode failed"):
+        await vector_db.generate_embedding_async("text")
+
+
+async def test_ensure_vector_index_logs_quantized_definition(vector_db, caplog):
+    vector_db.collection.create_index = AsyncMock()
+    vector_db.collection.list_indexes = MagicMock(return_value=MagicMock(to_list=AsyncMock(return_value=[])))
+    with caplog.at_level("INFO"):
+        await vector_db.ensure_vector_index()
+    assert "'quantization': 'scalar'" in caplog.text
+    vector_db.collection.create_index.assert_awaited_once_with(
+        [("notion_page_id", 1), ("chunk_index", 1)], name="page_chunk_idx"
+    )
+
+def test_to_bson_vector_int8(vector_db):
+    vector_db.embedding_storage_dtype = "int8"
+    embedding = [0.5, -0.25, 0.1, 0.0]
+    vector = vector_db.to_bson_vector(embedding)
+    assert vector.as_vector().dtype == BinaryVectorDtype.INT8
+    quantized = np.array(vector.as_vector().data, dtype=np.float32)
+    assert quantized.tolist() == [127, -64, 25, 0]
+    # Scaling is per vector and symmetric, so cosine similarity is preserved
+    original = np.array(embedding, dtype=np.float32)
+    cosine = quantized @ original / (np.linalg.norm(quantized) * np.linalg.norm(original))
+    assert cosine == pytest.approx(1.0, abs=1e-4)
+    assert vector_db.to_bson_vector([0.0, 0.0]).as_vector().data == [0, 0]
+    # A batch quantizes each vector against its own peak
+    batch = vector_db.to_bson_vectors([embedding, [0.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, -2.0]])
+    assert [vector.as_vector().data for vector in batch] == [[127, -64, 25, 0], [0, 0, 0, 0], [0, 64, 0, -127]]
+
+async def test_ensure_vector_index_int8_storage_skips_quantization(vector_db, caplog):
+    vector_db.embedding_storage_dtype = "int8"
+    vector_db.collection.create_index = AsyncMock()
+    vector_db.collection.list_indexes = MagicMock(return_value=MagicMock(to_list=AsyncMock(return_value=[])))
+    with caplog.at_level("INFO"):
+        await vector_db.ensure_vector_index()
+    assert "quantization" not in caplog.text
+
+def test_invalid_vector_quantization(monkeypatch):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
+    monkeypatch.setenv("VECTOR_QUANTIZATION", "int4")
+    with patch("vector_db.AsyncIOMotorClient"), \
+         patch("vector_db.SentenceTransformer"), \
+         patch("vector_db.tiktoken.get_encoding"):
+        with pytest.raises(ValueError):
+            VectorDB()
+
+@pytest.mark.parametrize("device, halved", [("cuda", True), ("cpu", False)])
+def test_embedding_model_half_precision_on_gpu(monkeypatch, device, halved):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
+    with patch("vector_db.AsyncIOMotorClient"), \
+         patch("vector_db.SentenceTransformer") as mock_st, \
+         patch("vector_db.tiktoken.get_encoding"):
+        mock_st.return_value.device.type = device
+        db = VectorDB()
+    assert mock_st.return_value.half.called is halved
+    assert (db.embedding_model is mock_st.return_value.half.return_value) is halved
+
+def test_get_vector_db_is_shared():
+    get_vector_db.cache_clear()
+    try:
+        with patch("vector_db.VectorDB") as mock_vector_db:
+            assert get_vector_db() is get_vector_db()
+        mock_vector_db.assert_called_once_with()
+    finally:
+        get_vector_db.cache_clear()
+
+def test_embedding_backend_from_env(monkeypatch):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
+    monkeypatch.setenv("EMBEDDING_BACKEND", "ONNX")
+    monkeypatch.setenv("EMBEDDING_MODEL_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+    with patch("vector_db.AsyncIOMotorClient"), \
+         patch("vector_db.SentenceTransformer") as mock_st, \
+         patch("vector_db.tiktoken.get_encoding"):
+        VectorDB()
+    assert mock_st.call_args.kwargs == {
+        "backend": "onnx",
+        "model_kwargs": {"file_name": "onnx/model_qint8_avx512_vnni.onnx"}
+    }
+
+async def test_embed_query_is_cached(vector_db):
+    vector_db.generate_embedding_async = AsyncMock(side_effect=lambda text: [float(len(text))])
+    vector_db.query_embedding_cache_size = 2
+    assert await vector_db.embed_query("what is  rag?") == [12.0]
+    assert await vector_db.embed_query(" what is rag? ") == [12.0]
+    vector_db.generate_embedding_async.assert_awaited_once_with("what is rag?")
+    
+    # Least recently used queries are evicted
+    await vector_db.embed_query("second")
+    await vector_db.embed_query("third")
+    assert list(vector_db._query_embeddings) == ["second", "third"]
+
+async def test_probe_embedding_is_cached(vector_db):
+    vector_db.generate_embedding_async = AsyncMock(return_value=[0.1, 0.2])
+    assert await vector_db.probe_embedding() == [0.1, 0.2]
+    assert await vector_db.probe_embedding() == [0.1, 0.2]
+    vector_db.generate_embedding_async.assert_awaited_once_with("test")
@@ -4,6 +4,8 @@ Unit tests for vector_service.py
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 import os
+import asyncio
+from contextlib import ExitStack
 
 
 @pytest.fixture
@@ -13,8 +15,18 @@ def mock_env(monkeypatch):
     monkeypatch.setenv("NOTION_DATABASE_IDS", "db1,db2")
 
 
+@pytest.fixture(scope="module")
+def _vector_service_patches():
+    """Patch the service's collaborators once for the whole module."""
+    with ExitStack() as stack:
+        yield {
+            name: stack.enter_context(patch(f"services.vector_service.{name}"))
+            for name in ("get_vector_db", "create_notion_client", "NotionUtils")
+        }
+
+
 @pytest.fixture
-def vector_service(mock_env):
+def vector_service(mock_env, _vector_service_patches):
     """Create VectorService instance with mocked dependencies."""
     # Create mock objects
     mock_vector_db = AsyncMock()
@@ -22,6 +34,7 @@ def vector_service(mock_env):
         "status": "success",
         "chunks_stored": 5
     }
+    mock_vector_db.get_last_edited_times.return_value = {}
     
     mock_notion_utils = AsyncMock()
     mock_notion_utils.extract_complete_page_data.return_value = {
@@ -40,19 +53,19 @@ def vector_service(mock_env):
     mock_notion_client.pages = MagicMock()
     mock_notion_client.pages.retrieve = AsyncMock()
     
-    with patch("services.vector_service.VectorDB", return_value=mock_vector_db), \
-         patch("services.vector_service.AsyncClient", return_value=mock_notion_client), \
-         patch("services.vector_service.NotionUtils", return_value=mock_notion_utils):
-        from services.vector_service import VectorService
-        service = VectorService()
-        # Store references for test access
-        service._mock_notion_client = mock_notion_client
-        service._mock_notion_utils = mock_notion_utils
-        service._mock_vector_db = mock_vector_db
-        yield service
+    _vector_service_patches["get_vector_db"].return_value = mock_vector_db
+    _vector_service_patches["create_notion_client"].return_value = mock_notion_client
+    _vector_service_patches["NotionUtils"].return_value = mock_notion_utils
+    
+    from services.vector_service import VectorService
+    service = VectorService()
+    # Store references for test access
+    service._mock_notion_client = mock_notion_client
+    service._mock_notion_utils = mock_notion_utils
+    service._mock_vector_db = mock_vector_db
+    return service
 
 
-@pytest.mark.asyncio
 async def test_vector_service_initialization(vector_service):
     """Test VectorService initializes correctly."""
     assert vector_service.db is not None
@@ -60,7 +73,6 @@ async def test_vector_service_initialization(vector_service):
     assert vector_service.notion_database_ids == ["db1", "db2"]
 
 
-@pytest.mark.asyncio
 async def test_start_sync_databases(vector_service):
     """Test start_sync_databases creates background tasks."""
     with patch("services.vector_service.asyncio") as mock_asyncio:
@@ -68,7 +80,22 @@ async def test_start_sync_databases(vector_service):
         mock_asyncio.create_task.assert_called()
 
 
-@pytest.mark.asyncio
+async def test_start_sync_databases_runs_tasks(vector_service):
+    """Test start_sync_databases schedules one tracked task per database."""
+    from services import vector_service as vector_service_module
+    vector_service._sync_database = AsyncMock()
+    vector_service_module._sync_tasks.clear()
+    
+    vector_service.start_sync_databases(force_update=False, page_limit=5)
+    assert len(vector_service_module._sync_tasks) == 2
+    await asyncio.gather(*vector_service_module._sync_tasks)
+    
+    assert vector_service._sync_database.await_count == 2
+    vector_service._sync_database.assert_any_await("db1", False, 5)
+    vector_service._sync_database.assert_any_await("db2", False, 5)
+    assert len(vector_service_module._sync_tasks) == 0
+
+
 async def test_vector_service_no_database_ids(monkeypatch):
     """Test VectorService with no database IDs configured."""
     monkeypatch.setenv("NOTION_API_KEY", "test_key")
@@ -81,15 +108,14 @@ async def test_vector_service_no_database_ids(monkeypatch):
     mock_notion_client.databases = MagicMock()
     mock_notion_client.databases.query = AsyncMock()
     
-    with patch("services.vector_service.VectorDB", return_value=mock_vector_db), \
-         patch("services.vector_service.AsyncClient", return_value=mock_notion_client), \
+    with patch("services.vector_service.get_vector_db", return_value=mock_vector_db), \
+         patch("services.vector_service.create_notion_client", return_value=mock_notion_client), \
          patch("services.vector_service.NotionUtils", return_value=mock_notion_utils):
         from services.vector_service import VectorService
         service = VectorService()
         assert service.notion_database_ids == []
 
 
-@pytest.mark.asyncio
 async def test_vector_service_no_api_key(monkeypatch):
     """Test VectorService with no API key configured."""
     monkeypatch.setenv("NOTION_API_KEY", "")
@@ -97,7 +123,7 @@ async def test_vector_service_no_api_key(monkeypatch):
     
     mock_vector_db = AsyncMock()
     
-    with patch("services.vector_service.VectorDB", return_value=mock_vector_db):
+    with patch("services.vector_service.get_vector_db", return_value=mock_vector_db):
         from services.vector_service import VectorService
         service = VectorService()
         assert service.notion_api_key == ""
@@ -105,7 +131,6 @@ async def test_vector_service_no_api_key(monkeypatch):
         assert not hasattr(service, 'notion') or service.notion is None
 
 
-@pytest.mark.asyncio
 async def test_sync_database_background_empty_database(vector_service):
     """Test _sync_database_background with empty database."""
     mock_response = {
@@ -126,7 +151,6 @@ async def test_sync_database_background_empty_database(vector_service):
     vector_service._mock_vector_db.store_notion_page.assert_not_called()
 
 
-@pytest.mark.asyncio
 async def test_sync_database_background_no_notion_client(vector_service):
     """Test _sync_database_background when notion client is not available."""
     # Remove notion client
@@ -142,3 +166,135 @@ async def test_sync_database_background_no_notion_client(vector_service):
     except AttributeError:
         # Expected if the code doesn't handle None client
         pass
+
+
+async def test_sync_database_background_batches_embeddings(vector_service):
+    """Test _sync_database_background embeds chunks of all pages in one batch."""
+    vector_service._mock_notion_client.databases.query.return_value = {
+        "results": [{"id": "page1"}, {"id": "page2"}],
+        "has_more": False,
+        "next_cursor": None
+    }
+    mock_db = vector_service._mock_vector_db
+    mock_db.prepare_notion_page.side_effect = [
+        {"status": "pending", "chunks": ["a", "b"]},
+        {"status": "pending", "chunks": ["c"]}
+    ]
+    mock_db.generate_embeddings_batch_async.return_value = [[1.0], [2.0], [3.0]]
+    mock_db.store_notion_page_with_embeddings.return_value = {
+        "status": "success",
+        "chunks_stored": 1
+    }
+    
+    await vector_service._sync_database_background(
+        database_id="db1",
+        force_update=True,
+        page_limit=10
+    )
+    
+    mock_db.generate_embeddings_batch_async.assert_awaited_once_with(["a", "b", "c"])
+    calls = mock_db.store_notion_page_with_embeddings.call_args_list
+    assert calls[0].kwargs["chunks"] == ["a", "b"]
+    assert calls[0].kwargs["embeddings"] == [[1.0], [2.0]]
+    assert calls[1].kwargs["chunks"] == ["c"]
+    assert calls[1].kwargs["embeddings"] == [[3.0]]
+
+
+async def test_sync_database_background_limits_concurrency(vector_service):
+    """Test _sync_database_background extracts pages concurrently up to the limit."""
+    vector_service.notion_concurrency = 2
+    vector_service._mock_notion_client.databases.query.return_value = {
+        "results": [{"id": f"page{i}"} for i in range(6)],
+        "has_more": False,
+        "next_cursor": None
+    }
+    
+    in_flight = 0
+    max_in_flight = 0
+    
+    async def extract(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"id": kwargs["page_id"]}
+    
+    vector_service._mock_notion_utils.extract_complete_page_data.side_effect = extract
+    vector_service._mock_vector_db.prepare_notion_page.return_value = {
+        "status": "skipped",
+        "reason": "up_to_date"
+    }
+    
+    await vector_service._sync_database_background(
+        database_id="db1",
+        force_update=False,
+        page_limit=10
+    )
+    
+    assert max_in_flight == 2
+    assert vector_service._mock_notion_utils.extract_complete_page_data.call_count == 6
+
+
+async def test_sync_database_background_stores_pages_concurrently(vector_service):
+    """Test _sync_database_background writes pages concurrently up to the limit."""
+    vector_service.store_concurrency = 2
+    vector_service._mock_notion_client.databases.query.return_value = {
+        "results": [{"id": f"page{i}"} for i in range(5)],
+        "has_more": False,
+        "next_cursor": None
+    }
+    mock_db = vector_service._mock_vector_db
+    mock_db.prepare_notion_page.return_value = {"status": "pending", "chunks": ["a"]}
+    mock_db.generate_embeddings_batch_async.return_value = [[1.0]] * 5
+    
+    in_flight = 0
+    max_in_flight = 0
+    
+    async def store(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"status": "success", "chunks_stored": 1}
+    
+    mock_db.store_notion_page_with_embeddings.side_effect = store
+    
+    await vector_service._sync_database_background(
+        database_id="db1",
+        force_update=True,
+        page_limit=10
+    )
+    
+    assert max_in_flight == 2
+    assert mock_db.store_notion_page_with_embeddings.await_count == 5
+
+
+async def test_sync_database_background_skips_unchanged_pages(vector_service):
+    """Test unchanged pages are skipped before their blocks are fetched."""
+    vector_service._mock_notion_client.databases.query.return_value = {
+        "results": [
+            {"id": "page1", "last_edited_time": "2024-01-01T00:00:00Z"},
+            {"id": "page2", "last_edited_time": "2024-02-01T00:00:00Z"}
+        ],
+        "has_more": False,
+        "next_cursor": None
+    }
+    mock_db = vector_service._mock_vector_db
+    mock_db.get_last_edited_times.return_value = {
+        "page1": "2024-01-01T00:00:00Z",
+        "page2": "2024-01-15T00:00:00Z"
+    }
+    mock_db.prepare_notion_page.return_value = {"status": "skipped", "reason": "no_content"}
+    
+    await vector_service._sync_database_background(
+        database_id="db1",
+        force_update=False,
+        page_limit=10
+    )
+    
+    mock_db.get_last_edited_times.assert_awaited_once_with(["page1", "page2"])
+    extract = vector_service._mock_notion_utils.extract_complete_page_data
+    extract.assert_awaited_once()
+    assert extract.call_args.kwargs["page_id"] == "page2"
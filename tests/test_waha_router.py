@@ -1,54 +1,59 @@
 import pytest
-import os
+import asyncio
+import json
 from unittest.mock import patch, AsyncMock, MagicMock
-from fastapi.testclient import TestClient
+import httpx
 
-# --- Global Mocks and Patches ---
-# We patch the service classes before they are instantiated in the waha router module.
-# This ensures that any code importing 'rag_service' or 'waha_service' gets our mock.
+# --- Global Mocks ---
+# The router creates its service instances at module level, so the test_client
+# fixture swaps these mocks in on the router module for the duration of this file.
 
 # Mock for RAGService
 mock_rag_service_instance = AsyncMock()
 mock_rag_service_instance.answer_question.return_value = {
     "answer": "This is a default test answer."
 }
-patch('services.rag_service.RAGService', return_value=mock_rag_service_instance).start()
 
 # Mock for WahaService
 mock_waha_service_instance = AsyncMock()
-patch('services.waha_service.WahaService', return_value=mock_waha_service_instance).start()
 
-# Mock for ChateryService (needed because main.py imports chatery_router)
-mock_chatery_service_instance = AsyncMock()
-patch('services.chatery_service.ChateryService', return_value=mock_chatery_service_instance).start()
+
+# --- Request Payloads ---
+# Serialized once at import so each request posts ready-made bytes
+PAYLOADS = {name: json.dumps(body).encode() for name, body in {
+    "whitelisted": {"event": "message", "payload": {"from": "1234567890@c.us", "body": "Hello, this is a test."}},
+    "non_whitelisted": {"event": "message", "payload": {"from": "1111111111@c.us", "body": "Unauthorized message."}},
+    "empty_message": {"event": "message", "payload": {}},
+    "ack": {"event": "ack", "payload": {}},
+    "failing": {"event": "message", "payload": {"from": "1234567890@c.us", "body": "This will fail."}},
+    "empty_sender": {"event": "message", "payload": {"from": "@c.us", "body": "Hello"}},
+    "hello": {"event": "message", "payload": {"from": "1234567890@c.us", "body": "Hello"}},
+}.items()}
+JSON_HEADERS = {"content-type": "application/json"}
+HEADERS = {**JSON_HEADERS, "X-API-KEY": "test-secret-key"}
 
 
 # --- Pytest Fixtures ---
 
 @pytest.fixture(scope="module")
-def test_client():
+async def test_client(app):
     """
-    Creates a TestClient for the FastAPI app.
-    This fixture has 'module' scope, so the app and environment variables
-    are set up only once per test file run, improving performance.
+    Creates an httpx.AsyncClient bound to the FastAPI app over ASGITransport.
+    The app itself comes from the session-scoped conftest fixture, so main is
+    imported once per pytest run.
     """
     # Patch the module-level constant in the security module directly.
     # This is crucial because security.py reads the environment variable at import time.
-    # We also patch os.environ for completeness.
+    # The shared session app fixture supplies the router environment.
+    # MonkeyPatch.context undoes the swaps at module teardown so later test files see the real services.
     with patch('security.API_SECRET_KEY', 'test-secret-key', create=True), \
-         patch.dict(os.environ, {
-            "API_SECRET_KEY": "test-secret-key",
-            "WHITELISTED_NUMBERS": "1234567890,9876543210", # Default whitelist for tests
-            "WAHA_API_URL": "http://test.waha.api",
-            "WAHA_SESSION_NAME": "test-session",
-            "CHATERY_API_URL": "https://test.chatery.api",
-            "CHATERY_API_KEY": "test-chatery-key",
-            "CHATERY_PHONE_NUMBER_ID": "test-phone-id"
-        }):
-        # Import the app inside the fixture to ensure patches are active
-        from main import app
-        client = TestClient(app)
-        yield client
+         pytest.MonkeyPatch.context() as mp:
+        mp.setattr('routers.waha_router.rag_service', mock_rag_service_instance)
+        mp.setattr('routers.waha_router.waha_service', mock_waha_service_instance)
+        mp.setattr('routers.waha_router.vectorService', MagicMock())
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
 
 @pytest.fixture(autouse=True)
 def reset_mocks():
@@ -58,125 +63,123 @@ def reset_mocks():
     """
     mock_rag_service_instance.reset_mock()
     mock_waha_service_instance.reset_mock()
-    mock_chatery_service_instance.reset_mock()
+    mock_rag_service_instance.answer_question.side_effect = None
 
 
 # --- Test Cases ---
 
-@pytest.mark.asyncio
 async def test_receive_whitelisted_message(test_client):
     """
     Test receiving a valid message from a whitelisted number.
     It should call the RAG service and then the WAHA reply service.
     """
-    # Arrange: Define the payload for a whitelisted number
-    payload = {
-        "event": "message",
-        "payload": {
-            "from": "1234567890@c.us",
-            "body": "Hello, this is a test."
-        }
-    }
-    headers = {"X-API-KEY": "test-secret-key"}
+    # Arrange: Use the payload for a whitelisted number
     mock_rag_service_instance.answer_question.return_value = {"answer": "Test answer from RAG."}
 
     # Act: Send the request to the webhook
-    response = test_client.post("/waha/webhook", json=payload, headers=headers)
+    response = await test_client.post("/waha/webhook", content=PAYLOADS["whitelisted"], headers=HEADERS)
 
     # Assert: Check the outcome
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
-@pytest.mark.asyncio
-async def test_receive_non_whitelisted_message(test_client):
+async def test_webhook_matrix(test_client):
     """
-    Test receiving a message from a non-whitelisted number.
-    It should not call any services and log a warning (logging is not asserted here).
+    Test the webhook requests that must not reach any service, sent concurrently.
+    Covers a non-whitelisted sender, a wrong or missing API key and a non-message event.
     """
-    # Arrange
-    payload = {
-        "event": "message",
-        "payload": {
-            "from": "1111111111@c.us", # Not in the default whitelist
-            "body": "Unauthorized message."
-        }
-    }
-    headers = {"X-API-KEY": "test-secret-key"}
+    # Arrange: (payload, headers, expected status, expected body)
+    cases = [
+        (PAYLOADS["non_whitelisted"], HEADERS, 200, {"status": "ok"}),
+        (
+            PAYLOADS["empty_message"], {**JSON_HEADERS, "X-API-KEY": "wrong-secret-key"},
+            403, {"detail": "Could not validate credentials"}
+        ),
+        (PAYLOADS["empty_message"], JSON_HEADERS, 401, None),
+        (PAYLOADS["ack"], HEADERS, 200, {"status": "ok"}),
+    ]
 
     # Act
-    response = test_client.post("/waha/webhook", json=payload, headers=headers)
+    responses = await asyncio.gather(*[
+        test_client.post("/waha/webhook", content=payload, headers=case_headers)
+        for payload, case_headers, _, _ in cases
+    ])
 
     # Assert
-    assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
+    for response, (_, _, expected_status, expected_body) in zip(responses, cases):
+        assert response.status_code == expected_status
+        if expected_body is not None:
+            assert response.json() == expected_body
+    mock_rag_service_instance.identify_message.assert_not_called()
+    mock_rag_service_instance.answer_question.assert_not_called()
+    mock_waha_service_instance.send_whatsapp_reply.assert_not_called()
 
-@pytest.mark.asyncio
-async def test_receive_message_invalid_api_key(test_client):
+async def test_rag_service_exception_handling(test_client):
     """
-    Test that a request with an invalid API key is rejected.
+    Test that if the RAG service fails, the error is handled gracefully
+    and a reply is not sent.
     """
     # Arrange
-    payload = {"event": "message", "payload": {}}
-    headers = {"X-API-KEY": "wrong-secret-key"}
+    mock_rag_service_instance.answer_question.side_effect = Exception("RAG service exploded")
 
     # Act
-    response = test_client.post("/waha/webhook", json=payload, headers=headers)
+    response = await test_client.post("/waha/webhook", content=PAYLOADS["failing"], headers=HEADERS)
 
     # Assert
-    assert response.status_code == 403
-    assert response.json()["detail"] == "Could not validate credentials"
-    mock_rag_service_instance.answer_question.assert_not_called()
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
 
-@pytest.mark.asyncio
-async def test_receive_message_no_api_key(test_client):
+async def test_process_and_reply_query(test_client):
     """
-    Test that a request with no API key is rejected.
+    Test that the background reply task answers a QUERY message through WAHA.
     """
     # Arrange
-    payload = {"event": "message", "payload": {}}
+    from routers.waha_router import _process_and_reply
+    mock_rag_service_instance.identify_message.return_value = "QUERY"
+    mock_rag_service_instance.answer_question.return_value = {"answer": "Test answer from RAG."}
 
     # Act
-    response = test_client.post("/waha/webhook", json=payload)
+    await _process_and_reply("1234567890@c.us", "What is the answer?")
 
     # Assert
-    assert response.status_code == 401
-    mock_rag_service_instance.answer_question.assert_not_called()
+    mock_rag_service_instance.answer_question.assert_awaited_once_with("What is the answer?")
+    mock_waha_service_instance.send_whatsapp_reply.assert_awaited_once_with(
+        "1234567890@c.us", "Test answer from RAG."
+    )
 
-@pytest.mark.asyncio
-async def test_rag_service_exception_handling(test_client):
+async def test_process_and_reply_handles_errors(test_client):
     """
-    Test that if the RAG service fails, the error is handled gracefully
-    and a reply is not sent.
+    Test that failures inside the background reply task are logged, not raised.
     """
     # Arrange
-    payload = {
-        "event": "message",
-        "payload": {"from": "1234567890@c.us", "body": "This will fail."}
-    }
-    headers = {"X-API-KEY": "test-secret-key"}
+    from routers.waha_router import _process_and_reply
+    mock_rag_service_instance.identify_message.return_value = "QUERY"
     mock_rag_service_instance.answer_question.side_effect = Exception("RAG service exploded")
 
     # Act
-    response = test_client.post("/waha/webhook", json=payload, headers=headers)
+    await _process_and_reply("1234567890@c.us", "This will fail.")
 
     # Assert
-    assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
+    mock_waha_service_instance.send_whatsapp_reply.assert_not_called()
 
-@pytest.mark.asyncio
-async def test_ignore_non_message_events(test_client):
+async def test_empty_sender_not_whitelisted(test_client):
     """
-    Test that the webhook ignores events that are not of type 'message'.
+    Test that a sender without a phone number is rejected even though the
+    whitelist string may contain blank entries.
     """
-    # Arrange
-    payload = {"event": "ack", "payload": {}} # 'ack' is not a 'message'
-    headers = {"X-API-KEY": "test-secret-key"}
+    with patch("routers.waha_router.WHITELISTED_NUMBERS", frozenset({"1234567890"})):
+        response = await test_client.post("/waha/webhook", content=PAYLOADS["empty_sender"], headers=HEADERS)
 
-    # Act
-    response = test_client.post("/waha/webhook", json=payload, headers=headers)
+    assert response.status_code == 200
+    mock_rag_service_instance.identify_message.assert_not_called()
+
+async def test_empty_whitelist_short_circuits(test_client):
+    """
+    Test that no message is processed when the whitelist is empty.
+    """
+    with patch("routers.waha_router.WHITELISTED_NUMBERS", frozenset()):
+        response = await test_client.post("/waha/webhook", content=PAYLOADS["hello"], headers=HEADERS)
 
-    # Assert
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
-    mock_rag_service_instance.answer_question.assert_not_called()
-    mock_waha_service_instance.send_whatsapp_reply.assert_not_called()
+    mock_rag_service_instance.identify_message.assert_not_called()
@@ -1,7 +1,7 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 from services.waha_service import WahaService
-import requests
+import httpx
 import os
 import asyncio
 
@@ -14,51 +14,61 @@ def set_env_vars(monkeypatch):
     monkeypatch.setenv("WAHA_SESSION_NAME", "fakesession")
 
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_success(mocker, set_env_vars):
-    """Test successful message sending."""
-    # Arrange
+def _response(status_code, text=""):
+    """Build an httpx response bound to a request so raise_for_status works."""
+    request = httpx.Request("POST", "https://fake.api.url/sendText")
+    return httpx.Response(status_code, text=text, request=request)
+
+
+@pytest.fixture
+async def service(set_env_vars):
+    """A fresh WahaService per test so no client or mock state carries between cases."""
     service = WahaService()
-    mock_post = mocker.patch("services.waha_service.requests.post")
-    mock_response = MagicMock()
-    mock_response.raise_for_status.return_value = None
-    mock_post.return_value = mock_response
+    yield service
+    await service.aclose()
 
-    # Act
-    await service.send_whatsapp_reply("recipient_id", "Hello, world!")
+
+_REQUEST = httpx.Request("POST", "https://fake.api.url/sendText")
 
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_http_error(mocker, set_env_vars, caplog):
-    """Test handling HTTP errors during message sending."""
+@pytest.mark.parametrize("post_kwargs, log_level, expected_log", [
+    ({"return_value": _response(200)}, "INFO", "Successfully sent reply to recipient_id"),
+    ({"return_value": _response(500, text="HTTP Error")}, "ERROR",
+     "Error sending message to recipient_id: HTTP Error"),
+    ({"side_effect": httpx.ConnectError("Request Error", request=_REQUEST)}, "ERROR",
+     "An error occurred while requesting"),
+], ids=["success", "http_error", "request_error"])
+async def test_send_whatsapp_reply(service, caplog, post_kwargs, log_level, expected_log):
+    """Test message sending and its HTTP and request error handling."""
     # Arrange
-    service = WahaService()
-    mock_post = mocker.patch("services.waha_service.requests.post")
-    mock_response = MagicMock()
-    mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
-        response=MagicMock(text="HTTP Error")
-    )
-    mock_post.return_value = mock_response
+    post_mock = AsyncMock(**post_kwargs)
+    service._client.post = post_mock
 
     # Act
-    with caplog.at_level("ERROR"):
+    with caplog.at_level(log_level):
         await service.send_whatsapp_reply("recipient_id", "Hello, world!")
 
+    # Assert
+    post_mock.assert_awaited_once_with(
+        "https://fake.api.url/sendText",
+        json={"chatId": "recipient_id", "text": "Hello, world!", "session": "fakesession"}
+    )
+    assert expected_log in caplog.text
+
 
-@pytest.mark.asyncio
-async def test_send_whatsapp_reply_request_error(mocker, set_env_vars, caplog):
-    """Test handling RequestException during message sending."""
+async def test_client_reused_across_replies(set_env_vars):
+    """Test the pooled client is shared between replies and closed by aclose."""
     # Arrange
     service = WahaService()
-    mock_request = MagicMock()
-    mock_request.url = "https://fake.api.url/sendText"
-
-    mock_post = mocker.patch(
-        "services.waha_service.requests.post",
-        side_effect=requests.exceptions.RequestException("Request Error", request=mock_request)
-    )
+    client = service._client
+    service._client.post = AsyncMock(return_value=_response(200))
 
     # Act
-    with caplog.at_level("ERROR"):
-        await service.send_whatsapp_reply("recipient_id", "Hello, world!")
+    await service.send_whatsapp_reply("a", "one")
+    await service.send_whatsapp_reply("b", "two")
+    await service.aclose()
 
+    # Assert
+    assert service._client is client
+    assert client.post.await_count == 2
+    assert client.is_closed
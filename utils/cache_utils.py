@@ -0,0 +1,155 @@
+from typing import Dict, List, Any, Optional, Set
+from collections import OrderedDict
+import logging
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of RAG answers keyed by question embedding.
+
+    A lookup hits when a previously answered question has a cosine similarity
+    above the threshold. Random-projection LSH buckets narrow the candidates so
+    a lookup does not scan every cached question, and entries are evicted by
+    TTL and least-recently-used order. A max_entries of 0 or less disables the cache.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+        num_tables: int = 8,
+        num_bits: int = 12,
+        seed: int = 0
+    ):
+        self.threshold = threshold
+        self.max_entries = max(max_entries, 0)
+        self.ttl_seconds = ttl_seconds
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self._rng = np.random.default_rng(seed)
+        self._bit_weights = np.left_shift(np.uint64(1), np.arange(num_bits, dtype=np.uint64))
+
+        # Allocated lazily once the embedding dimension is known
+        self._planes: Optional[np.ndarray] = None
+        self._embeddings: Optional[np.ndarray] = None
+
+        self._answers: List[Optional[Dict[str, Any]]] = [None] * self.max_entries
+        self._stored_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._slot_keys: List[Optional[np.ndarray]] = [None] * self.max_entries
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(num_tables)]
+        # Slot ids in least-recently-used order
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._free_slots: List[int] = list(range(self.max_entries - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        """Convert an embedding to a unit-length float32 vector"""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _ensure_storage(self, dimension: int):
+        """Allocate the embedding matrix and projection planes on first use"""
+        if self._embeddings is not None:
+            return
+        self._planes = self._rng.standard_normal(
+            (self.num_tables, dimension, self.num_bits)
+        ).astype(np.float32)
+        self._embeddings = np.zeros((self.max_entries, dimension), dtype=np.float32)
+
+    def _signatures(self, vector: np.ndarray) -> np.ndarray:
+        """Compute one packed LSH signature per table"""
+        bits = np.einsum("d,tdb->tb", vector, self._planes) > 0
+        return (bits.astype(np.uint64) * self._bit_weights).sum(axis=1)
+
+    def _evict(self, slot: int):
+        """Remove a slot from the buckets and return it to the free list"""
+        keys = self._slot_keys[slot]
+        if keys is not None:
+            for table, key in enumerate(keys.tolist()):
+                bucket = self._buckets[table].get(key)
+                if bucket is not None:
+                    bucket.discard(slot)
+                    if not bucket:
+                        del self._buckets[table][key]
+        self._answers[slot] = None
+        self._slot_keys[slot] = None
+        self._lru.pop(slot, None)
+        self._free_slots.append(slot)
+
+    def _is_expired(self, slot: int, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - self._stored_at[slot] > self.ttl_seconds
+
+    def get(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the cached answer for a similar question, or None on a miss"""
+        if self.max_entries <= 0 or not self._lru:
+            return None
+
+        vector = self._normalize(embedding)
+        if self._embeddings is None or vector.shape[0] != self._embeddings.shape[1]:
+            return None
+
+        now = time.monotonic()
+        candidates = set()
+        for table, key in enumerate(self._signatures(vector).tolist()):
+            candidates.update(self._buckets[table].get(key, ()))
+
+        for slot in [slot for slot in candidates if self._is_expired(slot, now)]:
+            self._evict(slot)
+            candidates.discard(slot)
+
+        if not candidates:
+            return None
+
+        slots = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        scores = self._embeddings[slots] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        slot = int(slots[best])
+        self._lru.move_to_end(slot)
+        logger.debug(f"Semantic cache hit with similarity {scores[best]:.3f}")
+        return dict(self._answers[slot])
+
+    def put(self, embedding: List[float], answer: Dict[str, Any]):
+        """Store an answer under the given question embedding"""
+        if self.max_entries <= 0:
+            return
+        vector = self._normalize(embedding)
+        self._ensure_storage(vector.shape[0])
+        if vector.shape[0] != self._embeddings.shape[1]:
+            logger.warning("Embedding dimension changed, clearing semantic cache")
+            self.clear()
+            self._ensure_storage(vector.shape[0])
+
+        if not self._free_slots:
+            oldest_slot = next(iter(self._lru))
+            self._evict(oldest_slot)
+
+        slot = self._free_slots.pop()
+        keys = self._signatures(vector)
+        self._embeddings[slot] = vector
+        self._answers[slot] = dict(answer)
+        self._stored_at[slot] = time.monotonic()
+        self._slot_keys[slot] = keys
+        for table, key in enumerate(keys.tolist()):
+            self._buckets[table].setdefault(key, set()).add(slot)
+        self._lru[slot] = None
+
+    def clear(self):
+        """Drop all cached answers"""
+        self._planes = None
+        self._embeddings = None
+        self._answers = [None] * self.max_entries
+        self._stored_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._slot_keys = [None] * self.max_entries
+        self._buckets = [{} for _ in range(self.num_tables)]
+        self._lru = OrderedDict()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
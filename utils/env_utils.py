@@ -0,0 +1,15 @@
+from functools import lru_cache
+from dotenv import load_dotenv
+
+@lru_cache(maxsize=None)
+def load_env() -> bool:
+    """
+    Load variables from the .env file, parsing it only once per process.
+    
+    Every module calls this at import time, so without the cache the file
+    would be located and parsed again for each of them.
+    
+    Returns:
+        bool: True if a .env file was found and loaded
+    """
+    return load_dotenv()
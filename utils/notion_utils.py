@@ -1,15 +1,145 @@
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, List, Any, Optional, Set, Tuple, Callable, Awaitable, Iterator
 from notion_client import Client, AsyncClient
+from notion_client.errors import HTTPResponseError
 import logging
 import asyncio
 import inspect
+import os
+import time
+import httpx
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the SDK's stdlib JSON decoding
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# HTTP statuses from the Notion API that are worth retrying
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+class AsyncRateLimiter:
+    """Token bucket limiting how often calls may start, allowing short bursts"""
+    
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.burst = burst or max(1, int(rate))
+        # Theoretical arrival time of the next call (GCRA), in time.monotonic() seconds
+        self._next_arrival = 0.0
+    
+    async def acquire(self):
+        """Wait until another call is allowed to start"""
+        if self.rate <= 0:
+            return
+        
+        # Reserve the slot before sleeping so concurrent callers queue up behind each other
+        now = time.monotonic()
+        arrival = max(self._next_arrival, now)
+        wait = arrival - now - (self.burst - 1) * self.interval
+        self._next_arrival = arrival + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# Shared across all Notion calls; Notion allows an average of three requests per second
+notion_rate_limiter = AsyncRateLimiter(float(os.getenv("NOTION_RATE_LIMIT", "3")))
+
+class FastJSONAsyncClient(AsyncClient):
+    """AsyncClient that decodes successful response bodies with orjson (overrides a private SDK hook)"""
+    
+    def _parse_response(self, response: httpx.Response) -> Any:
+        if response.is_success:
+            return orjson.loads(response.content)
+        # Let the SDK raise its usual errors for failed responses
+        return super()._parse_response(response)
+
+def create_notion_client(api_key: str) -> AsyncClient:
+    """
+    Create an async Notion client on a pooled HTTP/2 connection, so concurrent
+    page fetches are multiplexed over one TLS connection. Responses are decoded
+    with orjson when it is installed. The SDK's own retries are disabled because
+    call_with_retry already retries under the shared rate limit.
+    
+    Args:
+        api_key: The Notion integration token
+    
+    Returns:
+        The Notion AsyncClient
+    """
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+    )
+    client_class = FastJSONAsyncClient if orjson is not None else AsyncClient
+    return client_class(auth=api_key, client=http_client, retry=False)
+
+async def call_with_retry(
+    func: Callable[..., Awaitable[Any]],
+    *args,
+    max_retries: int = 3,
+    base_delay: float = 1.0,
+    **kwargs
+) -> Any:
+    """
+    Call an async Notion API method under the shared rate limit, backing off
+    exponentially on rate limits and transient gateway errors.
+    
+    Args:
+        func: The async client method to call
+        max_retries: Maximum number of retries before re-raising
+        base_delay: Delay in seconds before the first retry, doubled each attempt
+    
+    Returns:
+        The API response
+    """
+    attempt = 0
+    while True:
+        await notion_rate_limiter.acquire()
+        try:
+            return await func(*args, **kwargs)
+        except HTTPResponseError as e:
+            if e.status not in RETRYABLE_STATUSES or attempt >= max_retries:
+                raise
+            delay = base_delay * (2 ** attempt)
+            logger.warning(f"Notion API returned {e.status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+# Filter type -> (Notion property category, condition key) for build_filter
+_FILTER_CONDITIONS = {
+    # Text filters
+    "equals": ("rich_text", "equals"),
+    "does_not_equal": ("rich_text", "does_not_equal"),
+    "contains": ("rich_text", "contains"),
+    "does_not_contain": ("rich_text", "does_not_contain"),
+    "starts_with": ("rich_text", "starts_with"),
+    "ends_with": ("rich_text", "ends_with"),
+    "is_empty": ("rich_text", "is_empty"),
+    "is_not_empty": ("rich_text", "is_not_empty"),
+    
+    # Number filters
+    "greater_than": ("number", "greater_than"),
+    "less_than": ("number", "less_than"),
+    "greater_than_or_equal_to": ("number", "greater_than_or_equal_to"),
+    "less_than_or_equal_to": ("number", "less_than_or_equal_to"),
+    
+    # Date filters
+    "before": ("date", "before"),
+    "after": ("date", "after"),
+    "on_or_before": ("date", "on_or_before"),
+    "on_or_after": ("date", "on_or_after"),
+    
+    # Checkbox filters
+    "checkbox_equals": ("checkbox", "equals")
+}
+
+# Filter types whose condition value is fixed regardless of the value passed in
+_FILTER_CONSTANT_VALUES = {"is_empty": True, "is_not_empty": True}
+
 class NotionUtils:
     """Utility class for common Notion operations with enhanced data extraction for RAG"""
     
-    def __init__(self, client: Client | AsyncClient):
+    def __init__(self, client: Client | AsyncClient, schema_cache_ttl: float = 300):
         self.client = client
         # Check if client is async by checking if it's an AsyncClient or has async methods
         # We use hasattr to check for the AsyncClient's async methods, which also works with mocks
@@ -18,6 +148,11 @@ class NotionUtils:
         self._page_cache: Dict[str, Dict[str, Any]] = {}
         # Track synced block IDs to avoid duplicates
         self._synced_block_ids: Set[str] = set()
+        # Database schemas change rarely, so keep them for schema_cache_ttl seconds
+        self.schema_cache_ttl = schema_cache_ttl
+        self._schema_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        # Bounds concurrent block-children requests, which fan out with the block tree
+        self._fetch_semaphore = asyncio.Semaphore(int(os.getenv("NOTION_CONCURRENCY", "5")))
     
     def _is_async_like(self, client) -> bool:
         """Check if client behaves like an async client (for testing with mocks)"""
@@ -50,95 +185,99 @@ class NotionUtils:
         extracted = {}
         
         for prop_name, prop_data in properties.items():
-            prop_type = prop_data.get("type")
-            
-            try:
-                if prop_type == "title":
-                    extracted[prop_name] = self._extract_rich_text(prop_data.get("title", []))
-                elif prop_type == "rich_text":
-                    extracted[prop_name] = self._extract_rich_text(prop_data.get("rich_text", []))
-                elif prop_type == "number":
-                    extracted[prop_name] = prop_data.get("number")
-                elif prop_type == "select":
-                    select_data = prop_data.get("select")
-                    extracted[prop_name] = select_data.get("name") if select_data else None
-                elif prop_type == "multi_select":
-                    multi_select_data = prop_data.get("multi_select", [])
-                    extracted[prop_name] = [item.get("name") for item in multi_select_data]
-                elif prop_type == "date":
-                    date_data = prop_data.get("date")
-                    if date_data:
-                        extracted[prop_name] = {
-                            "start": date_data.get("start"),
-                            "end": date_data.get("end")
-                        }
-                    else:
-                        extracted[prop_name] = None
-                elif prop_type == "checkbox":
-                    extracted[prop_name] = prop_data.get("checkbox", False)
-                elif prop_type == "url":
-                    extracted[prop_name] = prop_data.get("url")
-                elif prop_type == "email":
-                    extracted[prop_name] = prop_data.get("email")
-                elif prop_type == "phone_number":
-                    extracted[prop_name] = prop_data.get("phone_number")
-                elif prop_type == "relation":
-                    relation_data = prop_data.get("relation", [])
-                    extracted[prop_name] = [item.get("id") for item in relation_data]
-                elif prop_type == "people":
-                    people_data = prop_data.get("people", [])
-                    extracted[prop_name] = [
-                        person.get("name") or person.get("id") 
-                        for person in people_data
-                    ]
-                elif prop_type == "files":
-                    files_data = prop_data.get("files", [])
-                    extracted[prop_name] = [
-                        {
-                            "name": file.get("name"),
-                            "url": file.get("file", {}).get("url") if file.get("type") == "file" 
-                                   else file.get("external", {}).get("url")
-                        }
-                        for file in files_data
-                    ]
-                elif prop_type == "created_time":
-                    extracted[prop_name] = prop_data.get("created_time")
-                elif prop_type == "last_edited_time":
-                    extracted[prop_name] = prop_data.get("last_edited_time")
-                elif prop_type == "created_by":
-                    created_by = prop_data.get("created_by", {})
-                    extracted[prop_name] = created_by.get("name") or created_by.get("id")
-                elif prop_type == "last_edited_by":
-                    edited_by = prop_data.get("last_edited_by", {})
-                    edited_by_name = edited_by.get("name") or edited_by.get("id")
-                    extracted[prop_name] = edited_by_name
-                elif prop_type == "formula":
-                    formula_data = prop_data.get("formula", {})
-                    extracted[prop_name] = formula_data.get("string") or formula_data.get("number")
-                elif prop_type == "rollup":
-                    rollup_data = prop_data.get("rollup", {})
-                    rollup_type = rollup_data.get("type")
-                    if rollup_type == "array":
-                        extracted[prop_name] = rollup_data.get("array", [])
-                    elif rollup_type == "number":
-                        extracted[prop_name] = rollup_data.get("number")
-                    elif rollup_type == "string":
-                        extracted[prop_name] = rollup_data.get("string")
-                else:
-                    # For unknown types, store the raw data
-                    extracted[prop_name] = prop_data
-                    
-            except Exception as e:
-                logger.warning(f"Error extracting property {prop_name}: {str(e)}")
-                extracted[prop_name] = None
+            handler = self._PROPERTY_EXTRACTORS.get(prop_data.get("type"))
+            if handler is None:
+                # For unknown types, store the raw data
+                extracted[prop_name] = prop_data
+                continue
+            extracted[prop_name] = handler(self, prop_data)
         
         return extracted
     
+    def _extract_date_property(self, prop_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        date_data = prop_data.get("date")
+        if not isinstance(date_data, dict):
+            return None
+        return {"start": date_data.get("start"), "end": date_data.get("end")}
+    
+    def _extract_files_property(self, prop_data: Dict[str, Any]) -> Dict[str, List[Optional[str]]]:
+        """File names and URLs as parallel lists: {"names": [...], "urls": [...]}"""
+        files = prop_data.get("files") or ()
+        return {
+            "names": [file.get("name") for file in files],
+            "urls": [self._file_or_external_url(file) for file in files],
+        }
+    
+    @staticmethod
+    def files_as_aos(files: Dict[str, List[Optional[str]]]) -> List[Dict[str, Optional[str]]]:
+        """Convert an extracted files property back to the old [{"name": ..., "url": ...}] layout"""
+        return [{"name": name, "url": url} for name, url in zip(files["names"], files["urls"])]
+    
+    @staticmethod
+    def _format_property_value(value: Any) -> str:
+        """Render an extracted property value as text; files properties list their file names"""
+        if isinstance(value, dict) and "names" in value:
+            value = [name for name in value["names"] if name]
+        if isinstance(value, list):
+            return ", ".join(str(v) for v in value)
+        return str(value)
+    
+    @staticmethod
+    def _user_name_or_id(user: Any) -> Optional[str]:
+        """Display name of a created_by/last_edited_by user, falling back to the ID"""
+        if not isinstance(user, dict):
+            return None
+        return user.get("name") or user.get("id")
+    
+    def _extract_rollup_property(self, prop_data: Dict[str, Any]) -> Any:
+        rollup_data = prop_data.get("rollup")
+        if not isinstance(rollup_data, dict):
+            return None
+        rollup_type = rollup_data.get("type")
+        if rollup_type == "array":
+            return rollup_data.get("array", [])
+        if rollup_type in ("number", "string"):
+            return rollup_data.get(rollup_type)
+        return None
+    
+    # Property type -> extractor(self, prop_data), looked up once per property
+    _PROPERTY_EXTRACTORS: Dict[str, Callable[["NotionUtils", Dict[str, Any]], Any]] = {
+        "title": lambda self, d: self._extract_rich_text(d.get("title", [])),
+        "rich_text": lambda self, d: self._extract_rich_text(d.get("rich_text", [])),
+        "number": lambda self, d: d.get("number"),
+        "select": lambda self, d: d["select"].get("name") if isinstance(d.get("select"), dict) else None,
+        "multi_select": lambda self, d: [item.get("name") for item in d.get("multi_select") or ()],
+        "date": _extract_date_property,
+        "checkbox": lambda self, d: d.get("checkbox", False),
+        "url": lambda self, d: d.get("url"),
+        "email": lambda self, d: d.get("email"),
+        "phone_number": lambda self, d: d.get("phone_number"),
+        "relation": lambda self, d: [item.get("id") for item in d.get("relation") or ()],
+        "people": lambda self, d: [
+            person.get("name") or person.get("id") for person in d.get("people") or ()
+        ],
+        "files": _extract_files_property,
+        "created_time": lambda self, d: d.get("created_time"),
+        "last_edited_time": lambda self, d: d.get("last_edited_time"),
+        "created_by": lambda self, d: NotionUtils._user_name_or_id(d.get("created_by")),
+        "last_edited_by": lambda self, d: NotionUtils._user_name_or_id(d.get("last_edited_by")),
+        "formula": lambda self, d: (
+            (d.get("formula") or {}).get("string") or (d.get("formula") or {}).get("number")
+        ),
+        "rollup": _extract_rollup_property,
+    }
+    
     def _extract_rich_text(self, rich_text_array: List[Dict[str, Any]]) -> str:
         """Extract plain text from rich text array with mention handling"""
         if not rich_text_array:
             return ""
         
+        # Most rich text is a single unformatted run
+        if len(rich_text_array) == 1:
+            text_obj = rich_text_array[0]
+            if text_obj.get("type", "text") == "text":
+                return text_obj.get("plain_text", "")
+        
         text_parts = []
         for text_obj in rich_text_array:
             text_type = text_obj.get("type", "text")
@@ -194,139 +333,153 @@ class NotionUtils:
             "depth": depth
         }
         
-        # Extract text content based on block type
-        if block_type == "paragraph":
-            content["text"] = self._extract_rich_text(block.get("paragraph", {}).get("rich_text", []))
-        elif block_type == "heading_1":
-            content["text"] = self._extract_rich_text(block.get("heading_1", {}).get("rich_text", []))
-            content["level"] = 1
-        elif block_type == "heading_2":
-            content["text"] = self._extract_rich_text(block.get("heading_2", {}).get("rich_text", []))
-            content["level"] = 2
-        elif block_type == "heading_3":
-            content["text"] = self._extract_rich_text(block.get("heading_3", {}).get("rich_text", []))
-            content["level"] = 3
-        elif block_type == "bulleted_list_item":
-            content["text"] = self._extract_rich_text(block.get("bulleted_list_item", {}).get("rich_text", []))
-            content["list_type"] = "bullet"
-        elif block_type == "numbered_list_item":
-            content["text"] = self._extract_rich_text(block.get("numbered_list_item", {}).get("rich_text", []))
-            content["list_type"] = "number"
-        elif block_type == "to_do":
-            to_do_data = block.get("to_do", {})
-            content["text"] = self._extract_rich_text(to_do_data.get("rich_text", []))
-            content["checked"] = to_do_data.get("checked", False)
-        elif block_type == "toggle":
-            toggle_data = block.get("toggle", {})
-            content["text"] = self._extract_rich_text(toggle_data.get("rich_text", []))
-            content["is_toggle"] = True
-        elif block_type == "quote":
-            content["text"] = self._extract_rich_text(block.get("quote", {}).get("rich_text", []))
-            content["is_quote"] = True
-        elif block_type == "callout":
-            callout_data = block.get("callout", {})
-            content["text"] = self._extract_rich_text(callout_data.get("rich_text", []))
-            content["icon"] = callout_data.get("icon", {})
-            content["is_callout"] = True
-        elif block_type == "code":
-            code_data = block.get("code", {})
-            content["text"] = self._extract_rich_text(code_data.get("rich_text", []))
-            content["language"] = code_data.get("language", "plain text")
-            content["is_code"] = True
-        elif block_type == "equation":
-            equation_data = block.get("equation", {})
-            content["expression"] = equation_data.get("expression", "")
-            content["is_equation"] = True
-        elif block_type == "divider":
-            content["is_divider"] = True
-        elif block_type == "breadcrumb":
-            content["is_breadcrumb"] = True
-        elif block_type == "table_of_contents":
-            content["is_toc"] = True
-        elif block_type == "link_to_page":
-            link_to_page_data = block.get("link_to_page", {})
-            content["page_id"] = link_to_page_data.get("page_id")
-            content["database_id"] = link_to_page_data.get("database_id")
-            content["is_link"] = True
-        elif block_type == "bookmark":
-            bookmark_data = block.get("bookmark", {})
-            content["url"] = bookmark_data.get("url")
-            content["caption"] = self._extract_rich_text(bookmark_data.get("caption", []))
-        elif block_type == "embed":
-            embed_data = block.get("embed", {})
-            content["url"] = embed_data.get("url")
-            content["caption"] = self._extract_rich_text(embed_data.get("caption", []))
-        elif block_type == "image":
-            image_data = block.get("image", {})
-            content["url"] = image_data.get("file", {}).get("url") or image_data.get("external", {}).get("url")
-            content["caption"] = self._extract_rich_text(image_data.get("caption", []))
-            content["type_detail"] = "image"
-        elif block_type == "video":
-            video_data = block.get("video", {})
-            content["url"] = video_data.get("file", {}).get("url") or video_data.get("external", {}).get("url")
-            content["caption"] = self._extract_rich_text(video_data.get("caption", []))
-            content["type_detail"] = "video"
-        elif block_type == "file":
-            file_data = block.get("file", {})
-            content["url"] = file_data.get("file", {}).get("url") or file_data.get("external", {}).get("url")
-            content["caption"] = self._extract_rich_text(file_data.get("caption", []))
-            content["type_detail"] = "file"
-        elif block_type == "pdf":
-            pdf_data = block.get("pdf", {})
-            content["url"] = pdf_data.get("file", {}).get("url") or pdf_data.get("external", {}).get("url")
-            content["caption"] = self._extract_rich_text(pdf_data.get("caption", []))
-            content["type_detail"] = "pdf"
-        elif block_type == "audio":
-            audio_data = block.get("audio", {})
-            content["url"] = audio_data.get("file", {}).get("url") or audio_data.get("external", {}).get("url")
-            content["caption"] = self._extract_rich_text(audio_data.get("caption", []))
-            content["type_detail"] = "audio"
-        elif block_type == "link_preview":
-            link_preview_data = block.get("link_preview", {})
-            content["url"] = link_preview_data.get("url")
-            content["type_detail"] = "link_preview"
-        elif block_type == "child_page":
-            child_page_data = block.get("child_page", {})
-            content["title"] = child_page_data.get("title", "")
-            content["child_page_id"] = block_id  # The block ID is the child page ID
-            content["type_detail"] = "child_page"
-        elif block_type == "child_database":
-            child_db_data = block.get("child_database", {})
-            content["title"] = child_db_data.get("title", "")
-            content["child_database_id"] = block_id
-            content["type_detail"] = "child_database"
-        elif block_type == "table":
-            table_data = block.get("table", {})
-            content["table_width"] = table_data.get("table_width", 0)
-            content["has_column_header"] = table_data.get("has_column_header", False)
-            content["has_row_header"] = table_data.get("has_row_header", False)
-            content["type_detail"] = "table"
-        elif block_type == "table_row":
-            table_row_data = block.get("table_row", {})
-            cells = table_row_data.get("cells", [])
-            # Convert cell rich_text to plain text
-            content["cells"] = [self._extract_rich_text(cell) for cell in cells]
-            content["type_detail"] = "table_row"
-        elif block_type == "column_list":
-            content["type_detail"] = "column_list"
-        elif block_type == "column":
-            column_data = block.get("column", {})
-            content["width"] = column_data.get("width")
-            content["type_detail"] = "column"
-        elif block_type == "synced_block":
-            synced_block_data = block.get("synced_block", {})
-            content["synced_from_id"] = synced_block_data.get("synced_from", {}).get("id")
-            content["type_detail"] = "synced_block"
-        elif block_type == "template":
-            template_data = block.get("template", {})
-            content["text"] = self._extract_rich_text(template_data.get("rich_text", []))
-            content["type_detail"] = "template"
+        # Extract type-specific content with one table lookup
+        handler = self._BLOCK_EXTRACTORS.get(block_type)
+        if handler is not None:
+            handler(self, block, content)
         else:
             content["unknown_type"] = True
             logger.debug(f"Unknown block type: {block_type}")
         
         return content
     
+    def _extract_text_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        """Rich-text blocks whose only extra fields are constant markers"""
+        block_type = block["type"]
+        content["text"] = self._extract_rich_text(block.get(block_type, {}).get("rich_text", []))
+        content.update(self._TEXT_BLOCK_MARKERS[block_type])
+    
+    def _extract_marker_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        """Blocks that carry no content of their own, only constant markers"""
+        content.update(self._MARKER_BLOCKS[block["type"]])
+    
+    def _extract_to_do_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        to_do_data = block.get("to_do", {})
+        content["text"] = self._extract_rich_text(to_do_data.get("rich_text", []))
+        content["checked"] = to_do_data.get("checked", False)
+    
+    def _extract_callout_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        callout_data = block.get("callout", {})
+        content["text"] = self._extract_rich_text(callout_data.get("rich_text", []))
+        content["icon"] = callout_data.get("icon", {})
+        content["is_callout"] = True
+    
+    def _extract_code_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        code_data = block.get("code", {})
+        content["text"] = self._extract_rich_text(code_data.get("rich_text", []))
+        content["language"] = code_data.get("language", "plain text")
+        content["is_code"] = True
+    
+    def _extract_equation_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        content["expression"] = block.get("equation", {}).get("expression", "")
+        content["is_equation"] = True
+    
+    def _extract_link_to_page_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        link_to_page_data = block.get("link_to_page", {})
+        content["page_id"] = link_to_page_data.get("page_id")
+        content["database_id"] = link_to_page_data.get("database_id")
+        content["is_link"] = True
+    
+    def _extract_bookmark_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        """Bookmark and embed blocks: a URL with a caption"""
+        data = block.get(block["type"], {})
+        content["url"] = data.get("url")
+        content["caption"] = self._extract_rich_text(data.get("caption", []))
+    
+    def _extract_media_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        """Image, video, file, pdf and audio blocks: a hosted or external URL with a caption"""
+        block_type = block["type"]
+        data = block.get(block_type, {})
+        content["url"] = self._file_or_external_url(data)
+        content["caption"] = self._extract_rich_text(data.get("caption", []))
+        content["type_detail"] = block_type
+    
+    @staticmethod
+    def _file_or_external_url(data: Dict[str, Any]) -> Optional[str]:
+        """URL of a Notion-hosted file, falling back to an external one, without default dicts"""
+        hosted = data.get("file")
+        if hosted and hosted.get("url"):
+            return hosted["url"]
+        external = data.get("external")
+        return external.get("url") if external else None
+    
+    def _extract_link_preview_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        content["url"] = block.get("link_preview", {}).get("url")
+        content["type_detail"] = "link_preview"
+    
+    def _extract_child_page_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        content["title"] = block.get("child_page", {}).get("title", "")
+        content["child_page_id"] = block.get("id")  # The block ID is the child page ID
+        content["type_detail"] = "child_page"
+    
+    def _extract_child_database_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        content["title"] = block.get("child_database", {}).get("title", "")
+        content["child_database_id"] = block.get("id")
+        content["type_detail"] = "child_database"
+    
+    def _extract_table_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        table_data = block.get("table", {})
+        content["table_width"] = table_data.get("table_width", 0)
+        content["has_column_header"] = table_data.get("has_column_header", False)
+        content["has_row_header"] = table_data.get("has_row_header", False)
+        content["type_detail"] = "table"
+    
+    def _extract_table_row_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        cells = block.get("table_row", {}).get("cells", [])
+        # Convert cell rich_text to plain text
+        content["cells"] = [self._extract_rich_text(cell) for cell in cells]
+        content["type_detail"] = "table_row"
+    
+    def _extract_column_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        content["width"] = block.get("column", {}).get("width")
+        content["type_detail"] = "column"
+    
+    def _extract_synced_block(self, block: Dict[str, Any], content: Dict[str, Any]):
+        content["synced_from_id"] = block.get("synced_block", {}).get("synced_from", {}).get("id")
+        content["type_detail"] = "synced_block"
+    
+    # Constant fields added after the text of simple rich-text blocks
+    _TEXT_BLOCK_MARKERS: Dict[str, Dict[str, Any]] = {
+        "paragraph": {},
+        "heading_1": {"level": 1},
+        "heading_2": {"level": 2},
+        "heading_3": {"level": 3},
+        "bulleted_list_item": {"list_type": "bullet"},
+        "numbered_list_item": {"list_type": "number"},
+        "toggle": {"is_toggle": True},
+        "quote": {"is_quote": True},
+        "template": {"type_detail": "template"},
+    }
+    
+    # Constant fields for blocks that carry no content of their own
+    _MARKER_BLOCKS: Dict[str, Dict[str, Any]] = {
+        "divider": {"is_divider": True},
+        "breadcrumb": {"is_breadcrumb": True},
+        "table_of_contents": {"is_toc": True},
+        "column_list": {"type_detail": "column_list"},
+    }
+    
+    # Block type -> extractor(self, block, content) that fills in type-specific fields
+    _BLOCK_EXTRACTORS: Dict[str, Callable[["NotionUtils", Dict[str, Any], Dict[str, Any]], None]] = {
+        **dict.fromkeys(_TEXT_BLOCK_MARKERS, _extract_text_block),
+        **dict.fromkeys(_MARKER_BLOCKS, _extract_marker_block),
+        "to_do": _extract_to_do_block,
+        "callout": _extract_callout_block,
+        "code": _extract_code_block,
+        "equation": _extract_equation_block,
+        "link_to_page": _extract_link_to_page_block,
+        "bookmark": _extract_bookmark_block,
+        "embed": _extract_bookmark_block,
+        **dict.fromkeys(("image", "video", "file", "pdf", "audio"), _extract_media_block),
+        "link_preview": _extract_link_preview_block,
+        "child_page": _extract_child_page_block,
+        "child_database": _extract_child_database_block,
+        "table": _extract_table_block,
+        "table_row": _extract_table_row_block,
+        "column": _extract_column_block,
+        "synced_block": _extract_synced_block,
+    }
+    
     # ==================== Recursive Block Fetching ====================
     
     async def fetch_all_blocks_recursive(
@@ -380,27 +533,39 @@ class NotionUtils:
                 if next_cursor:
                     kwargs["start_cursor"] = next_cursor
                 
-                response = await self.client.blocks.children.list(**kwargs)
+                # Hold the semaphore only for the request, never across the recursion,
+                # so nested fetches cannot deadlock waiting on their parents
+                async with self._fetch_semaphore:
+                    response = await call_with_retry(self.client.blocks.children.list, **kwargs)
                 blocks = response.get("results", [])
                 has_more = response.get("has_more", False)
                 next_cursor = response.get("next_cursor")
                 
-                # Process each block
-                for block in blocks:
-                    # Extract block content
-                    extracted_block = self.extract_block_content(block, depth=current_depth)
-                    
-                    # Recursively fetch children if present
-                    if block.get("has_children", False) and current_depth < max_depth:
-                        children = await self._fetch_blocks_recursive(
+                # Extract block content
+                extracted_blocks = [
+                    self.extract_block_content(block, depth=current_depth) for block in blocks
+                ]
+                
+                # Fetch the children of sibling blocks concurrently; subtrees are independent
+                parents = [
+                    (extracted_block, block)
+                    for extracted_block, block in zip(extracted_blocks, blocks)
+                    if block.get("has_children", False) and current_depth < max_depth
+                ]
+                if parents:
+                    children_lists = await asyncio.gather(*[
+                        self._fetch_blocks_recursive(
                             block_id=block["id"],
                             current_depth=current_depth + 1,
                             max_depth=max_depth,
                             page_size=page_size
                         )
+                        for _, block in parents
+                    ])
+                    for (extracted_block, _), children in zip(parents, children_lists):
                         extracted_block["children"] = children
-                    
-                    all_blocks.append(extracted_block)
+                
+                all_blocks.extend(extracted_blocks)
                     
             except Exception as e:
                 logger.error(f"Error fetching blocks for {block_id} at depth {current_depth}: {str(e)}")
@@ -408,6 +573,22 @@ class NotionUtils:
         
         return all_blocks
     
+    def iter_blocks(self, blocks: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Walk extracted blocks depth-first, yielding each block before its children.
+        
+        Args:
+            blocks: List of extracted blocks with nested children
+        
+        Returns:
+            A lazy iterator over every block in the tree
+        """
+        for block in blocks:
+            yield block
+            children = block.get("children")
+            if children:
+                yield from self.iter_blocks(children)
+    
     # ==================== Child Page Resolution ====================
     
     async def fetch_child_page_content(self, page_id: str) -> Dict[str, Any]:
@@ -427,7 +608,7 @@ class NotionUtils:
         
         try:
             # Fetch page properties
-            page = await self.client.pages.retrieve(page_id=page_id)
+            page = await call_with_retry(self.client.pages.retrieve, page_id=page_id)
             
             # Fetch page blocks
             blocks = await self.fetch_all_blocks_recursive(page_id, max_depth=5)
@@ -460,16 +641,12 @@ class NotionUtils:
         Returns:
             Blocks with linked page content inlined
         """
-        for block in blocks:
+        for block in self.iter_blocks(blocks):
             if block.get("type") == "link_to_page":
                 page_id = block.get("page_id")
                 if page_id:
                     child_content = await self.fetch_child_page_content(page_id)
                     block["resolved_content"] = child_content
-            
-            # Recursively resolve children
-            if "children" in block:
-                await self.resolve_linked_pages(block["children"])
         
         return blocks
     
@@ -518,9 +695,7 @@ class NotionUtils:
             parts.append("## Page Properties\n")
             for prop_name, prop_value in properties.items():
                 if prop_value is not None:
-                    if isinstance(prop_value, list):
-                        prop_value = ", ".join(str(v) for v in prop_value)
-                    parts.append(f"- **{prop_name}**: {prop_value}")
+                    parts.append(f"- **{prop_name}**: {self._format_property_value(prop_value)}")
         
         # URL
         url = metadata.get("url")
@@ -547,12 +722,8 @@ class NotionUtils:
             text = block.get("text", "")
             indent = "  " * indent_level
             
-            # Handle different block types
-            if block_type in ["heading_1", "heading_2", "heading_3"]:
-                level = block.get("level", 1)
-                markdown_parts.append(f"{'#' * level} {text}")
-            
-            elif block_type == "paragraph":
+            # Handle different block types, most common first
+            if block_type == "paragraph":
                 if text:
                     markdown_parts.append(f"{indent}{text}")
             
@@ -563,6 +734,10 @@ class NotionUtils:
                 markdown_parts.append(f"{indent}{list_counter}. {text}")
                 list_counter += 1
             
+            elif block_type in ("heading_1", "heading_2", "heading_3"):
+                level = block.get("level", 1)
+                markdown_parts.append(f"{'#' * level} {text}")
+            
             elif block_type == "to_do":
                 checked = block.get("checked", False)
                 checkbox = "[x]" if checked else "[ ]"
@@ -701,7 +876,7 @@ class NotionUtils:
                 continue
             
             # Format row as markdown table row
-            row_text = "| " + " | ".join(str(cell) for cell in cells) + " |"
+            row_text = "| " + " | ".join(cells) + " |"
             markdown_lines.append(row_text)
             
             # Add separator after header row
@@ -737,7 +912,7 @@ class NotionUtils:
         
         try:
             # Fetch page properties
-            page = await self.client.pages.retrieve(page_id=page_id)
+            page = await call_with_retry(self.client.pages.retrieve, page_id=page_id)
             
             # Fetch all blocks recursively
             blocks = await self.fetch_all_blocks_recursive(page_id, max_depth=max_depth)
@@ -789,23 +964,23 @@ class NotionUtils:
         blocks: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """Fetch and inline child page content"""
-        for block in blocks:
+        for block in self.iter_blocks(blocks):
             if block.get("type") == "child_page":
                 child_id = block.get("child_page_id")
                 if child_id:
                     child_content = await self.fetch_child_page_content(child_id)
                     block["resolved_content"] = child_content
-            
-            # Recursively process children
-            if "children" in block:
-                await self._fetch_inline_child_pages(block["children"])
         
         return blocks
     
     # ==================== Database Operations ====================
     
     async def get_database_schema(self, database_id: str) -> Dict[str, Any]:
-        """Get simplified database schema"""
+        """Get simplified database schema, cached per database for schema_cache_ttl seconds"""
+        cached = self._schema_cache.get(database_id)
+        if cached is not None and time.monotonic() - cached[0] < self.schema_cache_ttl:
+            return cached[1]
+        
         try:
             database = await self.client.databases.retrieve(database_id=database_id)
             properties = database.get("properties", {})
@@ -839,7 +1014,7 @@ class NotionUtils:
             if title_array:
                 title = self._extract_rich_text(title_array)
             
-            return {
+            result = {
                 "id": database_id,
                 "title": title,
                 "properties": schema,
@@ -847,46 +1022,30 @@ class NotionUtils:
                 "last_edited_time": database.get("last_edited_time"),
                 "url": database.get("url")
             }
+            if self.schema_cache_ttl > 0:
+                self._schema_cache[database_id] = (time.monotonic(), result)
+            return result
             
         except Exception as e:
             logger.error(f"Error getting database schema: {str(e)}")
             raise
     
+    def invalidate_schema(self, database_id: Optional[str] = None):
+        """Drop the cached schema for one database, or for all databases when no ID is given"""
+        if database_id is None:
+            self._schema_cache.clear()
+        else:
+            self._schema_cache.pop(database_id, None)
+    
     def build_filter(self, property_name: str, filter_type: str, value: Any) -> Dict[str, Any]:
         """Build a filter object for database queries"""
-        filter_map = {
-            # Text filters
-            "equals": {"equals": value},
-            "does_not_equal": {"does_not_equal": value},
-            "contains": {"contains": value},
-            "does_not_contain": {"does_not_contain": value},
-            "starts_with": {"starts_with": value},
-            "ends_with": {"ends_with": value},
-            "is_empty": {"is_empty": True},
-            "is_not_empty": {"is_not_empty": True},
-            
-            # Number filters
-            "greater_than": {"greater_than": value},
-            "less_than": {"less_than": value},
-            "greater_than_or_equal_to": {"greater_than_or_equal_to": value},
-            "less_than_or_equal_to": {"less_than_or_equal_to": value},
-            
-            # Date filters
-            "before": {"before": value},
-            "after": {"after": value},
-            "on_or_before": {"on_or_before": value},
-            "on_or_after": {"on_or_after": value},
-            
-            # Checkbox filters
-            "checkbox_equals": {"equals": value}
-        }
-        
-        if filter_type not in filter_map:
+        if filter_type not in _FILTER_CONDITIONS:
             raise ValueError(f"Unsupported filter type: {filter_type}")
         
+        category, condition = _FILTER_CONDITIONS[filter_type]
         return {
             "property": property_name,
-            filter_type.split("_")[0]: filter_map[filter_type]
+            category: {condition: _FILTER_CONSTANT_VALUES.get(filter_type, value)}
         }
     
     def build_sort(self, property_name: str, direction: str = "ascending") -> Dict[str, Any]:
@@ -933,9 +1092,7 @@ class NotionUtils:
                 if prop_name == "title":
                     continue
                 if prop_value is not None:
-                    if isinstance(prop_value, list):
-                        prop_value = ", ".join(str(v) for v in prop_value)
-                    text_parts.append(f"  {prop_name}: {prop_value}")
+                    text_parts.append(f"  {prop_name}: {self._format_property_value(prop_value)}")
         
         # Add main content
         markdown_content = page_data.get("markdown_content", "")
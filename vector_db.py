@@ -2,17 +2,43 @@
 Vector database utilities for storing and retrieving embeddings in MongoDB Atlas
 """
 import os
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Any
-from datetime import datetime
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from collections import OrderedDict
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson.binary import Binary, BinaryVectorDtype
+from pymongo import DeleteMany, UpdateOne
 from sentence_transformers import SentenceTransformer
+import numpy as np
 import tiktoken
-from dotenv import load_dotenv
+from utils.env_utils import load_env
+from services.embedding_service import AsyncEmbeddingClient
 
-load_dotenv()
+load_env()
 logger = logging.getLogger(__name__)
 
+# Upper bound Atlas Vector Search accepts for numCandidates
+MAX_NUM_CANDIDATES = 10000
+
+# Shapes matched chunks into search results server-side, leaving the embedding behind
+SEARCH_RESULT_PROJECTION = {
+    "_id": 0,
+    "chunk_id": {"$toString": "$_id"},
+    "notion_page_id": 1,
+    "notion_database_id": 1,
+    "chunk_text": 1,
+    "page_url": {"$ifNull": ["$page_url", None]},
+    "page_properties": {"$ifNull": ["$page_properties", {}]},
+    "chunk_index": {"$ifNull": ["$chunk_index", 0]},
+    "last_edited_time": {"$ifNull": ["$last_edited_time", None]}
+}
+
 class VectorDB:
     """Vector database manager for MongoDB Atlas with vector search capabilities"""
     
@@ -31,9 +57,65 @@ class VectorDB:
         
         # Initialize embedding model
         self.embedding_model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        # "onnx" or "openvino" run the model without PyTorch; EMBEDDING_MODEL_FILE picks a
+        # specific export such as onnx/model_qint8_avx512_vnni.onnx
+        self.embedding_backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+        embedding_model_file = os.getenv("EMBEDDING_MODEL_FILE")
+        self.embedding_model = SentenceTransformer(
+            self.embedding_model_name,
+            backend=self.embedding_backend,
+            model_kwargs={"file_name": embedding_model_file} if embedding_model_file else None
+        )
+        # On a GPU, fp16 weights halve memory traffic and use tensor cores; CPUs stay in fp32
+        if self.embedding_backend == "torch" and self.embedding_model.device.type == "cuda":
+            self.embedding_model = self.embedding_model.half()
         self.embedding_dimension = self.embedding_model.get_sentence_embedding_dimension()
         
+        # Optional remote embedding server; the local model stays as a fallback
+        self.embedding_url = os.getenv("EMBEDDING_URL")
+        self.embed_client = (
+            AsyncEmbeddingClient(self.embedding_url, self.embedding_model_name)
+            if self.embedding_url else None
+        )
+        
+        # Local encodes run on a dedicated thread so they don't block the event loop.
+        # An idle encoder starts right away; requests arriving while it is busy wait up to the
+        # batch window and are coalesced into the next encode.
+        self._encode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self.embedding_batch_window = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "20")) / 1000
+        self._pending_encodes: Optional[List[Tuple[List[str], asyncio.Future]]] = None
+        self._flush_tasks: set = set()
+        self._encodes_running = 0
+        # Texts per forward pass when encoding locally or per request to the embedding server
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        
+        # Embedding of the health check probe text, computed once on first use
+        self._probe_embedding: Optional[List[float]] = None
+        
+        # Bumped on every write so caches built from search results can tell they are stale
+        self.content_version = 0
+        
+        # Recently embedded search queries, least recently used first
+        self.query_embedding_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        
+        # Quantization Atlas applies to indexed vectors: "scalar" (int8), "binary" (1-bit) or "none"
+        self.vector_quantization = os.getenv("VECTOR_QUANTIZATION", "scalar").lower()
+        if self.vector_quantization not in ("none", "scalar", "binary"):
+            raise ValueError("VECTOR_QUANTIZATION must be one of: none, scalar, binary")
+        
+        # Element type of the vectors stored in documents: "float32", or "int8" for a quarter of
+        # the float32 size (Atlas then indexes them as-is, without its own quantization)
+        self.embedding_storage_dtype = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").lower()
+        if self.embedding_storage_dtype not in ("float32", "int8"):
+            raise ValueError("EMBEDDING_STORAGE_DTYPE must be one of: float32, int8")
+        
+        # Atlas Search index on chunk_text used by the keyword fallback
+        self.text_search_index = os.getenv("TEXT_SEARCH_INDEX", "default")
+        
+        # ANN candidates gathered per requested result before exact rescoring (Atlas caps this at 10000)
+        self.num_candidates_factor = int(os.getenv("VECTOR_NUM_CANDIDATES_FACTOR", "10"))
+        
         # Initialize tokenizer for text chunking
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
         self.max_chunk_tokens = int(os.getenv("MAX_CHUNK_TOKENS", "500"))
@@ -43,8 +125,15 @@ class VectorDB:
         logger.info(f"Embedding dimension: {self.embedding_dimension}")
     
     async def ensure_vector_index(self):
-        """Ensure vector search index exists in MongoDB Atlas"""
+        """Ensure the chunk lookup index and the vector search index exist in MongoDB Atlas"""
         try:
+            # Page-scoped lookups, upserts and deletes seek on this instead of scanning;
+            # its notion_page_id prefix also serves queries on that field alone
+            await self.collection.create_index(
+                [("notion_page_id", 1), ("chunk_index", 1)],
+                name="page_chunk_idx"
+            )
+            
             # Check if index already exists
             indexes = await self.collection.list_indexes().to_list(length=None)
             vector_index_exists = any(
@@ -55,17 +144,20 @@ class VectorDB:
                 logger.info("Creating vector search index...")
                 # Note: Vector search index creation in MongoDB Atlas is typically done via Atlas UI or Atlas CLI
                 # This is a placeholder for the index definition
+                vector_field = {
+                    "type": "vector",
+                    "path": "embedding",
+                    "numDimensions": self.embedding_dimension,
+                    "similarity": "cosine"
+                }
+                # Let Atlas quantize the indexed vectors to cut index memory and scan bandwidth.
+                # Vectors stored pre-quantized are indexed as they are.
+                if self.vector_quantization != "none" and self.embedding_storage_dtype == "float32":
+                    vector_field["quantization"] = self.vector_quantization
                 index_definition = {
                     "name": "vector_index",
                     "definition": {
-                        "fields": [
-                            {
-                                "type": "vector",
-                                "path": "embedding",
-                                "numDimensions": self.embedding_dimension,
-                                "similarity": "cosine"
-                            }
-                        ]
+                        "fields": [vector_field]
                     }
                 }
                 logger.warning("Vector index should be created manually in MongoDB Atlas")
@@ -78,35 +170,46 @@ class VectorDB:
     
     def chunk_text(self, text: str) -> List[str]:
         """Split text into chunks with overlap"""
+        return self._chunk_text_with_token_counts(text)[0]
+    
+    def _chunk_text_with_token_counts(self, text: str) -> Tuple[List[str], List[int]]:
+        """Split text into chunks with overlap, also returning each chunk's token count"""
         if not text.strip():
-            return []
+            return [], []
         
         # Tokenize the text
         tokens = self.tokenizer.encode(text)
         
         if len(tokens) <= self.max_chunk_tokens:
-            return [text]
-        
-        chunks = []
-        start = 0
+            return [text], [len(tokens)]
         
-        while start < len(tokens):
-            # Calculate end position
-            end = min(start + self.max_chunk_tokens, len(tokens))
-            
-            # Extract chunk tokens
-            chunk_tokens = tokens[start:end]
-            
-            # Decode back to text
-            chunk_text = self.tokenizer.decode(chunk_tokens)
-            chunks.append(chunk_text.strip())
-            
-            # Move start position with overlap
-            if end >= len(tokens):
-                break
-            start = end - self.chunk_overlap_tokens
+        # Chunk starts step by max_chunk_tokens - overlap; the last one is the first chunk
+        # reaching the end of the text
+        step = self.max_chunk_tokens - self.chunk_overlap_tokens
+        token_slices = [
+            tokens[start:start + self.max_chunk_tokens]
+            for start in range(0, len(tokens) - self.chunk_overlap_tokens, step)
+        ]
+        chunks = [self.tokenizer.decode(chunk_tokens).strip() for chunk_tokens in token_slices]
+        token_counts = [len(chunk_tokens) for chunk_tokens in token_slices]
         
-        return chunks
+        return chunks, token_counts
+    
+    def to_bson_vector(self, embedding: List[float]) -> Binary:
+        """Pack an embedding as a BSON vector in the configured storage dtype"""
+        return self.to_bson_vectors([embedding])[0]
+    
+    def to_bson_vectors(self, embeddings: List[List[float]]) -> List[Binary]:
+        """Pack a batch of equal-length embeddings as BSON vectors in the configured storage dtype"""
+        if self.embedding_storage_dtype == "int8" and embeddings:
+            # Symmetric per-vector scaling to [-127, 127], quantizing the whole batch at once;
+            # cosine similarity ignores the scale
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            peaks = np.abs(vectors).max(axis=1, keepdims=True)
+            peaks[peaks == 0] = 1
+            quantized = np.rint(vectors * (127 / peaks)).astype(np.int8)
+            return [Binary.from_vector(vector, BinaryVectorDtype.INT8) for vector in quantized]
+        return [Binary.from_vector(embedding, BinaryVectorDtype.FLOAT32) for embedding in embeddings]
     
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text"""
@@ -117,65 +220,226 @@ class VectorDB:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
     
-    async def store_notion_page(
+    def generate_embeddings_batch(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """Generate embeddings for many texts in batched forward passes"""
+        if not texts:
+            return []
+        try:
+            embeddings = self.embedding_model.encode(
+                texts,
+                batch_size=batch_size or self.embedding_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            return embeddings.tolist()
+        except Exception as e:
+            logger.error(f"Error generating batch embeddings: {str(e)}")
+            raise
+    
+    async def generate_embedding_async(self, text: str) -> List[float]:
+        """Generate embedding for text, using the remote embedding server when configured"""
+        embeddings = await self.generate_embeddings_batch_async([text])
+        return embeddings[0]
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """Embed a search query, reusing the embedding of a recent query that differs only in whitespace"""
+        key = " ".join(query.split())
+        embedding = self._query_embeddings.get(key)
+        if embedding is not None:
+            self._query_embeddings.move_to_end(key)
+            return embedding
+        
+        embedding = await self.generate_embedding_async(key)
+        if self.query_embedding_cache_size > 0:
+            self._query_embeddings[key] = embedding
+            if len(self._query_embeddings) > self.query_embedding_cache_size:
+                self._query_embeddings.popitem(last=False)
+        return embedding
+    
+    async def probe_embedding(self) -> List[float]:
+        """Return the embedding used by health checks, generating it only once"""
+        if self._probe_embedding is None:
+            self._probe_embedding = await self.generate_embedding_async("test")
+        return self._probe_embedding
+    
+    async def generate_embeddings_batch_async(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None
+    ) -> List[List[float]]:
+        """Generate embeddings for many texts, using the remote embedding server when configured"""
+        if not texts:
+            return []
+        batch_size = batch_size or self.embedding_batch_size
+        
+        if self.embed_client:
+            try:
+                # Send batches concurrently and let the server batch them dynamically
+                batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+                results = await asyncio.gather(*[self.embed_client.embed(batch) for batch in batches])
+                return [embedding for batch in results for embedding in batch]
+            except Exception as e:
+                logger.warning(f"Remote embedding failed, falling back to local model: {str(e)}")
+        
+        return await self._encode_local_async(texts, batch_size)
+    
+    async def _encode_local_async(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        """Queue texts for the next coalesced local encode and wait for their embeddings"""
+        future = asyncio.get_running_loop().create_future()
+        
+        if self._pending_encodes is None:
+            # First request in this window schedules the flush
+            self._pending_encodes = []
+            task = asyncio.create_task(self._flush_local_encodes(batch_size))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        
+        self._pending_encodes.append((texts, future))
+        return await future
+    
+    async def _flush_local_encodes(self, batch_size: int):
+        """Encode the queued requests one batch_size job at a time, smallest requests first"""
+        # Yield once so requests made in the same tick join this flush
+        await asyncio.sleep(self.embedding_batch_window if self._encodes_running else 0)
+        pending, self._pending_encodes = self._pending_encodes, None
+        
+        # Queries go first and each job covers one batch, so a bulk page encode can't hold
+        # a query behind it on the single encoder thread
+        pending.sort(key=lambda item: len(item[0]))
+        all_texts = [text for texts, _ in pending for text in texts]
+        ends = list(accumulate(len(texts) for texts, _ in pending))
+        embeddings: List[List[float]] = []
+        resolved = 0
+        
+        self._encodes_running += 1
+        try:
+            for start in range(0, len(all_texts), batch_size):
+                embeddings.extend(await asyncio.get_running_loop().run_in_executor(
+                    self._encode_executor, self.generate_embeddings_batch,
+                    all_texts[start:start + batch_size], batch_size
+                ))
+                # Hand back every request whose texts are all encoded
+                while resolved < len(pending) and ends[resolved] <= len(embeddings):
+                    texts, future = pending[resolved]
+                    if not future.done():
+                        future.set_result(embeddings[ends[resolved] - len(texts):ends[resolved]])
+                    resolved += 1
+        except Exception as e:
+            for _, future in pending[resolved:]:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._encodes_running -= 1
+    
+    async def prepare_notion_page(
         self,
         page_id: str,
         page_data: Dict[str, Any],
-        database_id: str,
         force_update: bool = False
     ) -> Dict[str, Any]:
-        """Store a Notion page as vector embeddings"""
+        """Check whether a Notion page needs storing and chunk its text content"""
+        # Check if page already exists and is up to date
+        existing_doc = await self.collection.find_one(
+            {"notion_page_id": page_id},
+            {"last_edited_time": 1, "content_hash": 1, "embedding_model": 1}
+        )
+        
+        page_last_edited = page_data.get("last_edited_time")
+        if existing_doc and not force_update:
+            stored_last_edited = existing_doc.get("last_edited_time")
+            if stored_last_edited == page_last_edited:
+                logger.info(f"Page {page_id} is up to date, skipping")
+                return {"status": "skipped", "reason": "up_to_date"}
+        
+        # Extract text content - prefer markdown_content if available (from enhanced extraction)
+        text_content = self._extract_text_from_page(page_data)
+        
+        if not text_content.strip():
+            logger.warning(f"No text content found in page {page_id}")
+            return {"status": "skipped", "reason": "no_content"}
+        
+        # Skip re-embedding when the text is identical to what is already stored
+        content_hash = hashlib.sha256(text_content.encode()).hexdigest()
+        if (
+            existing_doc
+            and not force_update
+            and existing_doc.get("content_hash") == content_hash
+            and existing_doc.get("embedding_model") == self.embedding_model_name
+        ):
+            logger.info(f"Page {page_id} content is unchanged, skipping")
+            await self.collection.update_many(
+                {"notion_page_id": page_id},
+                {"$set": {"last_edited_time": page_last_edited}}
+            )
+            return {"status": "skipped", "reason": "unchanged_content"}
+        
+        # Chunk the text, keeping the token counts so storing doesn't re-tokenize
+        chunks, chunk_tokens = self._chunk_text_with_token_counts(text_content)
+        logger.info(f"Created {len(chunks)} chunks for page {page_id}")
+        
+        return {
+            "status": "pending",
+            "chunks": chunks,
+            "chunk_tokens": chunk_tokens,
+            "content_hash": content_hash
+        }
+    
+    async def store_notion_page_with_embeddings(
+        self,
+        page_id: str,
+        page_data: Dict[str, Any],
+        database_id: str,
+        chunks: List[str],
+        embeddings: List[List[float]],
+        content_hash: Optional[str] = None,
+        chunk_tokens: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """Store chunks of a Notion page using precomputed embeddings and optional token counts"""
+        if chunk_tokens is None:
+            chunk_tokens = [len(self.tokenizer.encode(chunk)) for chunk in chunks]
+        
         try:
-            # Check if page already exists and is up to date
-            existing_doc = await self.collection.find_one({"notion_page_id": page_id})
-            
-            page_last_edited = page_data.get("last_edited_time")
-            if existing_doc and not force_update:
-                stored_last_edited = existing_doc.get("last_edited_time")
-                if stored_last_edited == page_last_edited:
-                    logger.info(f"Page {page_id} is up to date, skipping")
-                    return {"status": "skipped", "reason": "up_to_date"}
-            
-            # Extract text content - prefer markdown_content if available (from enhanced extraction)
-            text_content = self._extract_text_from_page(page_data)
-            
-            if not text_content.strip():
-                logger.warning(f"No text content found in page {page_id}")
-                return {"status": "skipped", "reason": "no_content"}
-            
-            # Chunk the text
-            chunks = self.chunk_text(text_content)
-            logger.info(f"Created {len(chunks)} chunks for page {page_id}")
-            
-            # Delete existing chunks for this page
-            await self.collection.delete_many({"notion_page_id": page_id})
-            
-            # Store each chunk with its embedding
-            stored_chunks = []
-            for i, chunk in enumerate(chunks):
-                embedding = self.generate_embedding(chunk)
-                
-                chunk_doc = {
+            stored_at = datetime.now(timezone.utc)
+            vectors = self.to_bson_vectors(embeddings)
+            chunk_docs = [
+                {
                     "notion_page_id": page_id,
                     "notion_database_id": database_id,
                     "chunk_index": i,
                     "chunk_text": chunk,
-                    "embedding": embedding,
+                    "embedding": vector,
                     "page_properties": page_data.get("properties", {}),
                     "page_url": page_data.get("url"),
                     "created_time": page_data.get("created_time"),
                     "last_edited_time": page_data.get("last_edited_time"),
-                    "stored_at": datetime.utcnow().isoformat(),
+                    "content_hash": content_hash,
+                    "stored_at": stored_at,
                     "embedding_model": self.embedding_model_name,
-                    "chunk_tokens": len(self.tokenizer.encode(chunk))
+                    "chunk_tokens": token_count
                 }
-                
-                result = await self.collection.insert_one(chunk_doc)
-                stored_chunks.append({
-                    "chunk_id": str(result.inserted_id),
-                    "chunk_index": i,
+                for i, (chunk, vector, token_count) in enumerate(zip(chunks, vectors, chunk_tokens))
+            ]
+            
+            # Upsert each chunk under a stable ID and drop the page's leftover chunks,
+            # all in one round trip
+            chunk_ids = [f"{page_id}:{chunk_doc['chunk_index']}" for chunk_doc in chunk_docs]
+            operations = [
+                UpdateOne({"_id": chunk_id}, {"$set": chunk_doc}, upsert=True)
+                for chunk_id, chunk_doc in zip(chunk_ids, chunk_docs)
+            ]
+            operations.append(DeleteMany({"notion_page_id": page_id, "_id": {"$nin": chunk_ids}}))
+            await self.collection.bulk_write(operations, ordered=False)
+            self.content_version += 1
+            
+            stored_chunks = [
+                {
+                    "chunk_id": chunk_id,
+                    "chunk_index": chunk_doc["chunk_index"],
                     "chunk_tokens": chunk_doc["chunk_tokens"]
-                })
+                }
+                for chunk_id, chunk_doc in zip(chunk_ids, chunk_docs)
+            ]
             
             return {
                 "status": "success",
@@ -189,6 +453,50 @@ class VectorDB:
             logger.error(f"Error storing page {page_id}: {str(e)}")
             raise
     
+    async def store_notion_page(
+        self,
+        page_id: str,
+        page_data: Dict[str, Any],
+        database_id: str,
+        force_update: bool = False
+    ) -> Dict[str, Any]:
+        """Store a Notion page as vector embeddings"""
+        try:
+            prepared = await self.prepare_notion_page(page_id, page_data, force_update)
+            if prepared["status"] == "skipped":
+                return prepared
+            
+            chunks = prepared["chunks"]
+            embeddings = await self.generate_embeddings_batch_async(chunks)
+            
+            return await self.store_notion_page_with_embeddings(
+                page_id=page_id,
+                page_data=page_data,
+                database_id=database_id,
+                chunks=chunks,
+                embeddings=embeddings,
+                content_hash=prepared["content_hash"],
+                chunk_tokens=prepared.get("chunk_tokens")
+            )
+            
+        except Exception as e:
+            logger.error(f"Error storing page {page_id}: {str(e)}")
+            raise
+    
+    async def get_last_edited_times(self, page_ids: List[str]) -> Dict[str, Any]:
+        """Get the stored last_edited_time of each page in one query"""
+        if not page_ids:
+            return {}
+        
+        pipeline = [
+            {"$match": {"notion_page_id": {"$in": page_ids}}},
+            {"$group": {"_id": "$notion_page_id", "last_edited_time": {"$first": "$last_edited_time"}}}
+        ]
+        cursor = self.collection.aggregate(pipeline)
+        results = await cursor.to_list(length=None)
+        
+        return {result["_id"]: result["last_edited_time"] for result in results}
+    
     def _extract_text_from_page(self, page_data: Dict[str, Any]) -> str:
         """Extract text content from Notion page data with enhanced extraction support"""
         text_parts = []
@@ -201,46 +509,21 @@ class VectorDB:
         # Extract from properties
         properties = page_data.get("properties", {})
         for prop_name, prop_data in properties.items():
-            # Handle different property types properly
             if prop_data is None:
                 continue
-                
-            prop_type = prop_data.get("type") if isinstance(prop_data, dict) else None
+            if not isinstance(prop_data, dict):
+                text_parts.append(f"{prop_name}: {prop_data}")
+                continue
             
-            if prop_type == "title":
-                title_text = self._extract_rich_text(prop_data.get("title", []))
-                if title_text:
-                    text_parts.append(f"Title: {title_text}")
-            elif prop_type == "rich_text":
-                rich_text = self._extract_rich_text(prop_data.get("rich_text", []))
-                if rich_text:
-                    text_parts.append(f"{prop_name}: {rich_text}")
-            elif prop_type == "select":
-                select_data = prop_data.get("select")
-                if select_data:
-                    text_parts.append(f"{prop_name}: {select_data.get('name', '')}")
-            elif prop_type == "multi_select":
-                multi_select_data = prop_data.get("multi_select", [])
-                if multi_select_data:
-                    names = [item.get("name", "") for item in multi_select_data]
-                    text_parts.append(f"{prop_name}: {', '.join(names)}")
-            elif prop_type == "number":
-                number = prop_data.get("number")
-                if number is not None:
-                    text_parts.append(f"{prop_name}: {number}")
-            elif prop_type == "date":
-                date_data = prop_data.get("date")
-                if date_data:
-                    date_str = f"{date_data.get('start', '')} - {date_data.get('end', '')}".strip()
-                    text_parts.append(f"{prop_name}: {date_str}")
-            elif isinstance(prop_data, dict):
-                # Handle other property types
-                if "start" in prop_data:
-                    # Date object
-                    prop_value = f"{prop_data.get('start', '')} - {prop_data.get('end', '')}".strip()
-                    text_parts.append(f"{prop_name}: {prop_value}")
-                else:
-                    text_parts.append(f"{prop_name}: {prop_data}")
+            formatter = self._PROPERTY_FORMATTERS.get(prop_data.get("type"))
+            if formatter is not None:
+                text = formatter(self, prop_name, prop_data)
+                if text:
+                    text_parts.append(text)
+            elif "start" in prop_data:
+                # Date object
+                prop_value = f"{prop_data.get('start', '')} - {prop_data.get('end', '')}".strip()
+                text_parts.append(f"{prop_name}: {prop_value}")
             else:
                 text_parts.append(f"{prop_name}: {prop_data}")
         
@@ -260,6 +543,45 @@ class VectorDB:
         
         return "\n".join(text_parts)
     
+    def _format_title_property(self, prop_name: str, prop_data: Dict[str, Any]) -> Optional[str]:
+        title_text = self._extract_rich_text(prop_data.get("title", []))
+        return f"Title: {title_text}" if title_text else None
+    
+    def _format_rich_text_property(self, prop_name: str, prop_data: Dict[str, Any]) -> Optional[str]:
+        rich_text = self._extract_rich_text(prop_data.get("rich_text", []))
+        return f"{prop_name}: {rich_text}" if rich_text else None
+    
+    def _format_select_property(self, prop_name: str, prop_data: Dict[str, Any]) -> Optional[str]:
+        select_data = prop_data.get("select")
+        return f"{prop_name}: {select_data.get('name', '')}" if select_data else None
+    
+    def _format_multi_select_property(self, prop_name: str, prop_data: Dict[str, Any]) -> Optional[str]:
+        multi_select_data = prop_data.get("multi_select", [])
+        if not multi_select_data:
+            return None
+        return f"{prop_name}: {', '.join(item.get('name', '') for item in multi_select_data)}"
+    
+    def _format_number_property(self, prop_name: str, prop_data: Dict[str, Any]) -> Optional[str]:
+        number = prop_data.get("number")
+        return f"{prop_name}: {number}" if number is not None else None
+    
+    def _format_date_property(self, prop_name: str, prop_data: Dict[str, Any]) -> Optional[str]:
+        date_data = prop_data.get("date")
+        if not date_data:
+            return None
+        date_str = f"{date_data.get('start', '')} - {date_data.get('end', '')}".strip()
+        return f"{prop_name}: {date_str}"
+    
+    # Property type -> formatter(self, prop_name, prop_data) returning a line of page text or None
+    _PROPERTY_FORMATTERS: Dict[str, Callable[["VectorDB", str, Dict[str, Any]], Optional[str]]] = {
+        "title": _format_title_property,
+        "rich_text": _format_rich_text_property,
+        "select": _format_select_property,
+        "multi_select": _format_multi_select_property,
+        "number": _format_number_property,
+        "date": _format_date_property,
+    }
+    
     def _extract_text_from_blocks(self, blocks: List[Dict[str, Any]], depth: int = 0) -> str:
         """Recursively extract text from block structure"""
         text_parts = []
@@ -284,7 +606,7 @@ class VectorDB:
             if block.get("type") == "table_row":
                 cells = block.get("cells", [])
                 if cells:
-                    text_parts.append(" | ".join(str(cell) for cell in cells))
+                    text_parts.append(" | ".join(cells))
             
             # Handle child pages
             if block.get("type") == "child_page":
@@ -319,12 +641,14 @@ class VectorDB:
         self, 
         query: str, 
         limit: int = 30,
-        min_score: float = 0.7
+        min_score: float = 0.7,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """Perform vector similarity search"""
         try:
-            # Generate embedding for query
-            query_embedding = self.generate_embedding(query)
+            # Generate embedding for query unless the caller already has one
+            if query_embedding is None:
+                query_embedding = await self.embed_query(query)
             
             # Build aggregation pipeline
             pipeline = []
@@ -334,17 +658,18 @@ class VectorDB:
                 "$vectorSearch": {
                     "index": "vector_index",
                     "path": "embedding",
-                    "queryVector": query_embedding,
-                    "numCandidates": limit * 10,
+                    "queryVector": self.to_bson_vector(query_embedding),
+                    "numCandidates": min(max(limit * self.num_candidates_factor, limit), MAX_NUM_CANDIDATES),
                     "limit": limit
                 }
             }
 
             pipeline.append(vector_search_stage)
             
-            # Add score to results
+            # Shape results and add the score on the server
             pipeline.append({
-                "$addFields": {
+                "$project": {
+                    **SEARCH_RESULT_PROJECTION,
                     "similarity_score": {"$meta": "vectorSearchScore"}
                 }
             })
@@ -356,27 +681,9 @@ class VectorDB:
                 }
             })
             
-            # Execute search
+            # Execute search; documents arrive already in result shape
             cursor = self.collection.aggregate(pipeline)
-            results = await cursor.to_list(length=limit)
-            
-            # Format results
-            formatted_results = []
-            for result in results:
-                formatted_result = {
-                    "chunk_id": str(result["_id"]),
-                    "notion_page_id": result["notion_page_id"],
-                    "notion_database_id": result["notion_database_id"],
-                    "chunk_text": result["chunk_text"],
-                    "similarity_score": result["similarity_score"],
-                    "page_url": result.get("page_url"),
-                    "page_properties": result.get("page_properties", {}),
-                    "chunk_index": result.get("chunk_index", 0),
-                    "last_edited_time": result.get("last_edited_time")
-                }
-                formatted_results.append(formatted_result)
-            
-            return formatted_results
+            return await cursor.to_list(length=limit)
             
         except Exception as e:
             logger.error(f"Error in vector search: {str(e)}")
@@ -388,33 +695,43 @@ class VectorDB:
         query: str, 
         limit: int,
     ) -> List[Dict[str, Any]]:
-        """Fallback text search when vector search is not available"""
+        """Fallback keyword search over chunk text using the Atlas Search index"""
         try:
-            match_filter = {"$text": {"$search": query}}
-            
-            cursor = self.collection.find(
-                match_filter,
-                {"score": {"$meta": "textScore"}}
-            ).sort([("score", {"$meta": "textScore"})]).limit(limit)
-            
-            results = await cursor.to_list(length=limit)
-            
-            formatted_results = []
-            for result in results:
-                formatted_result = {
-                    "chunk_id": str(result["_id"]),
-                    "notion_page_id": result["notion_page_id"],
-                    "notion_database_id": result["notion_database_id"],
-                    "chunk_text": result["chunk_text"],
-                    "similarity_score": result.get("score", 0.5),  # Text search score
-                    "page_url": result.get("page_url"),
-                    "page_properties": result.get("page_properties", {}),
-                    "chunk_index": result.get("chunk_index", 0),
-                    "last_edited_time": result.get("last_edited_time")
+            pipeline = [
+                {
+                    "$search": {
+                        "index": self.text_search_index,
+                        "text": {"query": query, "path": "chunk_text"}
+                    }
+                },
+                {"$limit": limit},
+                {
+                    "$project": {
+                        **SEARCH_RESULT_PROJECTION,
+                        "similarity_score": {"$meta": "searchScore"}
+                    }
                 }
-                formatted_results.append(formatted_result)
+            ]
+            cursor = self.collection.aggregate(pipeline)
+            return await cursor.to_list(length=limit)
             
-            return formatted_results
+        except Exception as e:
+            # Deployments without the Atlas Search index can still use a classic text index
+            logger.warning(f"Atlas Search fallback failed, trying $text search: {str(e)}")
+            return await self._text_index_search(query, limit)
+    
+    async def _text_index_search(
+        self,
+        query: str,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """Keyword search over chunk text using a MongoDB text index"""
+        try:
+            cursor = self.collection.find(
+                {"$text": {"$search": query}},
+                {**SEARCH_RESULT_PROJECTION, "similarity_score": {"$meta": "textScore"}}
+            ).sort([("similarity_score", {"$meta": "textScore"})]).limit(limit)
+            return await cursor.to_list(length=limit)
             
         except Exception as e:
             logger.error(f"Error in fallback text search: {str(e)}")
@@ -423,18 +740,25 @@ class VectorDB:
     async def get_stats(self) -> Dict[str, Any]:
         """Get database statistics"""
         try:
-            total_chunks = await self.collection.count_documents({})
-            unique_pages = len(await self.collection.distinct("notion_page_id"))
-            unique_databases = len(await self.collection.distinct("notion_database_id"))
-            
-            # Get storage size (approximate)
-            stats = await self.db.command("collStats", self.collection_name)
+            # Count chunks, pages and databases server-side in one aggregation
+            pipeline = [{
+                "$facet": {
+                    "total_chunks": [{"$count": "n"}],
+                    "unique_pages": [{"$group": {"_id": "$notion_page_id"}}, {"$count": "n"}],
+                    "unique_databases": [{"$group": {"_id": "$notion_database_id"}}, {"$count": "n"}]
+                }
+            }]
+            facets, stats = await asyncio.gather(
+                self.collection.aggregate(pipeline).to_list(length=1),
+                # Get storage size (approximate)
+                self.db.command("collStats", self.collection_name)
+            )
+            # An empty collection produces empty facet results
+            counts = {name: result[0]["n"] if result else 0 for name, result in facets[0].items()}
             storage_size = stats.get("storageSize", 0)
             
             return {
-                "total_chunks": total_chunks,
-                "unique_pages": unique_pages,
-                "unique_databases": unique_databases,
+                **counts,
                 "storage_size_bytes": storage_size,
                 "embedding_model": self.embedding_model_name,
                 "embedding_dimension": self.embedding_dimension
@@ -447,6 +771,7 @@ class VectorDB:
         """Delete all chunks for a specific page"""
         try:
             result = await self.collection.delete_many({"notion_page_id": page_id})
+            self.content_version += 1
             return {
                 "status": "success",
                 "deleted_chunks": result.deleted_count
@@ -458,4 +783,13 @@ class VectorDB:
     async def close(self):
         """Close database connection"""
         if self.client:
-            self.client.close()
\ No newline at end of file
+            self.client.close()
+        if self.embed_client:
+            await self.embed_client.aclose()
+        self._encode_executor.shutdown(wait=False)
+
+
+@lru_cache(maxsize=None)
+def get_vector_db() -> VectorDB:
+    """Return the shared vector database instance, so services share one Mongo client and model"""
+    return VectorDB()